@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+""" Detection of duplicate received SMS messages """
+
+import threading, logging, hashlib, math, struct
+from collections import OrderedDict
+
+from .reassembly import concatenationInfo
+
+
+def smsKey(sms):
+    """ :return: A fixed-size digest identifying a received SMS message (or message part), based on
+    its sender, SMSC timestamp, concatenation reference/part number and text
+    :rtype: bytes
+    """
+    concat = concatenationInfo(sms)
+    fields = [sms.number or '',
+              sms.time.isoformat() if getattr(sms, 'time', None) != None else '',
+              '{0},{1},{2}'.format(concat.reference, concat.parts, concat.number) if concat != None else '',
+              sms.text or '']
+    # The text of 8-bit data messages is bytes already
+    return hashlib.sha1(b'\x00'.join([field if type(field) == bytes else field.encode('utf-8') for field in fields])).digest()
+
+
+class SmsDeduplicator(object):
+    """ Filters out received SMS messages that have already been seen
+
+    Messages can be delivered more than once, e.g. when the SMSC retransmits a message, or when
+    messages still stored on the modem are processed again after a reconnect. Messages are
+    identified by their sender, SMSC timestamp, concatenation reference/part number and text
+    (see smsKey()); every check takes constant time, and memory use is fixed.
+
+    By default, the keys of the "maxEntries" most recently seen messages are kept in an LRU
+    cache, so no false positives occur. In Bloom filter mode, a much longer window can be
+    covered in the same memory (roughly 2 bytes per message at a 0.1% error rate vs. ~100 bytes
+    per message): two generations of "maxEntries" messages each are remembered, at the cost
+    of a small probability ("errorRate") of a new message being mistaken for a duplicate.
+    """
+
+    log = logging.getLogger('gsmmodem.dedup.SmsDeduplicator')
+
+    def __init__(self, maxEntries=10000, bloom=False, errorRate=0.001):
+        """ Constructor
+
+        :param maxEntries: The number of messages to remember (in Bloom filter mode: per generation)
+        :type maxEntries: int
+        :param bloom: Use a Bloom filter instead of an LRU cache
+        :type bloom: bool
+        :param errorRate: The false positive probability of the Bloom filter
+        :type errorRate: float
+        """
+        if maxEntries < 1:
+            raise ValueError('maxEntries must be at least 1')
+        self.maxEntries = maxEntries
+        self.duplicates = 0 # Number of duplicate messages detected
+        self._lock = threading.Lock()
+        if bloom:
+            if not 0 < errorRate < 1:
+                raise ValueError('errorRate must be between 0 and 1')
+            self._filter = _BloomFilter(maxEntries, errorRate)
+        else:
+            self._filter = _LruFilter(maxEntries)
+
+    def isDuplicate(self, sms, remember=True):
+        """ Checks whether a message has been seen before, and (by default) remembers it
+
+        :param sms: The received message (or message part)
+        :type sms: gsmmodem.modem.ReceivedSms
+        :param remember: If False, the message is only checked; use remember() once it has been handled successfully
+        :type remember: bool
+
+        :return: True if the message is a duplicate of a message that has been seen before
+        :rtype: bool
+        """
+        key = smsKey(sms)
+        with self._lock:
+            if self._filter.add(key) if remember else key not in self._filter:
+                return False
+            self.duplicates += 1
+        self.log.debug('Discarding duplicate SMS message from %s', sms.number)
+        return True
+
+    def remember(self, sms):
+        """ Remembers a message as seen (see isDuplicate())
+
+        :param sms: The received message (or message part)
+        :type sms: gsmmodem.modem.ReceivedSms
+        """
+        key = smsKey(sms)
+        with self._lock:
+            self._filter.add(key)
+
+    def clear(self):
+        """ Forgets all messages seen so far """
+        with self._lock:
+            self._filter.clear()
+
+
+class _LruFilter(object):
+    """ Exact set membership for the most recently added keys """
+
+    __slots__ = ('maxEntries', '_keys')
+
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, key):
+        """ :return: True if the key was not present yet """
+        if key in self._keys:
+            # Mark as most recently seen
+            del self._keys[key]
+            self._keys[key] = None
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.maxEntries:
+            self._keys.popitem(last=False)
+        return True
+
+    def clear(self):
+        self._keys.clear()
+
+
+class _BloomFilter(object):
+    """ Approximate set membership for the most recently added keys, using two generations of Bloom filters
+
+    Once the current generation holds "maxEntries" keys, it becomes the previous generation (and
+    the old previous generation is dropped), so keys are remembered for between 1 and 2 generations.
+    """
+
+    __slots__ = ('maxEntries', 'numBits', 'numHashes', '_current', '_previous', '_count')
+
+    def __init__(self, maxEntries, errorRate):
+        self.maxEntries = maxEntries
+        self.numBits = max(int(math.ceil(-maxEntries * math.log(errorRate) / math.log(2) ** 2)), 8)
+        self.numHashes = max(int(round(self.numBits / float(maxEntries) * math.log(2))), 1)
+        self.clear()
+
+    def _positions(self, key):
+        # Double hashing: the i-th bit position is h1 + i * h2
+        h1, h2 = struct.unpack('<QQ', key[:16])
+        h2 |= 1
+        return [(h1 + i * h2) % self.numBits for i in range(self.numHashes)]
+
+    def __contains__(self, key):
+        return self._contains(self._positions(key))
+
+    def _contains(self, positions):
+        for bits in (self._current, self._previous):
+            if all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+                return True
+        return False
+
+    def add(self, key):
+        """ :return: True if the key was (probably) not present yet """
+        positions = self._positions(key)
+        if self._contains(positions):
+            return False
+        if self._count >= self.maxEntries:
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._count = 0
+        for pos in positions:
+            self._current[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+        return True
+
+    def clear(self):
+        self._current = bytearray((self.numBits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
@@ -132,3 +132,13 @@ class SmscNumberUnknownError(CmsError):
 
 class EncodingError(GsmModemException):
     """ Raised if a decoding- or encoding operation failed """
+
+
+class NoModemAvailableError(GsmModemException):
+    """ Raised by a ModemPool if no modem in the pool is able to perform an operation.
+    May contain the exception raised by the last modem that was tried """
+
+    def __init__(self, message, cause=None):
+        """ @param cause: the exception raised by the last modem that was tried (if any) """
+        super(NoModemAvailableError, self).__init__(message)
+        self.cause = cause
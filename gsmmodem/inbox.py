@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+""" Crash-safe local journal (write-ahead inbox) for received SMS messages """
+
+import time, threading, logging, sqlite3, calendar
+from datetime import datetime
+
+from .util import SimpleOffsetTzInfo
+
+
+class SmsInbox(object):
+    """ SQLite-backed journal of received SMS messages
+
+    If a GsmModem has an inbox, every received message is persisted (raw PDU, if available, plus
+    its decoded fields) before it is deleted from the modem/SIM card, and only then passed to the
+    "SMS received" callback. Messages received in a burst are written with a single transaction
+    (group commit). The callback therefore does not need to be durable itself: messages that were
+    not processed successfully (e.g. because the application crashed, or the callback raised an
+    exception) can be retrieved with unprocessed() and marked with markProcessed() later.
+
+    Entries can be looked up by sender and/or SMSC timestamp (both indexed).
+    """
+
+    log = logging.getLogger('gsmmodem.inbox.SmsInbox')
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS inbox (id INTEGER PRIMARY KEY AUTOINCREMENT, received REAL NOT NULL, '
+                  'number TEXT, sent REAL, tzOffset INTEGER, smsc TEXT, text TEXT, pdu TEXT, memory TEXT, '
+                  'processed INTEGER NOT NULL DEFAULT 0)',
+              'CREATE INDEX IF NOT EXISTS inboxNumberSent ON inbox (number, sent)',
+              'CREATE INDEX IF NOT EXISTS inboxSent ON inbox (sent)',
+              'CREATE INDEX IF NOT EXISTS inboxProcessed ON inbox (processed, id)')
+    COLUMNS = 'id, received, number, sent, tzOffset, smsc, text, pdu, memory, processed'
+
+    def __init__(self, path):
+        """ Constructor
+
+        :param path: The path of the SQLite database file (created if it does not exist)
+        :type path: str
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            # Write-ahead logging with full fsync: a committed message survives a crash or power loss
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=FULL')
+            with self._db:
+                for statement in self.SCHEMA:
+                    self._db.execute(statement)
+
+    def add(self, messages, memory=None):
+        """ Persists received SMS messages, using a single transaction
+
+        :param messages: The received messages; their "pdu" attribute is stored if set
+        :type messages: list of gsmmodem.modem.ReceivedSms
+        :param memory: The modem memory type the messages were read from (if any)
+        :type memory: str or None
+
+        :return: The IDs of the new inbox entries (in the same order as the messages)
+        :rtype: list of int
+        """
+        now = time.time()
+        ids = []
+        with self._lock:
+            with self._db:
+                for sms in messages:
+                    sent, tzOffset = _timestamp(sms.time)
+                    cursor = self._db.execute('INSERT INTO inbox (received, number, sent, tzOffset, smsc, text, pdu, memory) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                              (now, sms.number, sent, tzOffset, sms.smsc, sms.text, getattr(sms, 'pdu', None), memory))
+                    ids.append(cursor.lastrowid)
+        return ids
+
+    def markProcessed(self, ids):
+        """ Marks inbox entries as processed
+
+        :param ids: The IDs of the entries
+        :type ids: list of int
+        """
+        if not ids:
+            return
+        with self._lock:
+            with self._db:
+                self._db.executemany('UPDATE inbox SET processed = 1 WHERE id = ?', [(entryId,) for entryId in ids])
+
+    def get(self, entryId):
+        """ :return: The inbox entry with the specified ID, or None if it does not exist
+        :rtype: gsmmodem.inbox.InboxEntry
+        """
+        entries = self._query('SELECT {0} FROM inbox WHERE id = ?'.format(self.COLUMNS), (entryId,))
+        return entries[0] if entries else None
+
+    def unprocessed(self, limit=None):
+        """ :return: Entries that have not been marked as processed yet (oldest first)
+        :rtype: list of gsmmodem.inbox.InboxEntry
+        """
+        return self._query('SELECT {0} FROM inbox WHERE processed = 0 ORDER BY id LIMIT ?'.format(self.COLUMNS), (-1 if limit == None else limit,))
+
+    def find(self, number=None, start=None, end=None, limit=None):
+        """ Looks up inbox entries by sender and/or SMSC timestamp
+
+        :param number: Only return messages from this sender
+        :type number: str
+        :param start: Only return messages sent at or after this time
+        :type start: datetime.datetime
+        :param end: Only return messages sent before this time
+        :type end: datetime.datetime
+        :param limit: The maximum number of entries to return
+        :type limit: int
+
+        :return: The matching entries (ordered by SMSC timestamp)
+        :rtype: list of gsmmodem.inbox.InboxEntry
+        """
+        conditions = []
+        params = []
+        if number != None:
+            conditions.append('number = ?')
+            params.append(number)
+        if start != None:
+            conditions.append('sent >= ?')
+            params.append(_timestamp(start)[0])
+        if end != None:
+            conditions.append('sent < ?')
+            params.append(_timestamp(end)[0])
+        params.append(-1 if limit == None else limit)
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return self._query('SELECT {0} FROM inbox {1} ORDER BY sent, id LIMIT ?'.format(self.COLUMNS, where), params)
+
+    def purge(self, before=None):
+        """ Removes processed entries from the inbox
+
+        :param before: Only remove entries that were received (persisted) before this UNIX time
+        :type before: float
+
+        :return: The number of entries removed
+        :rtype: int
+        """
+        with self._lock:
+            with self._db:
+                if before == None:
+                    cursor = self._db.execute('DELETE FROM inbox WHERE processed = 1')
+                else:
+                    cursor = self._db.execute('DELETE FROM inbox WHERE processed = 1 AND received < ?', (before,))
+                return cursor.rowcount
+
+    def close(self):
+        """ Closes the underlying database """
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        """ :return: The number of entries in the inbox """
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM inbox').fetchone()[0]
+
+    def _query(self, sql, params):
+        with self._lock:
+            return [InboxEntry(*row) for row in self._db.execute(sql, params)]
+
+
+class InboxEntry(object):
+    """ A received SMS message persisted in an SmsInbox """
+
+    __slots__ = ('id', 'received', 'number', 'time', 'smsc', 'text', 'pdu', 'memory', 'processed')
+
+    def __init__(self, entryId, received, number, sent, tzOffset, smsc, text, pdu, memory, processed):
+        self.id = entryId
+        self.received = received # UNIX time the message was persisted
+        self.number = number
+        self.time = _datetime(sent, tzOffset) # SMSC timestamp
+        self.smsc = smsc
+        self.text = text
+        self.pdu = pdu # Raw PDU (hex string), or None for messages received in text mode
+        self.memory = memory
+        self.processed = bool(processed)
+
+    def __repr__(self):
+        return '<InboxEntry {0} from {1} at {2}>'.format(self.id, self.number, self.time)
+
+
+def _timestamp(dt):
+    """ :return: A (UNIX time, UTC offset in minutes) tuple for the specified datetime; naive datetimes are assumed to be in UTC """
+    if dt == None:
+        return None, None
+    offset = dt.utcoffset()
+    timestamp = calendar.timegm(dt.utctimetuple()) + dt.microsecond / 1000000.0
+    return timestamp, (int(offset.total_seconds()) // 60 if offset != None else None)
+
+def _datetime(timestamp, tzOffset):
+    """ Inverse of _timestamp() """
+    if timestamp == None:
+        return None
+    if tzOffset == None:
+        return datetime.utcfromtimestamp(timestamp)
+    return datetime.fromtimestamp(timestamp, SimpleOffsetTzInfo(tzOffset / 60.0))
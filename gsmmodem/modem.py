@@ -8,8 +8,11 @@ from time import sleep
 
 from .serial_comms import SerialComms
 from .exceptions import CommandError, InvalidStateException, CmeError, CmsError, InterruptedException, TimeoutException, PinRequiredError, IncorrectPinError, SmscNumberUnknownError
-from .pdu import encodeSmsSubmitPdu, decodeSmsPdu, encodeGsm7, encodeTextMode
+from .pdu import decodeSmsPdu, encodeTextMode, PduTemplate
 from .util import SimpleOffsetTzInfo, lineStartingWith, allLinesMatchingPattern, parseTextModeTimeStr
+from .tracking import SentSmsIndex
+from .reassembly import SmsReassembler, concatenationInfo
+from .dedup import SmsDeduplicator
 
 #from . import compat # For Python 2.6 compatibility
 from gsmmodem.util import lineMatching
@@ -54,12 +57,13 @@ class Sms(object):
 class ReceivedSms(Sms):
     """ An SMS message that has been received (MT) """
 
-    def __init__(self, gsmModem, status, number, time, text, smsc=None, udh=[]):
+    def __init__(self, gsmModem, status, number, time, text, smsc=None, udh=[], pdu=None):
         super(ReceivedSms, self).__init__(number, text, smsc)
         self._gsmModem = weakref.proxy(gsmModem)
         self.status = status
         self.time = time
         self.udh = udh
+        self.pdu = pdu # The raw PDU (hex string) the message was decoded from (None in text mode)
 
     def reply(self, message):
         """ Convenience method that sends a reply SMS to the sender of this message """
@@ -73,17 +77,99 @@ class ReceivedSms(Sms):
         """ Convenience method that returns the gsm modem instance """
         return self._gsmModem
 
+class ConcatenatedSms(ReceivedSms):
+    """ A received SMS message that was reassembled from the parts of a concatenated message
+
+    Exposes the individual parts (ReceivedSms objects, ordered by part number) via the "parts"
+    attribute; missing parts are None if the message is incomplete (see the "complete" attribute).
+    The message's text is the combined text of the parts that were received (bytes for 8-bit data messages).
+    """
+
+    def __init__(self, parts):
+        received = [part for part in parts if part != None]
+        first = received[0]
+        texts = [part.text for part in received if part.text]
+        # 8-bit data messages have bytes payloads
+        Sms.__init__(self, first.number, (b'' if texts and type(texts[0]) == bytes else '').join(texts), first.smsc)
+        self._gsmModem = first._gsmModem # already a weak reference
+        self.status = first.status
+        self.time = min(part.time for part in received) if all(part.time != None for part in received) else first.time
+        self.udh = []
+        self.pdu = None
+        self.parts = parts
+        self.complete = len(received) == len(parts)
+
+
 class SentSms(Sms):
     """ An SMS message that has been sent (MO) """
 
+    log = logging.getLogger('gsmmodem.modem.SentSms')
+
     ENROUTE = 0 # Status indicating message is still enroute to destination
     DELIVERED = 1 # Status indicating message has been received by destination handset
     FAILED = 2 # Status indicating message delivery has failed
 
-    def __init__(self, number, text, reference, smsc=None):
+    def __init__(self, number, text, reference, smsc=None, references=None):
         super(SentSms, self).__init__(number, text, smsc)
         self.report = None # Status report for this SMS (StatusReport object)
         self.reference = reference
+        self.references = references or [reference] # Message references of all parts of this SMS
+        self.partReports = {} # Status reports received for the parts of this SMS; key: message reference
+        self._reportEvent = threading.Event() # Set when the final status report for this SMS has been received
+        self._doneCallbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        """ True if the final status report for this SMS has been received """
+        return self._reportEvent.is_set()
+
+    def wait(self, timeout=None):
+        """ Blocks until the final status report for this SMS has been received
+
+        :param timeout: Maximum time to wait, in seconds (None: wait indefinitely)
+        :type timeout: int or float
+
+        :return: True if the status report was received, False if the wait timed out
+        :rtype: bool
+        """
+        return self._reportEvent.wait(timeout)
+
+    def addDoneCallback(self, callback):
+        """ Adds a function that is called (with this SentSms as argument) once the final status report for this SMS has been received
+
+        If the report has already been received, the function is called immediately.
+        """
+        with self._lock:
+            if not self._reportEvent.is_set():
+                self._doneCallbacks.append(callback)
+                return
+        callback(self)
+
+    def _addReport(self, report):
+        """ Adds the status report for one of this message's parts
+
+        The message's "report" attribute is only set once all parts have been reported on;
+        it is then the report of the first part that failed, or the last report received.
+        """
+        with self._lock:
+            self.partReports[report.reference] = report
+            if len(self.partReports) < len(set(self.references)):
+                return
+            for partReport in self.partReports.values():
+                if partReport.deliveryStatus != StatusReport.DELIVERED:
+                    self.report = partReport
+                    break
+            else:
+                self.report = report
+            callbacks = self._doneCallbacks
+            self._doneCallbacks = []
+            self._reportEvent.set()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                self.log.error('error in SentSms done callback', exc_info=True)
 
     @property
     def status(self):
@@ -134,6 +220,11 @@ class GsmModem(SerialComms):
     CNUM_REGEX = re.compile('^\+CNUM:\s*".*?","(\+{0,1}\d+)",(\d+).*$')
     # Used for parsing new SMS message indications
     CMTI_REGEX = re.compile('^\+CMTI:\s*"([^"]+)",\s*(\d+)$')
+    # Used for parsing SMS messages routed directly to the TE (text mode)
+    CMT_REGEX_TEXT = re.compile('^\+CMT:\s*"([^"]*)",(?:"[^"]*"|[^,]*),"([^"]+)"')
+    # Unsolicited notifications that are followed by a line containing the message itself (the SerialComms read loop must know about
+    # these); only used in PDU mode, as the text of a text mode message may span several lines
+    NOTIFICATION_WITH_DATA_REGEX = re.compile('^\+(CMT:|CDS:\s*\d+$)')
     # Used for parsing SMS message reads (text mode)
     CMGR_SM_DELIVER_REGEX_TEXT = None
     # Used for parsing SMS status report message reads (text mode)
@@ -144,26 +235,54 @@ class GsmModem(SerialComms):
     CUSD_REGEX = re.compile('\+CUSD:\s*(\d),\s*"(.*?)",\s*(\d+)', re.DOTALL)
     # Used for parsing SMS status reports
     CDSI_REGEX = re.compile('\+CDSI:\s*"([^"]+)",(\d+)$')
-    CDS_REGEX  = re.compile('\+CDS:\s*([0-9]+)"$')
-
-    def __init__(self, port, baudrate=115200, incomingCallCallbackFunc=None, smsReceivedCallbackFunc=None, smsStatusReportCallback=None, requestDelivery=True, AT_CNMI="", *a, **kw):
+    CDS_REGEX  = re.compile('^\+CDS:\s*(\d+)$')
+    CDS_REGEX_TEXT = re.compile('^\+CDS:\s*\d+,(\d+),"{0,1}([^"]*)"{0,1},\d*,"([^"]+)","([^"]+)",(\d+)$')
+    # Maximum number of deletions combined into a single (compound) AT+CMGD command line
+    MAX_COMPOUND_DELETES = 20
+    # AT+CMGD <delflag> values that delete exactly the messages with the given status (key: Sms status)
+    DELFLAG_STATUS = {Sms.STATUS_RECEIVED_READ: 1, Sms.STATUS_ALL: 4}
+    # Statuses of the messages deleted by each AT+CMGD <delflag> value
+    DELFLAG_STATUSES = {1: (Sms.STATUS_RECEIVED_READ,),
+                        2: (Sms.STATUS_RECEIVED_READ, Sms.STATUS_STORED_SENT),
+                        3: (Sms.STATUS_RECEIVED_READ, Sms.STATUS_STORED_SENT, Sms.STATUS_STORED_UNSENT),
+                        4: (Sms.STATUS_RECEIVED_UNREAD, Sms.STATUS_RECEIVED_READ, Sms.STATUS_STORED_SENT, Sms.STATUS_STORED_UNSENT)}
+    # Used for parsing the storage usage counters in AT+CPMS? responses: memory type, used, total
+    CPMS_USAGE_REGEX = re.compile('"([^"]+)",\s*(\d+),\s*(\d+)')
+    # Used for detecting "SMS storage full" notifications
+    SMMEMFULL_REGEX = re.compile('^\^SMMEMFULL:\s*"{0,1}([^"]*)"{0,1}$')
+    CIEV_REGEX = re.compile('^\+CIEV:\s*"{0,1}([^",]+)"{0,1},\s*(\d+)$')
+    # Used for detecting unsolicited "modem (re)started" notifications (the modem's settings are reset when these occur)
+    MODEM_RESTART_REGEX = re.compile('^(RDY|\^SYSSTART|\+CFUN:\s*1)$')
+
+    def __init__(self, port, baudrate=115200, incomingCallCallbackFunc=None, smsReceivedCallbackFunc=None, smsStatusReportCallback=None, requestDelivery=True, AT_CNMI="", directSmsDelivery=False, directStatusReports=False, reassembleSms=False, deduplicateSms=False, smsInbox=None, monitorSmsStorage=False, *a, **kw):
         super(GsmModem, self).__init__(port, baudrate, notifyCallbackFunc=self._handleModemNotification, *a, **kw)
         self.incomingCallCallback = incomingCallCallbackFunc or self._placeholderCallback
         self.smsReceivedCallback = smsReceivedCallbackFunc or self._placeholderCallback
         self.smsStatusReportCallback = smsStatusReportCallback or self._placeholderCallback
         self.requestDelivery = requestDelivery
         self.AT_CNMI = AT_CNMI or "2,1,0,2"
+        # Whether received SMS messages should be routed directly to us (+CMT) instead of being stored on the modem (+CMTI)
+        self.directSmsDelivery = directSmsDelivery
+        # Whether SMS status reports should be routed directly to us (+CDS) instead of being stored on the modem (+CDSI)
+        self.directStatusReports = directStatusReports
+        # Optional reassembly stage for concatenated SMS messages (if set, smsReceivedCallback receives whole messages instead of their parts)
+        self.smsReassembler = SmsReassembler(self._handleReassembledSms, releaseCallback=self._releaseSmsParts) if reassembleSms else None
+        # Optional filter for duplicate received SMS messages (may be replaced, e.g. by a Bloom filter based SmsDeduplicator)
+        self.smsDeduplicator = SmsDeduplicator() if deduplicateSms else None
+        # Optional journal (gsmmodem.inbox.SmsInbox) that received SMS messages are persisted to before they are deleted from the modem and dispatched
+        self.smsInbox = smsInbox
+        # Whether to monitor SMS storage usage, and drain stored messages (see drainSmsStorage()) before the storage fills up
+        self.monitorSmsStorage = monitorSmsStorage
         # Flag indicating whether caller ID for incoming call notification has been set up
         self._callingLineIdentification = False
         # Flag indicating whether incoming call notifications have extended information
         self._extendedIncomingCallIndication = False
         # Current active calls (ringing and/or answered), key is the unique call ID (not the remote number)
         self.activeCalls = {}
-        # Dict containing sent SMS messages (for auto-tracking their delivery status)
-        self.sentSms = weakref.WeakValueDictionary()
+        # Index of sent SMS messages (for auto-tracking their delivery status); may be replaced or shared between modems
+        self.sentSms = SentSmsIndex()
         self._ussdSessionEvent = None # threading.Event
         self._ussdResponse = None # gsmmodem.modem.Ussd
-        self._smsStatusReportEvent = None # threading.Event
         self._dialEvent = None # threading.Event
         self._dialResponse = None # gsmmodem.modem.Call
         self._waitForAtdResponse = True # Flag that controls if we should wait for an immediate response to ATD, or not
@@ -182,6 +301,23 @@ class GsmModem(SerialComms):
         self._smsEncoding = 'GSM' # Default SMS encoding
         self._smsSupportedEncodingNames = None # List of available encoding names
         self._commands = None # List of supported AT commands
+        self._settings = {} # Shadow of the modem's current settings (key: command, e.g. "+CMGF"; value: the last parameter string written)
+        self._smsAckRequired = False # Whether messages routed directly to the TE must be acknowledged with AT+CNMA (phase 2+ modems)
+        self._cmgdDelFlagSupported = True # Whether AT+CMGD accepts the <delflag> parameter (some modems, e.g. Siemens MC35/TC35, only take an index)
+        # Time (in seconds) to wait for more "new SMS" (+CMTI) indications before reading the indicated messages; indications
+        # arriving within this window are handled together (with a single AT+CMGL and compound AT+CMGD command). 0 (the default)
+        # disables this: every indication is then handled immediately, without starting a timer.
+        self.smsCoalesceWindow = 0
+        self._pendingSmsIndications = [] # (memory, index) tuples of +CMTI indications waiting to be handled
+        self._pendingSmsLock = threading.Lock()
+        self._smsCoalesceTimer = None # threading.Timer
+        self._smsReadLock = threading.RLock() # Serializes reading/deleting received messages (indications vs. storage drains)
+        # Time (in seconds) between SMS storage usage checks, and the fraction of storage in use at which stored messages are drained
+        self.smsStorageCheckInterval = 60
+        self.smsStorageDrainThreshold = 0.8
+        self.smsStorage = {} # Last known SMS storage usage (key: memory type, value: (used, total) tuple)
+        self._smsFullIndicator = None # Index of the "smsfull" indicator in +CIEV notifications (see AT+CIND=?)
+        self._smsStorageTimer = None # threading.Timer
         #Pool of detected DTMF
         self.dtmfpool = []
 
@@ -196,6 +332,7 @@ class GsmModem(SerialComms):
         """
         self.log.info('Connecting to modem on port %s at %dbps', self.port, self.baudrate)
         super(GsmModem, self).connect()
+        self._invalidateSettings() # ATZ resets the modem's settings
 
         if waitingForModemToStartInSeconds > 0:
             while waitingForModemToStartInSeconds > 0:
@@ -328,7 +465,7 @@ class GsmModem(SerialComms):
         self.write('AT+COPS=3,0', parseError=False) # Use long alphanumeric name format
 
         # SMS setup
-        self.write('AT+CMGF={0}'.format(1 if self.smsTextMode else 0)) # Switch to text or PDU mode for SMS messages
+        self._writeSetting('+CMGF', 1 if self.smsTextMode else 0) # Switch to text or PDU mode for SMS messages
         self._compileSmsRegexes()
         if self._smscNumber != None:
             self.write('AT+CSCA="{0}"'.format(self._smscNumber)) # Set default SMSC number
@@ -339,9 +476,9 @@ class GsmModem(SerialComms):
         if currentSmscNumber != None:
             self._smscNumber = None # clear cache
         if self.requestDelivery:
-            self.write('AT+CSMP=49,167,0,0', parseError=False) # Enable delivery reports
+            self._writeSetting('+CSMP', '49,167,0,0', parseError=False) # Enable delivery reports
         else:
-            self.write('AT+CSMP=17,167,0,0', parseError=False) # Not enable delivery reports
+            self._writeSetting('+CSMP', '17,167,0,0', parseError=False) # Not enable delivery reports
         # ...check SMSC again to ensure it did not change
         if currentSmscNumber != None and self.smsc != currentSmscNumber:
             self.smsc = currentSmscNumber
@@ -364,29 +501,28 @@ class GsmModem(SerialComms):
                     break
             else:
                 # Suppported memory types look fine, continue
-                preferredMemoryTypes = ('"ME"', '"SM"', '"SR"')
+                preferredMemoryTypes = ('ME', 'SM', 'SR')
                 cpmsItems = [''] * len(cpmsSupport)
                 for i in xrange(len(cpmsSupport)):
                     for memType in preferredMemoryTypes:
-                        if memType in cpmsSupport[i]:
-                            if i == 0:
-                                self._smsMemReadDelete = memType
+                        if '"{0}"'.format(memType) in cpmsSupport[i]:
                             cpmsItems[i] = memType
                             break
-                self.write('AT+CPMS={0}'.format(','.join(cpmsItems))) # Set message storage
+                self._writeSetting('+CPMS', ','.join('"{0}"'.format(memType) if memType else '' for memType in cpmsItems)) # Set message storage
+                self._smsMemReadDelete = cpmsItems[0] or None
+                if len(cpmsItems) > 1:
+                    self._smsMemWrite = cpmsItems[1] or None
             del cpmsSupport
             del cpmsLine
 
+        if self._smsReadSupported:
+            self._cmgdDelFlagSupported = self._checkCmgdDelFlagSupport()
+
         if self._smsReadSupported and (self.smsReceivedCallback or self.smsStatusReportCallback):
-            try:
-                self.write('AT+CNMI=' + self.AT_CNMI)  # Set message notifications
-            except CommandError:
-                try:
-                    self.write('AT+CNMI=2,1,0,1,0') # Set message notifications, using TE for delivery reports <ds>
-                except CommandError:
-                    # Message notifications not supported
-                    self._smsReadSupported = False
-                    self.log.warning('Incoming SMS notifications not supported by modem. SMS receiving unavailable.')
+            self._setupSmsNotifications()
+
+        if self._smsReadSupported and self.monitorSmsStorage:
+            self._startSmsStorageMonitor()
 
         # Incoming call notification setup
         try:
@@ -407,6 +543,19 @@ class GsmModem(SerialComms):
         # Call control setup
         self.write('AT+CVHU=0', parseError=False) # Enable call hang-up with ATH command (ignore if command not supported)
 
+    def close(self):
+        """ Stops the SMS storage monitor (if any) and any pending "new SMS" indication timer, then closes the connection to the modem
+
+        Messages of pending indications are left in storage (see processStoredSms()).
+        """
+        self._stopSmsStorageMonitor()
+        with self._pendingSmsLock:
+            if self._smsCoalesceTimer != None:
+                self._smsCoalesceTimer.cancel()
+                self._smsCoalesceTimer = None
+            self._pendingSmsIndications = []
+        super(GsmModem, self).close()
+
     def _unlockSim(self, pin):
         """ Unlocks the SIM card using the specified PIN (if necessary, else does nothing) """
         # Unlock the SIM card if needed
@@ -434,8 +583,8 @@ class GsmModem(SerialComms):
         This method adds the ``\\r\\n`` end-of-line sequence to the data parameter, and
         writes it to the modem.
 
-        :param data: Command/data to be written to the modem
-        :type data: str
+        :param data: Command/data to be written to the modem (bytes are written as they are, e.g. a PDU's hexData)
+        :type data: str or bytes
         :param waitForResponse: Whether this method should block and return the response from the modem or not
         :type waitForResponse: bool
         :param timeout: Maximum amount of time in seconds to wait for a response from the modem
@@ -455,7 +604,8 @@ class GsmModem(SerialComms):
         """
 
         self.log.debug('write: %s', data)
-        responseLines = super(GsmModem, self).write(data + writeTerm, waitForResponse=waitForResponse, timeout=timeout, expectedResponseTermSeq=expectedResponseTermSeq)
+        term = writeTerm.encode() if type(data) == bytes else writeTerm
+        responseLines = super(GsmModem, self).write(data + term, waitForResponse=waitForResponse, timeout=timeout, expectedResponseTermSeq=expectedResponseTermSeq)
         if self._writeWait > 0: # Sleep a bit if required (some older modems suffer under load)
             time.sleep(self._writeWait)
         if waitForResponse:
@@ -490,6 +640,114 @@ class GsmModem(SerialComms):
                     raise CommandError('{} ({})'.format(data,cmdStatusLine))
             return responseLines
 
+    def _writeSetting(self, command, value, **kwargs):
+        """ Changes a modem setting by writing AT<command>=<value>, unless the modem's setting is known to already be <value>
+
+        The modem's settings are shadowed in self._settings; this is kept in sync by our own writes (and reads),
+        and cleared when the modem is reset or restarts.
+
+        :param command: The (extended) AT command of the setting, without the AT prefix, e.g. "+CMGF"
+        :type command: str
+        :param value: The parameter(s) of the setting, as written after the "=" sign
+        :type value: str or int
+        :param kwargs: Additional keyword arguments for write()
+
+        :raise CommandError: if the command returns an error (only if parseError parameter is True)
+
+        :return: The modem's response, or None if nothing was written
+        :rtype: list or None
+        """
+        value = str(value)
+        if self._settings.get(command) == value:
+            return None
+        # Forget the old value first - we do not know the modem's state if the write fails
+        self._settings.pop(command, None)
+        response = self.write('AT{0}={1}'.format(command, value), **kwargs)
+        if response != None and 'ERROR' not in response[-1]:
+            self._settings[command] = value
+        return response
+
+    def _setupSmsNotifications(self):
+        """ Sets up new message indications (AT+CNMI), preferring direct delivery of received messages and/or status reports if enabled
+
+        Received messages are not routed directly to the TE in text mode: the text of a +CMT notification may span several
+        lines, so its end cannot be detected reliably. Messages are then stored (+CMTI) and read from storage instead.
+        """
+        directSms = self.directSmsDelivery and not self.smsTextMode
+        direct = self._cnmi(mt=2 if directSms else None, ds=1 if self.directStatusReports else None)
+        cnmiOptions = [direct]
+        if directSms and self.directStatusReports:
+            # Modem may support only one of the two
+            cnmiOptions.extend((self._cnmi(mt=2), self._cnmi(ds=1)))
+        cnmiOptions.extend((self.AT_CNMI, '2,1,0,1,0')) # the latter uses TE for delivery reports <ds>
+        for i, cnmi in enumerate(cnmiOptions):
+            if cnmi in cnmiOptions[:i]:
+                continue # already tried
+            try:
+                self._writeSetting('+CNMI', cnmi) # Set message notifications
+            except CommandError:
+                continue
+            else:
+                break
+        else:
+            # Message notifications not supported
+            self._smsReadSupported = False
+            self.log.warning('Incoming SMS notifications not supported by modem. SMS receiving unavailable.')
+            return
+        mt, ds = self._cnmiParam(1), self._cnmiParam(3)
+        if directSms and mt != '2':
+            self.log.warning('Direct SMS delivery (+CMT) not supported by modem; using storage (+CMTI) instead')
+        elif self.directSmsDelivery and self.smsTextMode:
+            self.log.info('Direct SMS delivery (+CMT) is only used in PDU mode; using storage (+CMTI) instead')
+        if self.directStatusReports and ds != '1':
+            self.log.warning('Direct SMS status report delivery (+CDS) not supported by modem; using storage (+CDSI) instead')
+        self._smsAckRequired = False
+        if mt in ('2', '3') or ds == '1':
+            # Phase 2+ modems (AT+CSMS service 1) require messages routed to the TE to be acknowledged
+            try:
+                csms = lineStartingWith('+CSMS:', self.write('AT+CSMS?'))
+            except CommandError:
+                csms = None
+            self._smsAckRequired = csms != None and csms[6:].strip().startswith('1')
+
+    def _checkCmgdDelFlagSupport(self):
+        """ :return: Whether the modem's AT+CMGD command accepts the <delflag> parameter, based on its AT+CMGD=? response (assumed if unknown) """
+        try:
+            cmgd = lineStartingWith('+CMGD:', self.write('AT+CMGD=?'))
+        except CommandError:
+            return True
+        if cmgd == None:
+            return True
+        # e.g. "+CMGD: (1-20),(0-4)" vs. "+CMGD: (1-20)"; value lists may contain commas themselves
+        return ',' in re.sub('\([^)]*\)', '', cmgd[6:])
+
+    def _cnmiParam(self, index):
+        """ :return: The specified parameter of the current AT+CNMI setting, or None if unknown """
+        params = (self._settings.get('+CNMI') or '').split(',')
+        return params[index].strip() if len(params) > index else None
+
+    def _cnmi(self, mt=None, ds=None, base=None):
+        """ Builds an AT+CNMI setting based on AT_CNMI (or the specified base setting)
+
+        :param mt: The <mt> parameter (new SMS message indication mode) to use instead of the base setting's
+        :param ds: The <ds> parameter (SMS status report indication mode) to use instead of the base setting's
+
+        :return: The AT+CNMI parameters string
+        :rtype: str
+        """
+        params = (base or self.AT_CNMI).split(',')
+        for index, value in ((1, mt), (3, ds)):
+            if value != None:
+                while len(params) <= index:
+                    params.append('0')
+                params[index] = str(value)
+        return ','.join(params)
+
+    def _invalidateSettings(self):
+        """ Forgets the shadowed modem settings (use when the modem's settings may have been reset) """
+        self._settings.clear()
+        self._smsMemReadDelete = self._smsMemWrite = None
+
     @property
     def signalStrength(self):
         """ Checks the modem's cellular network signal strength
@@ -595,9 +853,12 @@ class GsmModem(SerialComms):
         """ Set to True for the modem to use text mode for SMS, or False for it to use PDU mode """
         if textMode != self._smsTextMode:
             if self.alive:
-                self.write('AT+CMGF={0}'.format(1 if textMode else 0))
+                self._writeSetting('+CMGF', 1 if textMode else 0)
             self._smsTextMode = textMode
             self._compileSmsRegexes()
+            if self.alive and self.directSmsDelivery and '+CNMI' in self._settings:
+                # Direct SMS delivery (+CMT) is only used in PDU mode
+                self._setupSmsNotifications()
 
     @property
     def smsSupportedEncoding(self):
@@ -661,6 +922,7 @@ class GsmModem(SerialComms):
                     encoding = encoding[6:].split('"') # remove the +CSCS: prefix before splitting
                     if len(encoding) == 3:
                         self._smsEncoding = encoding[1]
+                        self._settings['+CSCS'] = '"{0}"'.format(self._smsEncoding)
                     else:
                         self.log.debug('Unhandled +CSCS response: {0}'.format(response))
             else:
@@ -679,13 +941,13 @@ class GsmModem(SerialComms):
             self._commands = self.supportedCommands
 
         if self._commands == None:
-            if encoding != self._encoding:
+            if encoding != self._smsEncoding:
                 raise CommandError('Unable to set SMS encoding (no supported commands)')
             else:
                 return
 
         if not '+CSCS' in self._commands:
-            if encoding != self._encoding:
+            if encoding != self._smsEncoding:
                 raise CommandError('Unable to set SMS encoding (+CSCS command not supported)')
             else:
                 return
@@ -696,14 +958,13 @@ class GsmModem(SerialComms):
 
         # Check if desired encoding is available
         if encoding in self._smsSupportedEncodingNames:
-            # Set encoding
-            response = self.write('AT+CSCS="{0}"'.format(encoding))
-            if len(response) == 1:
-                if response[0].lower() == 'ok':
-                    self._smsEncoding = encoding
-                    return
-
-        if encoding != self._encoding:
+            # Set encoding (only written if the modem is not already using it)
+            response = self._writeSetting('+CSCS', '"{0}"'.format(encoding))
+            if response == None or (len(response) == 1 and response[0].lower() == 'ok'):
+                self._smsEncoding = encoding
+                return
+
+        if encoding != self._smsEncoding:
             raise ValueError('Unable to set SMS encoding (enocoding {0} not supported)'.format(encoding))
         else:
             return
@@ -712,15 +973,28 @@ class GsmModem(SerialComms):
         """ Set the current SMS memory to use for read/delete/write operations """
         # Switch to the correct memory type if required
         if write != None and write != self._smsMemWrite:
-            self.write()
-            readDel = readDelete or self._smsMemReadDelete
+            readDel = readDelete or self._smsMemReadDelete or write
+            self._settings.pop('+CPMS', None)
             self.write('AT+CPMS="{0}","{1}"'.format(readDel, write))
             self._smsMemReadDelete = readDel
             self._smsMemWrite = write
         elif readDelete != None and readDelete != self._smsMemReadDelete:
+            self._settings.pop('+CPMS', None)
             self.write('AT+CPMS="{0}"'.format(readDelete))
             self._smsMemReadDelete = readDelete
 
+    def _readSmsMemory(self):
+        """ Reads the current SMS read/delete and write memories (<mem1> and <mem2>) from the modem (AT+CPMS?)
+
+        :raise CommandError: if the memories cannot be determined
+        """
+        cpms = lineStartingWith('+CPMS:', self.write('AT+CPMS?'))
+        memories = [memory for memory, used, total in self.CPMS_USAGE_REGEX.findall(cpms or '')]
+        if not memories:
+            raise CommandError('Unable to determine the current SMS storage memory')
+        self._smsMemReadDelete = memories[0]
+        self._smsMemWrite = memories[1] if len(memories) > 1 else memories[0]
+
     def _compileSmsRegexes(self):
         """ Compiles regular expression used for parsing SMS messages based on current mode """
         if self.smsTextMode:
@@ -789,14 +1063,15 @@ class GsmModem(SerialComms):
                 response = self.write('AT+CNUM')
             else:
                 # temporarily switch to "own numbers" phonebook, read position 1 and than switch back
-                response = self.write('AT+CPBS?')
-                selected_phonebook = response[0][6:].split('"')[1] # first line, remove the +CSCS: prefix, split, first parameter
-
-                if selected_phonebook is not "ON":
-                    self.write('AT+CPBS="ON"')
+                selected_phonebook = self._settings.get('+CPBS')
+                if selected_phonebook == None:
+                    response = self.write('AT+CPBS?')
+                    selected_phonebook = '"{0}"'.format(response[0][6:].split('"')[1]) # first line, remove the +CPBS: prefix, split, first parameter
+                    self._settings['+CPBS'] = selected_phonebook
 
+                self._writeSetting('+CPBS', '"ON"')
                 response = self.write("AT+CPBR=1")
-                self.write('AT+CPBS="{0}"'.format(selected_phonebook))
+                self._writeSetting('+CPBS', selected_phonebook)
 
             if response is "OK": # command is supported, but no number is set
                 return None
@@ -817,9 +1092,7 @@ class GsmModem(SerialComms):
 
     @ownNumber.setter
     def ownNumber(self, phone_number):
-        actual_phonebook = self.write('AT+CPBS?')
-        if actual_phonebook is not "ON":
-            self.write('AT+CPBS="ON"')
+        self._writeSetting('+CPBS', '"ON"')
         self.write('AT+CPBW=1,"' + phone_number + '"')
 
 
@@ -882,12 +1155,17 @@ class GsmModem(SerialComms):
         :param text: the message text
         :type text: str
         :param waitForDeliveryReport: if True, this method blocks until a delivery report is received for the sent message
+                                      (to wait for many messages at once, use the returned SentSms objects' wait() method,
+                                      or gsmmodem.tracking.asCompleted(), instead)
         :type waitForDeliveryReport: boolean
         :param deliveryTimeout: the maximum time in seconds to wait for a delivery report (if "waitForDeliveryReport" is True)
         :type deliveryTimeout: int or float
 
         :raise CommandError: if an error occurs while attempting to send the message
         :raise TimeoutException: if the operation times out
+
+        CommandError and TimeoutException exceptions raised while sending have an "smsSubmitted" attribute, which is
+        False only if the message has definitely not been submitted (not even in part).
         """
 
         # Check input text to select appropriate mode (text or PDU)
@@ -897,56 +1175,155 @@ class GsmModem(SerialComms):
             except ValueError:
                 self.smsTextMode = False
 
-        if self.smsTextMode:
-            # Send SMS via AT commands
-            self.write('AT+CMGS="{0}"'.format(destination), timeout=5, expectedResponseTermSeq='> ')
-            result = lineStartingWith('+CMGS:', self.write(text, timeout=35, writeTerm=CTRLZ))
-        else:
-            # Check encoding
-            try:
-                encodedText = encodeGsm7(text)
-            except ValueError:
-                encodedText = None
-
-            # Set GSM modem SMS encoding format
-            # Encode message text and set data coding scheme based on text contents
-            if encodedText == None:
-                # Cannot encode text using GSM-7; use UCS2 instead
-                self.smsEncoding = 'UCS2'
+        references = []
+        bodyWritten = False # Whether the modem may have submitted (part of) the message
+        try:
+            if self.smsTextMode:
+                # Send SMS via AT commands
+                self.write('AT+CMGS="{0}"'.format(destination), timeout=5, expectedResponseTermSeq='> ')
+                bodyWritten = True
+                result = lineStartingWith('+CMGS:', self.write(text, timeout=35, writeTerm=CTRLZ))
+                if result == None:
+                    raise CommandError('Modem did not respond with +CMGS response')
+                references.append(int(result[7:]))
             else:
-                self.smsEncoding = 'GSM'
-
-            # Encode text into PDUs
-            pdus = encodeSmsSubmitPdu(destination, text, reference=self._smsRef, sendFlash=sendFlash)
-
-            # Send SMS PDUs via AT commands
-            for pdu in pdus:
-                self.write('AT+CMGS={0}'.format(pdu.tpduLength), timeout=5, expectedResponseTermSeq='> ')
-                result = lineStartingWith('+CMGS:', self.write(str(pdu), timeout=35, writeTerm=CTRLZ)) # example: +CMGS: xx
-
-        if result == None:
-            raise CommandError('Modem did not respond with +CMGS response')
+                # Encode text into PDUs; the data coding scheme is based on the text contents
+                template = PduTemplate(text, sendFlash=sendFlash)
+
+                # Set GSM modem SMS encoding format
+                self.smsEncoding = 'GSM' if template.alphabet == 0x00 else 'UCS2'
+
+                # Send SMS PDUs via AT commands
+                for pdu in template.encode(destination, reference=self._smsRef):
+                    self.write('AT+CMGS={0}'.format(pdu.tpduLength), timeout=5, expectedResponseTermSeq='> ')
+                    bodyWritten = True
+                    result = lineStartingWith('+CMGS:', self.write(pdu.hexData, timeout=35, writeTerm=CTRLZ)) # example: +CMGS: xx
+                    if result == None:
+                        raise CommandError('Modem did not respond with +CMGS response')
+                    references.append(int(result[7:]))
+        except (CommandError, TimeoutException) as e:
+            # Nothing was submitted if the modem failed before accepting the first part, or rejected it with a CMS error;
+            # callers that retry elsewhere (e.g. gsmmodem.pool.ModemPool) must not resend the message otherwise
+            e.smsSubmitted = len(references) > 0 or (bodyWritten and not isinstance(e, CmsError))
+            raise
 
-        # Keep SMS reference number in order to pair delivery reports with sent message
-        reference = int(result[7:])
-        self._smsRef = reference + 1
+        # Keep SMS reference numbers in order to pair delivery reports with sent message
+        self._smsRef = references[-1] + 1
         if self._smsRef > 255:
             self._smsRef = 0
 
         # Create sent SMS object for future delivery checks
-        sms = SentSms(destination, text, reference)
-
-        # Add a weak-referenced entry for this SMS (allows us to update the SMS state if a status report is received)
-        self.sentSms[reference] = sms
-        if waitForDeliveryReport:
-            self._smsStatusReportEvent = threading.Event()
-            if self._smsStatusReportEvent.wait(deliveryTimeout):
-                self._smsStatusReportEvent = None
-            else: # Response timed out
-                self._smsStatusReportEvent = None
-                raise TimeoutException()
+        sms = SentSms(destination, text, references[0], references=references)
+
+        # Index this SMS (allows us to update the SMS state if a status report is received)
+        self.sentSms.add(sms, self.port)
+        if waitForDeliveryReport and not sms.wait(deliveryTimeout):
+            # Response timed out
+            raise TimeoutException()
         return sms
 
+    def sendSmsToMany(self, destinations, text, memory=None, sendFlash=False):
+        """ Send the same SMS text message to many recipients
+
+        The message is written to the modem's message storage once (AT+CMGW), and then
+        submitted to each recipient from storage (AT+CMSS), so that the message content
+        crosses the serial line only once. The stored message is deleted afterwards; the SMS
+        read/delete memory is switched to the write memory for this, and restored afterwards.
+
+        :param destinations: the recipients' phone numbers
+        :type destinations: list of str
+        :param text: the message text
+        :type text: str
+        :param memory: The memory type to store the message in. If None, use the current default SMS write memory
+        :type memory: str or None
+        :param sendFlash: If True, the message is sent as a "flash" (class 0) message (PDU mode only)
+        :type sendFlash: bool
+
+        :raise CommandError: if an error occurs while attempting to store or send the message
+        :raise TimeoutException: if the operation times out
+
+        CommandError and TimeoutException exceptions raised by this method have a "sentMessages" attribute,
+        containing the messages that were sent before the error occurred (one per destination), and a
+        "failedDestination" attribute: the destination the message was being sent to (None if the error
+        occurred while storing the message).
+
+        :return: The sent messages, one per destination
+        :rtype: list of gsmmodem.modem.SentSms
+        """
+        destinations = list(destinations)
+        if not destinations:
+            return []
+
+        # Check input text to select appropriate mode (text or PDU)
+        if self.smsTextMode:
+            try:
+                encodeTextMode(text)
+            except ValueError:
+                self.smsTextMode = False
+
+        # Stored messages are submitted from <mem2>, but deleted from <mem1> - use the same memory for both
+        if memory == None and self._smsMemWrite == None:
+            # The current write memory is unknown (e.g. after a modem restart) - ask the modem
+            self._readSmsMemory()
+        memory = memory or self._smsMemWrite
+        previousReadDelete = self._smsMemReadDelete
+        self._setSmsMemory(readDelete=memory, write=memory)
+
+        indexes = []
+        sentMessages = []
+        destination = None
+        try:
+            # Store the message (one stored message per PDU)
+            if self.smsTextMode:
+                with self._txLock:
+                    self.write('AT+CMGW', timeout=5, expectedResponseTermSeq='> ')
+                    result = lineStartingWith('+CMGW:', self.write(text, timeout=35, writeTerm=CTRLZ))
+                if result == None:
+                    raise CommandError('Modem did not respond with +CMGW response')
+                indexes.append(int(result[7:]))
+            else:
+                template = PduTemplate(text, sendFlash=sendFlash)
+                self.smsEncoding = 'GSM' if template.alphabet == 0x00 else 'UCS2'
+                for pdu in template.encode(destinations[0], reference=self._smsRef):
+                    with self._txLock:
+                        self.write('AT+CMGW={0}'.format(pdu.tpduLength), timeout=5, expectedResponseTermSeq='> ')
+                        result = lineStartingWith('+CMGW:', self.write(pdu.hexData, timeout=35, writeTerm=CTRLZ)) # example: +CMGW: xx
+                    if result == None:
+                        raise CommandError('Modem did not respond with +CMGW response')
+                    indexes.append(int(result[7:]))
+
+            # Submit the stored message to each destination
+            for destination in destinations:
+                references = []
+                for index in indexes:
+                    result = lineStartingWith('+CMSS:', self.write('AT+CMSS={0},"{1}"'.format(index, destination), timeout=35)) # example: +CMSS: xx
+                    if result == None:
+                        raise CommandError('Modem did not respond with +CMSS response')
+                    references.append(int(result[7:]))
+                sms = SentSms(destination, text, references[0], references=references)
+                self.sentSms.add(sms, self.port)
+                sentMessages.append(sms)
+                self._smsRef = (references[-1] + 1) % 256
+            return sentMessages
+        except (CommandError, TimeoutException) as e:
+            # The message has already been sent to some destinations; retrying those would send duplicates
+            e.sentMessages = sentMessages
+            e.failedDestination = destination
+            raise
+        finally:
+            # Remove the stored message
+            for index in indexes:
+                try:
+                    self.deleteStoredSms(index)
+                except (CommandError, TimeoutException):
+                    self.log.warning('Failed to delete stored SMS message at index %d', index)
+            # Restore the previous read/delete memory
+            if previousReadDelete != None and previousReadDelete != memory:
+                try:
+                    self._setSmsMemory(readDelete=previousReadDelete)
+                except (CommandError, TimeoutException):
+                    self.log.warning('Failed to restore SMS read memory %s', previousReadDelete)
+
     def sendUssd(self, ussdString, responseTimeout=15):
         """ Starts a USSD session by dialing the the specified USSD string, or \
         sends the specified string in the existing USSD session (if any)
@@ -1065,6 +1442,10 @@ class GsmModem(SerialComms):
         This is useful if SMS messages were received during a period that
         python-gsmmodem was not running but the modem was powered on.
 
+        All messages are read with a single AT+CMGL command, and delivered in order
+        (read messages first, then unread messages). Messages for which the
+        "SMS received" callback raised an exception are not removed.
+
         :param unreadOnly: If True, only process unread SMS messages
         :type unreadOnly: boolean
         """
@@ -1072,10 +1453,10 @@ class GsmModem(SerialComms):
             states = [Sms.STATUS_RECEIVED_UNREAD]
             if not unreadOnly:
                 states.insert(0, Sms.STATUS_RECEIVED_READ)
-            for msgStatus in states:
-                messages = self.listStoredSms(status=msgStatus, delete=True)
-                for sms in messages:
-                    self.smsReceivedCallback(sms)
+            stored = self._listStoredSms(status=Sms.STATUS_RECEIVED_UNREAD if unreadOnly else Sms.STATUS_ALL)
+            received = [(msgIndex, sms) for msgIndex, sms in stored if sms.status in states]
+            received.sort(key=lambda item: states.index(item[1].status)) # stable; stored order is kept for each status
+            self._deliverStoredSms(received)
         else:
             raise ValueError('GsmModem.smsReceivedCallback not set')
 
@@ -1094,29 +1475,105 @@ class GsmModem(SerialComms):
         :return: A list of Sms objects containing the messages read
         :rtype: list
         """
+        stored = self._listStoredSms(status, memory)
+        if delete and stored:
+            if status in self.DELFLAG_STATUS and self._cmgdDelFlagSupported:
+                # Delete all messages with this status using a single command
+                self.deleteMultipleStoredSms(self.DELFLAG_STATUS[status])
+            else:
+                self._deleteStoredSmsBatch(sorted(set(msgIndex for msgIndex, sms in stored)))
+        return [sms for msgIndex, sms in stored]
+
+    def iterStoredSms(self, status=Sms.STATUS_ALL, memory=None, delete=False, timeout=10):
+        """ Iterates over the SMS messages currently stored on the device/SIM card.
+
+        Unlike listStoredSms(), messages are yielded as soon as they have been read from the
+        modem's AT+CMGL response, without buffering the whole response (useful if many
+        messages are stored). No other commands can be sent to the modem while iterating: other
+        threads block until iteration is complete, and commands sent from within the loop itself
+        (e.g. sms.reply() or deleteStoredSms()) raise an InvalidStateException.
+
+        If "delete" is True, messages are deleted in batches once the listing is complete (or
+        the generator is closed). A message is only deleted if iteration continued past it,
+        i.e. the message that was being processed when iteration stopped early is kept.
+
+        :param status: Filter messages based on this read status; must be 0-4 (see Sms class)
+        :type status: int
+        :param memory: The memory type to read from. If None, use the current default SMS read memory
+        :type memory: str or None
+        :param delete: If True, delete returned messages from the device/SIM card
+        :type delete: bool
+        :param timeout: Maximum amount of time in seconds to wait for each line of the modem's response
+        :type timeout: int or float
+
+        :raise CommandError: if the modem returns an error
+        :raise TimeoutException: if the modem stops responding
+
+        :return: generator yielding Sms objects
+        """
         self._setSmsMemory(readDelete=memory)
-        messages = []
-        delMessages = set()
+        response = self._iterResponse(self._cmglCommand(status), timeout)
+        processed = []
+        try:
+            for msgIndex, sms in self._parseCmglResponse(response):
+                yield sms
+                processed.append(msgIndex)
+        finally:
+            response.close() # releases the modem for the deletions below
+            if delete and processed:
+                self._deleteStoredSmsBatch(processed)
+
+    def _listStoredSms(self, status=Sms.STATUS_ALL, memory=None):
+        """ Reads SMS messages currently stored on the device/SIM card (see listStoredSms())
+
+        :return: A list of (index, Sms object) tuples, in the order they were listed by the modem
+        :rtype: list
+        """
+        self._setSmsMemory(readDelete=memory)
+        return list(self._parseCmglResponse(self.write(self._cmglCommand(status))))
+
+    def _cmglCommand(self, status):
+        """ :return: The AT+CMGL command that lists stored messages with the specified status (in the current SMS mode) """
         if self.smsTextMode:
-            cmglRegex= re.compile('^\+CMGL: (\d+),"([^"]+)","([^"]+)",[^,]*,"([^"]+)"$')
             for key, val in dictItemsIter(Sms.TEXT_MODE_STATUS_MAP):
                 if status == val:
-                    statusStr = key
-                    break
-            else:
-                raise ValueError('Invalid status value: {0}'.format(status))
-            result = self.write('AT+CMGL="{0}"'.format(statusStr))
+                    return 'AT+CMGL="{0}"'.format(key)
+            raise ValueError('Invalid status value: {0}'.format(status))
+        else:
+            return 'AT+CMGL={0}'.format(status)
+
+    def _iterResponse(self, command, timeout):
+        """ Writes a command, and yields the lines of the modem's response as they are read (excluding the final "OK")
+
+        :raise CommandError: if the command returns an error
+        """
+        for line in self.writeIter(command + TERMINATOR, timeout):
+            if line == 'OK':
+                return
+            elif self.RESPONSE_TERM.match(line):
+                cmErrorMatch = self.CM_ERROR_REGEX.match(line)
+                if cmErrorMatch:
+                    errorCode = int(cmErrorMatch.group(2))
+                    raise CmeError(command, errorCode) if cmErrorMatch.group(1) == 'CME' else CmsError(command, errorCode)
+                raise CommandError(command)
+            yield line
+
+    def _parseCmglResponse(self, lines):
+        """ Parses the lines of an AT+CMGL response (in the current SMS mode)
+
+        :return: generator yielding an (index, Sms object) tuple as soon as each message has been read
+        """
+        if self.smsTextMode:
+            cmglRegex= re.compile('^\+CMGL: (\d+),"([^"]+)","([^"]+)",[^,]*,"([^"]+)"$')
             msgLines = []
             msgIndex = msgStatus = number = msgTime = None
-            for line in result:
+            for line in lines:
                 cmglMatch = cmglRegex.match(line)
                 if cmglMatch:
                     # New message; save old one if applicable
                     if msgIndex != None and len(msgLines) > 0:
                         msgText = '\n'.join(msgLines)
-                        msgLines = []
-                        messages.append(ReceivedSms(self, Sms.TEXT_MODE_STATUS_MAP[msgStatus], number, parseTextModeTimeStr(msgTime), msgText))
-                        delMessages.add(int(msgIndex))
+                        yield int(msgIndex), ReceivedSms(self, Sms.TEXT_MODE_STATUS_MAP[msgStatus], number, parseTextModeTimeStr(msgTime), msgText)
                     msgIndex, msgStatus, number, msgTime = cmglMatch.groups()
                     msgLines = []
                 else:
@@ -1124,14 +1581,11 @@ class GsmModem(SerialComms):
                         msgLines.append(line)
             if msgIndex != None and len(msgLines) > 0:
                 msgText = '\n'.join(msgLines)
-                msgLines = []
-                messages.append(ReceivedSms(self, Sms.TEXT_MODE_STATUS_MAP[msgStatus], number, parseTextModeTimeStr(msgTime), msgText))
-                delMessages.add(int(msgIndex))
+                yield int(msgIndex), ReceivedSms(self, Sms.TEXT_MODE_STATUS_MAP[msgStatus], number, parseTextModeTimeStr(msgTime), msgText)
         else:
             cmglRegex = re.compile('^\+CMGL:\s*(\d+),\s*(\d+),.*$')
             readPdu = False
-            result = self.write('AT+CMGL={0}'.format(status))
-            for line in result:
+            for line in lines:
                 if not readPdu:
                     cmglMatch = cmglRegex.match(line)
                     if cmglMatch:
@@ -1149,22 +1603,201 @@ class GsmModem(SerialComms):
                         # todo: make better fix
                     else:
                         if smsDict['type'] == 'SMS-DELIVER':
-                            sms = ReceivedSms(self, int(msgStat), smsDict['number'], smsDict['time'], smsDict['text'], smsDict['smsc'], smsDict.get('udh', []))
+                            sms = ReceivedSms(self, int(msgStat), smsDict['number'], smsDict['time'], smsDict['text'], smsDict['smsc'], smsDict.get('udh', []), line)
                         elif smsDict['type'] == 'SMS-STATUS-REPORT':
                             sms = StatusReport(self, int(msgStat), smsDict['reference'], smsDict['number'], smsDict['time'], smsDict['discharge'], smsDict['status'])
                         else:
                             raise CommandError('Invalid PDU type for readStoredSms(): {0}'.format(smsDict['type']))
-                        messages.append(sms)
-                        delMessages.add(msgIndex)
                         readPdu = False
-        if delete:
-            if status == Sms.STATUS_ALL:
-                # Delete all messages
-                self.deleteMultipleStoredSms()
+                        yield msgIndex, sms
+
+    def _deliverStoredSms(self, messages, memory=None):
+        """ Passes stored SMS messages to the "SMS received" callback (in order), then deletes them from storage
+
+        Messages for which the callback raised an exception are not deleted - unless an inbox journal
+        is used: received messages are then persisted to the journal, deleted, and only then dispatched.
+        Parts of concatenated messages that are buffered by the reassembly stage are only deleted once
+        their message has been delivered (or has expired).
+
+        :param messages: The messages to deliver, as (index, Sms object) tuples
+        :type messages: list
+        :param memory: The memory type the messages are stored in. If None, use the current default SMS read/delete memory
+        :type memory: str or None
+        """
+        if self.smsInbox != None:
+            journaled = [(msgIndex, sms) for msgIndex, sms in messages if isinstance(sms, ReceivedSms)]
+            entryIds = self._journalSms([sms for msgIndex, sms in journaled], memory)
+            if entryIds != None:
+                # Safely persisted; free the modem's storage before dispatching
+                try:
+                    self._deleteStoredSmsBatch([msgIndex for msgIndex, sms in journaled], memory)
+                except (CommandError, TimeoutException):
+                    self.log.error('Failed to delete journaled SMS messages from the modem', exc_info=True)
+                self._dispatchJournaledSms(zip(entryIds, [sms for msgIndex, sms in journaled]))
+                messages = [(msgIndex, sms) for msgIndex, sms in messages if not isinstance(sms, ReceivedSms)]
+        released = []
+        for msgIndex, sms in messages:
+            handle = (memory or self._smsMemReadDelete, msgIndex)
+            if self.smsReassembler != None and self.smsReassembler.holds(handle):
+                # Part of a concatenated message that is still being reassembled (read again, e.g. by processStoredSms())
+                continue
+            try:
+                released.extend(self._dispatchReceivedSms(sms, handle))
+            except Exception:
+                self.log.error('error in smsReceivedCallback', exc_info=True)
+        self._deleteReleasedSms(released)
+
+    def _deleteReleasedSms(self, handles):
+        """ Deletes handled SMS messages (or message parts) from storage, or marks them as processed in the inbox journal
+
+        :param handles: The (memory, index) tuples of stored messages, or the IDs of inbox journal entries
+        :type handles: list
+
+        :raise CommandError: if unable to delete the stored messages
+        """
+        byMemory = {}
+        memories = []
+        entryIds = []
+        for handle in handles:
+            if isinstance(handle, tuple):
+                msgMemory, msgIndex = handle
+                if msgMemory not in byMemory:
+                    byMemory[msgMemory] = []
+                    memories.append(msgMemory)
+                byMemory[msgMemory].append(msgIndex)
             else:
-                for msgIndex in delMessages:
+                entryIds.append(handle)
+        if entryIds:
+            try:
+                self.smsInbox.markProcessed(entryIds)
+            except Exception:
+                self.log.error('Failed to update inbox journal', exc_info=True)
+        for msgMemory in memories:
+            self._deleteStoredSmsBatch(byMemory[msgMemory], msgMemory)
+
+    def _deleteStoredSmsBatch(self, indexes, memory=None):
+        """ Deletes the SMS messages stored at the specified indexes, using as few commands as possible
+
+        Deletions are sent as compound commands (e.g. AT+CMGD=1,0;+CMGD=2,0); if the modem does
+        not accept those, each message is deleted separately. As the compound command may have
+        deleted some of the messages before failing, "invalid index" errors are ignored then.
+
+        :param indexes: The indexes of the SMS messages in the specified memory
+        :type indexes: list of int
+        :param memory: The memory type to delete from. If None, use the current default SMS read/delete memory
+        :type memory: str or None
+
+        :raise CommandError: if unable to delete the stored messages
+        """
+        if not indexes:
+            return
+        self._setSmsMemory(readDelete=memory)
+        indexes = list(indexes)
+        for start in xrange(0, len(indexes), self.MAX_COMPOUND_DELETES):
+            batch = indexes[start:start + self.MAX_COMPOUND_DELETES]
+            if len(batch) > 1:
+                try:
+                    self.write('AT' + ';'.join(self._cmgdCommand(msgIndex) for msgIndex in batch))
+                except CommandError:
+                    self.log.debug('Compound AT+CMGD command failed; deleting messages separately')
+                else:
+                    continue
+            for msgIndex in batch:
+                try:
                     self.deleteStoredSms(msgIndex)
-        return messages
+                except (CmsError, CmeError) as e:
+                    if len(batch) > 1 and (e.type, e.code) in (('CMS', 321), ('CME', 21)): # Invalid (memory) index
+                        self.log.debug('Stored SMS message at index %d already deleted', msgIndex)
+                    else:
+                        raise
+
+    def readSmsStorageUsage(self):
+        """ Reads the usage of the modem's SMS storage memories (AT+CPMS?)
+
+        The result is also available as the "smsStorage" attribute (for metrics).
+
+        :return: The number of used and total message slots per memory type (e.g. {'SM': (5, 20)})
+        :rtype: dict
+        """
+        usage = {}
+        cpms = lineStartingWith('+CPMS:', self.write('AT+CPMS?'))
+        if cpms != None:
+            for memory, used, total in self.CPMS_USAGE_REGEX.findall(cpms):
+                usage[memory] = (int(used), int(total))
+        self.smsStorage = usage
+        return usage
+
+    def checkSmsStorage(self):
+        """ Reads the SMS storage usage, and drains stored messages if a memory is almost full (see "smsStorageDrainThreshold")
+
+        :return: True if stored messages were drained
+        :rtype: bool
+        """
+        for memory, (used, total) in dictItemsIter(self.readSmsStorageUsage()):
+            if total > 0 and used >= total * self.smsStorageDrainThreshold:
+                self.log.info('SMS storage %s is %d/%d full; draining stored messages', memory, used, total)
+                self.drainSmsStorage()
+                return True
+        return False
+
+    def drainSmsStorage(self):
+        """ Delivers all received SMS messages stored on the modem to the "SMS received" callback and deletes them (see processStoredSms())
+
+        Does nothing if no "SMS received" callback has been set (stored messages are not deleted unseen).
+        """
+        if self.smsReceivedCallback == self._placeholderCallback:
+            return
+        with self._smsReadLock:
+            with self._pendingSmsLock:
+                # Messages indicated in the current memory are about to be read by processStoredSms()
+                memory = self._smsMemReadDelete
+                self._pendingSmsIndications = [(msgMemory, msgIndex) for msgMemory, msgIndex in self._pendingSmsIndications if memory != None and msgMemory != memory]
+            self.processStoredSms()
+
+    def _startSmsStorageMonitor(self):
+        """ Looks up the "smsfull" indicator, checks the SMS storage usage and schedules the next check """
+        try:
+            cind = lineStartingWith('+CIND:', self.write('AT+CIND=?'))
+        except CommandError:
+            cind = None
+        if cind != None:
+            names = [name.lower() for name in re.findall('\("([^"]+)"', cind)]
+            if 'smsfull' in names:
+                self._smsFullIndicator = names.index('smsfull') + 1
+        self._checkSmsStorageScheduled()
+
+    def _stopSmsStorageMonitor(self):
+        timer = self._smsStorageTimer
+        self._smsStorageTimer = None
+        if timer != None:
+            timer.cancel()
+
+    def _checkSmsStorageScheduled(self):
+        """ Periodic SMS storage check (runs in a timer thread) """
+        try:
+            self.checkSmsStorage()
+        except Exception:
+            self.log.error('SMS storage check failed', exc_info=True)
+        if self.alive and self.monitorSmsStorage and self.smsStorageCheckInterval:
+            self._smsStorageTimer = threading.Timer(self.smsStorageCheckInterval, self._checkSmsStorageScheduled)
+            self._smsStorageTimer.daemon = True
+            self._smsStorageTimer.start()
+
+    def _handleSmsStorageFull(self, line):
+        """ Handler for "SMS storage full" notifications (^SMMEMFULL, or the "smsfull" +CIEV indicator) """
+        self.log.warning('SMS storage full (%s); draining stored messages', line)
+        try:
+            self.drainSmsStorage()
+        except (CommandError, TimeoutException):
+            self.log.error('Failed to drain SMS storage', exc_info=True)
+
+    def _isSmsFullIndication(self, line):
+        """ :return: True if the line is a +CIEV notification indicating that the SMS storage is full """
+        cievMatch = self.CIEV_REGEX.match(line)
+        if not cievMatch or cievMatch.group(2) == '0':
+            return False
+        indicator = cievMatch.group(1)
+        return indicator.lower() == 'smsfull' or (self._smsFullIndicator != None and indicator == str(self._smsFullIndicator))
 
     def _handleModemNotification(self, lines):
         """ Handler for unsolicited notifications from the modem
@@ -1181,15 +1814,20 @@ class GsmModem(SerialComms):
 
         :param lines The lines that were read
         """
-        next_line_is_te_statusreport = False
         for line in lines:
             if 'RING' in line:
                 # Incoming call (or existing call is ringing)
                 self._handleIncomingCall(lines)
                 return
+            elif line.startswith('+CMT:'):
+                # SMS message routed directly to TE (the message itself follows on the next line)
+                self._handleSmsReceivedDirect(lines[lines.index(line):])
+                return
             elif line.startswith('+CMTI'):
-                # New SMS message indication
-                self._handleSmsReceived(line)
+                # New SMS message indication(s)
+                for cmtiLine in lines:
+                    if cmtiLine.startswith('+CMTI'):
+                        self._handleSmsReceived(cmtiLine)
                 return
             elif line.startswith('+CUSD'):
                 # USSD notification - either a response or a MT-USSD ("push USSD") message
@@ -1199,21 +1837,22 @@ class GsmModem(SerialComms):
                 # SMS status report
                 self._handleSmsStatusReport(line)
                 return
-            elif line.startswith('+CDS'):
-                # SMS status report at next line
-                next_line_is_te_statusreport = True
-                cdsMatch = self.CDS_REGEX.match(line)
-                if cdsMatch:
-                    next_line_is_te_statusreport_length = int(cdsMatch.group(1))
-                else:
-                    next_line_is_te_statusreport_length = -1
-            elif next_line_is_te_statusreport:
-                self._handleSmsStatusReportTe(next_line_is_te_statusreport_length, line)
+            elif line.startswith('+CDS:'):
+                # SMS status report routed directly to TE (in PDU mode, the report itself follows on the next line)
+                self._handleSmsStatusReportTe(lines[lines.index(line):])
                 return
             elif line.startswith('+DTMF'):
                 # New incoming DTMF
                 self._handleIncomingDTMF(line)
                 return
+            elif self.SMMEMFULL_REGEX.match(line) or self._isSmsFullIndication(line):
+                # SMS storage is full
+                self._handleSmsStorageFull(line)
+                return
+            elif self.MODEM_RESTART_REGEX.match(line):
+                # Modem (re)started - its settings have been reset
+                self._handleModemRestart(line)
+                return
             else:
                 # Check for call status updates
                 for updateRegex, handlerFunc in self._callStatusUpdates:
@@ -1225,6 +1864,18 @@ class GsmModem(SerialComms):
         # If this is reached, the notification wasn't handled
         self.log.debug('Unhandled unsolicited modem notification: %s', lines)
 
+    def _handleModemRestart(self, line):
+        """ Handler for "modem started" notifications: forgets the (now reset) modem settings and restores all of them
+
+        Every setting written through _writeSetting() (e.g. the SMS mode, encoding, delivery report flag
+        and notification settings) is written again; the SMS mode first, as other settings depend on it.
+        """
+        self.log.info('Modem restart detected (%s); restoring modem settings', line)
+        settings = self._settings.copy()
+        self._invalidateSettings()
+        for command in sorted(settings, key=lambda command: (command != '+CMGF', command)):
+            self._writeSetting(command, settings[command], parseError=False)
+
     #Simcom modem able detect incoming DTMF
     def _handleIncomingDTMF(self,line):
         self.log.debug('Handling incoming DTMF')
@@ -1343,20 +1994,218 @@ class GsmModem(SerialComms):
         return self._handleCallEnded(regexMatch, callId, True)
 
     def _handleSmsReceived(self, notificationLine):
-        """ Handler for "new SMS" unsolicited notification line """
+        """ Handler for "new SMS" unsolicited notification line
+
+        Indications arriving within "smsCoalesceWindow" seconds of each other are handled together
+        """
         self.log.debug('SMS message received')
         if self.smsReceivedCallback is not None:
             cmtiMatch = self.CMTI_REGEX.match(notificationLine)
             if cmtiMatch:
-                msgMemory = cmtiMatch.group(1)
-                msgIndex = cmtiMatch.group(2)
-                sms = self.readStoredSms(msgIndex, msgMemory)
-                try:
-                    self.smsReceivedCallback(sms)
-                except Exception:
-                    self.log.error('error in smsReceivedCallback', exc_info=True)
+                msgMemory, msgIndex = cmtiMatch.group(1), int(cmtiMatch.group(2))
+                with self._pendingSmsLock:
+                    self._pendingSmsIndications.append((msgMemory, msgIndex))
+                    coalesce = self.smsCoalesceWindow > 0
+                    if coalesce and self._smsCoalesceTimer == None:
+                        self._smsCoalesceTimer = threading.Timer(self.smsCoalesceWindow, self._handlePendingSmsIndications)
+                        self._smsCoalesceTimer.daemon = True
+                        self._smsCoalesceTimer.start()
+                if self.monitorSmsStorage and msgMemory in self.smsStorage:
+                    # A high message index hints that the storage is filling up
+                    if msgIndex + 1 >= self.smsStorage[msgMemory][1] * self.smsStorageDrainThreshold:
+                        try:
+                            self.checkSmsStorage()
+                        except (CommandError, TimeoutException):
+                            self.log.error('SMS storage check failed', exc_info=True)
+                if not coalesce:
+                    self._handlePendingSmsIndications()
+
+    def _handlePendingSmsIndications(self):
+        """ Reads, delivers and deletes the messages of all pending "new SMS" indications """
+        with self._smsReadLock:
+            self.__handlePendingSmsIndications()
+
+    def __handlePendingSmsIndications(self):
+        with self._pendingSmsLock:
+            indications = self._pendingSmsIndications
+            self._pendingSmsIndications = []
+            self._smsCoalesceTimer = None
+        # Group by memory, keeping the order the indications arrived in
+        byMemory = {}
+        memories = []
+        for msgMemory, msgIndex in indications:
+            if msgMemory not in byMemory:
+                byMemory[msgMemory] = []
+                memories.append(msgMemory)
+            if msgIndex not in byMemory[msgMemory]:
+                byMemory[msgMemory].append(msgIndex)
+        for msgMemory in memories:
+            indexes = byMemory[msgMemory]
+            try:
+                if len(indexes) == 1:
+                    messages = [(indexes[0], self.readStoredSms(indexes[0], msgMemory))]
                 else:
-                    self.deleteStoredSms(msgIndex)
+                    self._setSmsMemory(readDelete=msgMemory)
+                    listed = dict(self._listStoredSms(status=Sms.STATUS_RECEIVED_UNREAD))
+                    messages = []
+                    for msgIndex in indexes:
+                        if msgIndex in listed:
+                            messages.append((msgIndex, listed[msgIndex]))
+                        else:
+                            # Not listed as unread (e.g. already read by someone else) - read it directly
+                            messages.append((msgIndex, self.readStoredSms(msgIndex, msgMemory)))
+                self._deliverStoredSms(messages, msgMemory)
+            except (CommandError, TimeoutException):
+                self.log.error('Failed to read received SMS messages %s from memory %s', indexes, msgMemory, exc_info=True)
+
+    def _isNotificationWithData(self, line):
+        # Text mode +CMT notifications are not followed by exactly one line (see _setupSmsNotifications())
+        return not self.smsTextMode and super(GsmModem, self)._isNotificationWithData(line)
+
+    def _handleSmsReceivedDirect(self, lines):
+        """ Handler for SMS messages routed directly to the TE: a "+CMT" notification line, followed by the message """
+        self.log.debug('SMS message received (direct delivery)')
+        try:
+            if len(lines) < 2:
+                raise EncodingError('Message data missing')
+            if self.smsTextMode:
+                cmtMatch = self.CMT_REGEX_TEXT.match(lines[0])
+                if not cmtMatch:
+                    raise EncodingError('Failed to parse text-mode +CMT notification: {0}'.format(lines[0]))
+                number, msgTime = cmtMatch.groups()
+                sms = ReceivedSms(self, Sms.STATUS_RECEIVED_UNREAD, number, parseTextModeTimeStr(msgTime), '\n'.join(lines[1:]))
+            else:
+                smsDict = decodeSmsPdu(lines[1])
+                if smsDict['type'] != 'SMS-DELIVER':
+                    raise EncodingError('Invalid PDU type for +CMT notification: {0}'.format(smsDict['type']))
+                sms = ReceivedSms(self, Sms.STATUS_RECEIVED_UNREAD, smsDict['number'], smsDict['time'], smsDict['text'], smsDict['smsc'], smsDict.get('udh', []), lines[1])
+        except Exception:
+            self.log.error('Failed to decode directly delivered SMS message: %s', lines, exc_info=True)
+            self._acknowledgeSms(False)
+            return
+        entryIds = None
+        if self.smsInbox != None:
+            entryIds = self._journalSms([sms])
+            if entryIds == None:
+                # Not persisted - have the network deliver the message again later
+                self._acknowledgeSms(False)
+                return
+        # Acknowledge first: the network waits for the acknowledgement, and not the callback
+        self._acknowledgeSms(True)
+        if entryIds != None:
+            self._dispatchJournaledSms(zip(entryIds, [sms]))
+            return
+        try:
+            self._dispatchReceivedSms(sms)
+        except Exception:
+            self.log.error('error in smsReceivedCallback', exc_info=True)
+
+    def _journalSms(self, messages, memory=None):
+        """ Persists received SMS messages to the inbox journal
+
+        :return: The IDs of the new inbox entries, or None if the messages could not be persisted
+        """
+        try:
+            return self.smsInbox.add(messages, memory)
+        except Exception:
+            self.log.error('Failed to persist received SMS messages to inbox journal', exc_info=True)
+            return None
+
+    def _dispatchJournaledSms(self, entries):
+        """ Dispatches persisted SMS messages, marking those handled successfully as processed in the inbox journal
+
+        :param entries: (inbox entry ID, Sms object) tuples
+        """
+        processed = []
+        for entryId, sms in entries:
+            try:
+                processed.extend(self._dispatchReceivedSms(sms, entryId))
+            except Exception:
+                self.log.error('error in smsReceivedCallback', exc_info=True)
+        self._deleteReleasedSms(processed)
+
+    def _dispatchReceivedSms(self, sms, handle=None):
+        """ Passes a received SMS message to the "SMS received" callback, or to the reassembly stage if it is part of a concatenated message
+
+        Messages that the deduplication filter (if any) has seen before are discarded. Messages are only
+        remembered by the filter once they have been handled, so that a message whose callback raised an
+        exception is not discarded when it is processed again.
+
+        :param sms: The received message
+        :type sms: gsmmodem.modem.ReceivedSms
+        :param handle: Where the message is stored: a (memory, index) tuple, an inbox journal entry ID, or None
+
+        :return: The handles of the messages (or message parts) that have been handled, and can be deleted from storage
+        :rtype: list
+        """
+        if self.smsDeduplicator != None and self.smsDeduplicator.isDuplicate(sms, remember=False):
+            return [handle] if handle != None else []
+        if self.smsReassembler != None and concatenationInfo(sms) != None:
+            released = self.smsReassembler.add(sms, handle)
+        else:
+            self.smsReceivedCallback(sms)
+            released = [(sms, handle)]
+        return self._smsHandled(released)
+
+    def _smsHandled(self, released):
+        """ Remembers handled messages (or message parts) in the deduplication filter (if any)
+
+        :param released: (Sms object, handle) tuples
+
+        :return: The handles of the messages that are stored
+        :rtype: list
+        """
+        if self.smsDeduplicator != None:
+            for sms, handle in released:
+                self.smsDeduplicator.remember(sms)
+        return [handle for sms, handle in released if handle != None]
+
+    def _releaseSmsParts(self, released):
+        """ Callback for message parts released by the reassembly stage outside of _dispatchReceivedSms() (e.g. expired messages) """
+        with self._smsReadLock:
+            try:
+                self._deleteReleasedSms(self._smsHandled(released))
+            except (CommandError, TimeoutException):
+                self.log.error('Failed to delete handled SMS message parts from storage', exc_info=True)
+
+    def _handleReassembledSms(self, sms):
+        """ Callback for messages completed (or expired) by the reassembly stage """
+        self.smsReceivedCallback(sms)
+
+    def _acknowledgeSms(self, success):
+        """ Acknowledges (AT+CNMA) an SMS message or status report routed directly to the TE, if required by the modem
+
+        If the acknowledgement fails, the modem will have disabled direct routing of messages; message
+        indications are then switched to storage (+CMTI/+CDSI) mode.
+        """
+        if not self._smsAckRequired:
+            return
+        if not success and self.smsTextMode:
+            # Negative acknowledgements are not supported in text mode - the modem will notice the missing acknowledgement
+            return
+        try:
+            self.write('AT+CNMA' if success else 'AT+CNMA=2')
+        except CmsError as e:
+            if e.code == 340: # No +CNMA acknowledgement expected
+                self._smsAckRequired = False
+            else:
+                self._fallbackToSmsStorage(e)
+        except (CommandError, TimeoutException) as e:
+            self._fallbackToSmsStorage(e)
+
+    def _fallbackToSmsStorage(self, cause):
+        """ Switches new message and status report indications from direct delivery to storage (+CMTI/+CDSI) mode """
+        self.log.warning('SMS acknowledgement failed (%s); falling back to SMS storage mode', cause)
+        self._smsAckRequired = False
+        self.directSmsDelivery = self.directStatusReports = False
+        cnmi = self._settings.pop('+CNMI', None) or self.AT_CNMI
+        params = cnmi.split(',')
+        mt = params[1].strip() if len(params) > 1 else None
+        ds = params[3].strip() if len(params) > 3 else None
+        try:
+            self._writeSetting('+CNMI', self._cnmi(mt=1 if mt in ('2', '3') else None, ds=2 if ds == '1' else None, base=cnmi))
+        except (CommandError, TimeoutException):
+            self.log.error('Failed to restore SMS message indications', exc_info=True)
 
     def _handleSmsStatusReport(self, notificationLine):
         """ Handler for SMS status reports """
@@ -1367,43 +2216,44 @@ class GsmModem(SerialComms):
             msgIndex = cdsiMatch.group(2)
             report = self.readStoredSms(msgIndex, msgMemory)
             self.deleteStoredSms(msgIndex)
-            # Update sent SMS status if possible
-            if report.reference in self.sentSms:
-                self.sentSms[report.reference].report = report
-            if self._smsStatusReportEvent:
-                # A sendSms() call is waiting for this response - notify waiting thread
-                self._smsStatusReportEvent.set()
-            elif self.smsStatusReportCallback:
-                # Nothing is waiting for this report directly - use callback
-                try:
-                    self.smsStatusReportCallback(report)
-                except Exception:
-                    self.log.error('error in smsStatusReportCallback', exc_info=True)
+            self._handleStatusReport(report)
 
-
-                self.smsStatusReportCallback(report)
-
-    def _handleSmsStatusReportTe(self, length, notificationLine):
-        """ Handler for TE SMS status reports """
+    def _handleSmsStatusReportTe(self, lines):
+        """ Handler for SMS status reports routed directly to the TE: a "+CDS" notification line (followed by the report in PDU mode) """
         self.log.debug('TE SMS status report received')
         try:
-            smsDict = decodeSmsPdu(notificationLine)
-        except EncodingError:
-            self.log.debug('Discarding notification line from +CDS response: %s', notificationLine)
-        else:
-            if smsDict['type'] == 'SMS-STATUS-REPORT':
-                report = StatusReport(self, int(smsDict['status']), smsDict['reference'], smsDict['number'], smsDict['time'], smsDict['discharge'], smsDict['status'])
+            if self.smsTextMode:
+                cdsMatch = self.CDS_REGEX_TEXT.match(lines[0])
+                if not cdsMatch:
+                    raise EncodingError('Failed to parse text-mode +CDS notification: {0}'.format(lines[0]))
+                reference, number, sentTime, deliverTime, deliverStatus = cdsMatch.groups()
+                report = StatusReport(self, Sms.STATUS_RECEIVED_UNREAD, int(reference), number, parseTextModeTimeStr(sentTime), parseTextModeTimeStr(deliverTime), int(deliverStatus))
             else:
-                raise CommandError('Invalid PDU type for readStoredSms(): {0}'.format(smsDict['type']))
+                if len(lines) < 2:
+                    raise EncodingError('Status report data missing')
+                smsDict = decodeSmsPdu(lines[1])
+                if smsDict['type'] != 'SMS-STATUS-REPORT':
+                    raise EncodingError('Invalid PDU type for +CDS notification: {0}'.format(smsDict['type']))
+                report = StatusReport(self, Sms.STATUS_RECEIVED_UNREAD, smsDict['reference'], smsDict['number'], smsDict['time'], smsDict['discharge'], smsDict['status'])
+        except Exception:
+            self.log.error('Failed to decode directly delivered SMS status report: %s', lines, exc_info=True)
+            self._acknowledgeSms(False)
+            return
+        self._acknowledgeSms(True)
+        self._handleStatusReport(report)
+
+    def _handleStatusReport(self, report):
+        """ Updates the sent SMS message the specified status report refers to, and notifies listeners of the report """
         # Update sent SMS status if possible
-        if report.reference in self.sentSms:
-            self.sentSms[report.reference].report = report
-        if self._smsStatusReportEvent:
-            # A sendSms() call is waiting for this response - notify waiting thread
-            self._smsStatusReportEvent.set()
-        else:
-            # Nothing is waiting for this report directly - use callback
-            self.smsStatusReportCallback(report)
+        sms = self.sentSms.lookup(report.reference, report.number, report.timeSent, self.port)
+        if sms != None:
+            sms._addReport(report) # notifies threads waiting for this SMS's report
+            self.sentSms.update(sms)
+        if self.smsStatusReportCallback:
+            try:
+                self.smsStatusReportCallback(report)
+            except Exception:
+                self.log.error('error in smsStatusReportCallback', exc_info=True)
 
     def readStoredSms(self, index, memory=None):
         """ Reads and returns the SMS message at the specified index
@@ -1453,7 +2303,7 @@ class GsmModem(SerialComms):
             pdu = msgData[1]
             smsDict = decodeSmsPdu(pdu)
             if smsDict['type'] == 'SMS-DELIVER':
-                return ReceivedSms(self, int(stat), smsDict['number'], smsDict['time'], smsDict['text'], smsDict['smsc'], smsDict.get('udh', []))
+                return ReceivedSms(self, int(stat), smsDict['number'], smsDict['time'], smsDict['text'], smsDict['smsc'], smsDict.get('udh', []), pdu)
             elif smsDict['type'] == 'SMS-STATUS-REPORT':
                 return StatusReport(self, int(stat), smsDict['reference'], smsDict['number'], smsDict['time'], smsDict['discharge'], smsDict['status'])
             else:
@@ -1470,9 +2320,15 @@ class GsmModem(SerialComms):
         :raise CommandError: if unable to delete the stored message
         """
         self._setSmsMemory(readDelete=memory)
-        self.write('AT+CMGD={0},0'.format(index))
-        # TODO: make a check how many params are supported by the modem and use the right command. For example, Siemens MC35, TC35 take only one parameter.
-        #self.write('AT+CMGD={0}'.format(index))
+        self.write('AT' + self._cmgdCommand(index))
+
+    def _cmgdCommand(self, index):
+        """ :return: The +CMGD command (without the "AT" prefix) that deletes the message at the specified index """
+        if self._cmgdDelFlagSupported:
+            return '+CMGD={0},0'.format(index)
+        else:
+            # e.g. Siemens MC35, TC35 take only one parameter
+            return '+CMGD={0}'.format(index)
 
     def deleteMultipleStoredSms(self, delFlag=4, memory=None):
         """ Deletes all SMS messages that have the specified read status.
@@ -1496,7 +2352,12 @@ class GsmModem(SerialComms):
         """
         if 0 < delFlag <= 4:
             self._setSmsMemory(readDelete=memory)
-            self.write('AT+CMGD=1,{0}'.format(delFlag))
+            if self._cmgdDelFlagSupported:
+                self.write('AT+CMGD=1,{0}'.format(delFlag))
+            else:
+                # Find the messages to delete, and delete them one by one
+                statuses = self.DELFLAG_STATUSES[delFlag]
+                self._deleteStoredSmsBatch([msgIndex for msgIndex, sms in self._listStoredSms(Sms.STATUS_ALL) if sms.status in statuses])
         else:
             raise ValueError('"delFlag" must be in range [1,4]')
 
@@ -4,10 +4,11 @@
 
 from __future__ import unicode_literals
 
-import sys, codecs
+import sys, codecs, binascii
+from itertools import islice
 from datetime import datetime, timedelta, tzinfo
-from copy import copy
 from .exceptions import EncodingError
+from .util import fixedOffsetTimezone
 
 # For Python 3 support
 PYTHON_VERSION = sys.version_info[0]
@@ -16,13 +17,21 @@ if PYTHON_VERSION >= 3:
     dictItemsIter = dict.items
     xrange = range
     unichr = chr
-    toByteArray = lambda x: bytearray(codecs.decode(x, 'hex_codec')) if type(x) == bytes else bytearray(codecs.decode(bytes(x, 'ascii'), 'hex_codec')) if type(x)  == str else x
+    toByteArray = lambda x: bytearray.fromhex(x.decode('ascii')) if type(x) == bytes else bytearray.fromhex(x) if type(x) == str else x
+    bufferView = memoryview
     rawStrToByteArray = lambda x: bytearray(bytes(x, 'latin-1'))
+    bytesToIntLE = lambda x: int.from_bytes(x, 'little')
+    intToBytesLE = lambda x, length: bytearray(x.to_bytes(length, 'little'))
+    UCS2_ERRORS = 'surrogatepass' # Keep lone surrogates (as sent by some phones when splitting messages)
 else: #pragma: no cover
     MAX_INT = sys.maxint
     dictItemsIter = dict.iteritems
     toByteArray = lambda x: bytearray(x.decode('hex')) if type(x) in (str, unicode) else x
     rawStrToByteArray = bytearray
+    bytesToIntLE = lambda x: int(str(x[::-1]).encode('hex') or '0', 16)
+    intToBytesLE = lambda x, length: bytearray(('%0*x' % (length * 2, x)).decode('hex'))[::-1] if length else bytearray()
+    bufferView = lambda x: x
+    UCS2_ERRORS = 'strict'
 
 TEXT_MODE = ('\n\r !\"#%&\'()*+,-./0123456789:;<=>?ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz') # TODO: Check if all of them are supported inside text mode
 # Tables can be found at: http://en.wikipedia.org/wiki/GSM_03.38#GSM_7_bit_default_alphabet_and_extension_table_of_3GPP_TS_23.038_.2F_GSM_03.38
@@ -39,6 +48,54 @@ GSM7_EXTENDED = {chr(0xFF): 0x0A,
                  ']':  chr(0x3E),
                  '|':  chr(0x40),
                  '€':  chr(0x65)}
+
+# Lookup tables derived from the character tables above (built once, at import time)
+TEXT_MODE_CHARS = frozenset(TEXT_MODE)
+# Extension table: character -> code (following the ESC character), and vice versa
+GSM7_EXTENDED_CODES = dict((char, value if isinstance(value, int) else ord(value)) for char, value in dictItemsIter(GSM7_EXTENDED))
+GSM7_EXTENDED_DECODE = dict((value, char) for char, value in dictItemsIter(GSM7_EXTENDED_CODES))
+# Encoding (for unicode.translate()): character ordinal -> GSM-7 code(s), as a string of code points
+GSM7_ENCODE_TABLE = dict((ord(char), '\x1b' + unichr(value)) for char, value in dictItemsIter(GSM7_EXTENDED_CODES)) # ESC - switch to extended table
+for idx, char in enumerate(GSM7_BASIC):
+    GSM7_ENCODE_TABLE[ord(char)] = unichr(idx)
+# Number of septets each encodable character takes up
+GSM7_CHAR_SIZE = dict((unichr(ordinal), len(codes)) for ordinal, codes in dictItemsIter(GSM7_ENCODE_TABLE))
+# As GSM7_ENCODE_TABLE, but also maps the ASCII characters that cannot be encoded (to a non-ASCII marker)
+_GSM7_TRANSLATE_TABLE = dict(GSM7_ENCODE_TABLE)
+for idx in xrange(128):
+    _GSM7_TRANSLATE_TABLE.setdefault(idx, '\x80')
+del idx, char
+# Decoding (for codecs.charmap_decode()): GSM-7 code -> character (the high bit, which is not part of a septet, is ignored)
+GSM7_DECODE_TABLE = ''.join([GSM7_BASIC[code & 0x7F] for code in xrange(256)])
+
+# National language identifiers (3GPP TS 23.038, section 6.2.1.2.4), as used in the National Language Single Shift
+# (IEI 0x24) and Locking Shift (IEI 0x25) information elements; 0 stands for the default GSM-7 alphabet
+NATIONAL_LANGUAGE_TURKISH = 0x01
+NATIONAL_LANGUAGE_SPANISH = 0x02
+NATIONAL_LANGUAGE_PORTUGUESE = 0x03
+GSM7_NATIONAL_LANGUAGES = (NATIONAL_LANGUAGE_TURKISH, NATIONAL_LANGUAGE_SPANISH, NATIONAL_LANGUAGE_PORTUGUESE)
+# National language locking shift tables (used instead of GSM7_BASIC); there is no Spanish one
+GSM7_NATIONAL_LOCKING_SHIFT = {NATIONAL_LANGUAGE_TURKISH: ('@£$¥€éùıòÇ\nĞğ\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bŞşßÉ !\"#¤%&\'()*+,-./0123456789:;<=>?İABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§çabcdefghijklmnopqrstuvwxyzäöñüà'),
+                               NATIONAL_LANGUAGE_PORTUGUESE: ('@£$¥êéúíóç\nÔô\rÁáΔ_ªÇÀ∞^\\€Ó|\x1bÂâÊÉ !\"#º%&\'()*+,-./0123456789:;<=>?ÍABCDEFGHIJKLMNOPQRSTUVWXYZÃÕÚÜ§~abcdefghijklmnopqrstuvwxyzãõ`üà')}
+# National language single shift tables (used instead of GSM7_EXTENDED): character -> code (following the ESC character)
+GSM7_NATIONAL_SINGLE_SHIFT = {NATIONAL_LANGUAGE_TURKISH: {'\x0c': 0x0A, '^': 0x14, '{': 0x28, '}': 0x29, '\\': 0x2F, '[': 0x3C, '~': 0x3D, ']': 0x3E, '|': 0x40,
+                                                          'Ğ': 0x47, 'İ': 0x49, 'Ş': 0x53, 'ç': 0x63, '€': 0x65, 'ğ': 0x67, 'ı': 0x69, 'ş': 0x73},
+                              NATIONAL_LANGUAGE_SPANISH: {'ç': 0x09, '\x0c': 0x0A, '^': 0x14, '{': 0x28, '}': 0x29, '\\': 0x2F, '[': 0x3C, '~': 0x3D, ']': 0x3E, '|': 0x40,
+                                                          'Á': 0x41, 'Í': 0x49, 'Ó': 0x4F, 'Ú': 0x55, 'á': 0x61, '€': 0x65, 'í': 0x69, 'ó': 0x6F, 'ú': 0x75},
+                              NATIONAL_LANGUAGE_PORTUGUESE: {'ê': 0x05, 'ç': 0x09, '\x0c': 0x0A, 'Ô': 0x0B, 'ô': 0x0C, 'Á': 0x0E, 'á': 0x0F, 'Φ': 0x12, 'Γ': 0x13,
+                                                             '^': 0x14, 'Ω': 0x15, 'Π': 0x16, 'Ψ': 0x17, 'Σ': 0x18, 'Θ': 0x19, 'Ê': 0x1F, '{': 0x28, '}': 0x29,
+                                                             '\\': 0x2F, '[': 0x3C, '~': 0x3D, ']': 0x3E, '|': 0x40, 'À': 0x41, 'Í': 0x49, 'Ó': 0x4F, 'Ú': 0x55,
+                                                             'Ã': 0x5B, 'Õ': 0x5C, 'Â': 0x61, '€': 0x65, 'í': 0x69, 'ó': 0x6F, 'ú': 0x75, 'ã': 0x7B, 'õ': 0x7C, 'â': 0x7F}}
+# Decoding tables for the national language tables (as GSM7_DECODE_TABLE and GSM7_EXTENDED_DECODE)
+_GSM7_NATIONAL_DECODE_TABLES = dict((language, ''.join([table[code & 0x7F] for code in xrange(256)])) for language, table in dictItemsIter(GSM7_NATIONAL_LOCKING_SHIFT))
+_GSM7_NATIONAL_EXTENDED_DECODE = dict((language, dict((code, char) for char, code in dictItemsIter(table))) for language, table in dictItemsIter(GSM7_NATIONAL_SINGLE_SHIFT))
+# Encoding tables (as _GSM7_TRANSLATE_TABLE) for combinations of national language tables; built when first used
+_GSM7_NATIONAL_TRANSLATE_TABLES = {}
+# All characters that can be encoded using (any combination of) the national language tables; GSM7_EXTENDED has a
+# byte string key on Python 2, so its characters are converted to unicode
+_GSM7_NATIONAL_CHARS = frozenset(GSM7_BASIC).union([unichr(ord(char)) for char in GSM7_EXTENDED_CODES],
+                                                   *(list(GSM7_NATIONAL_LOCKING_SHIFT.values()) + list(GSM7_NATIONAL_SINGLE_SHIFT.values()))) - frozenset('\x1b')
+
 # Maximum message sizes for each data coding
 MAX_MESSAGE_LENGTH = {0x00: 160, # GSM-7
                       0x04: 140, # 8-bit
@@ -106,6 +163,8 @@ class InformationElement(object):
     access the specific (and useful) attributes of these special cases.
     """
 
+    __slots__ = ('id', 'dataLength', 'data')
+
     def __new__(cls, *args, **kwargs): #iei, ieLen, ieData):
         """ Causes a new InformationElement class, or subclass
         thereof, to be created. If the IEI is recognized, a specific
@@ -171,6 +230,8 @@ class Concatenation(InformationElement):
         increment for every short message which makes up the concatenated short message
     """
 
+    __slots__ = ('reference', 'parts', 'number')
+
     def __init__(self, iei=0x00, ieLen=0, ieData=None):
         super(Concatenation, self).__init__(iei, ieLen, ieData)
         if ieData != None:
@@ -204,6 +265,8 @@ class PortAddress(InformationElement):
     source: The source port number
     """
 
+    __slots__ = ('destination', 'source')
+
     def __init__(self, iei=0x04, ieLen=0, ieData=None):
         super(PortAddress, self).__init__(iei, ieLen, ieData)
         if ieData != None:
@@ -224,12 +287,109 @@ class PortAddress(InformationElement):
         return super(PortAddress, self).encode()
 
 
+class NationalLanguageShift(InformationElement):
+    """ IE that indicates a National Language Single Shift (IEI 0x24) or Locking Shift (IEI 0x25) table.
+
+    The locking shift table replaces the default GSM-7 alphabet, the single shift table replaces
+    its extension table (the characters following an ESC character).
+
+    Exposes:
+    language: The national language identifier (e.g. NATIONAL_LANGUAGE_TURKISH)
+    """
+
+    __slots__ = ('language',)
+
+    def __init__(self, iei=0x24, ieLen=0, ieData=None):
+        super(NationalLanguageShift, self).__init__(iei, ieLen, ieData)
+        if ieData != None:
+            self.language = ieData[0]
+
+    def encode(self):
+        self.data = [self.language]
+        self.dataLength = 1
+        return super(NationalLanguageShift, self).encode()
+
+
 # Map of recognized IEIs
 IEI_CLASS_MAP = {0x00: Concatenation, # Concatenated short messages, 8-bit reference number
                  0x08: Concatenation, # Concatenated short messages, 16-bit reference number
                  0x04: PortAddress, # Application port addressing scheme, 8 bit address
-                 0x05: PortAddress # Application port addressing scheme, 16 bit address
+                 0x05: PortAddress, # Application port addressing scheme, 16 bit address
+                 0x24: NationalLanguageShift, # National language single shift
+                 0x25: NationalLanguageShift # National language locking shift
                 }
+# Valid data lengths of the recognized IEs (key: IEI, value: (minimum, maximum or None))
+_IEI_DATA_LENGTHS = {0x00: (3, 3), 0x08: (4, None), 0x04: (2, 2), 0x05: (4, None), 0x24: (1, 1), 0x25: (1, 1)}
+
+
+class UserDataHeader(object):
+    """ User Data Header (UDH) of a decoded SMS PDU: a sequence of InformationElement objects
+
+    When the PDU is decoded, only the identifier, offset and length of every information element
+    are recorded; the InformationElement (or Concatenation, PortAddress) objects are created when
+    they are first accessed. Use the "concatenation" attribute to look up the concatenation
+    information element (or "languageShift" for the national language tables) without creating
+    the others.
+    """
+
+    __slots__ = ('_data', '_index', '_elements')
+
+    def __init__(self, data, index):
+        """ Constructor
+
+        :param data: The PDU data
+        :type data: bytearray
+        :param index: (IEI, offset of the IE data, IE length) of every information element
+        :type index: list of tuples
+        """
+        self._data = data
+        self._index = index
+        self._elements = None
+
+    @property
+    def ieis(self):
+        """ The identifiers of the information elements (without creating them) """
+        return [iei for iei, offset, ieLen in self._index]
+
+    @property
+    def concatenation(self):
+        """ The Concatenation information element, or None if the message is not part of a concatenated message """
+        for i, (iei, offset, ieLen) in enumerate(self._index):
+            if iei == 0x00 or iei == 0x08:
+                return self[i]
+        return None
+
+    @property
+    def languageShift(self):
+        """ The (locking shift, single shift) national language identifiers of the message text; 0 if a table is not specified """
+        lockingShift = singleShift = 0
+        for iei, offset, ieLen in self._index:
+            if iei == 0x25:
+                lockingShift = self._data[offset]
+            elif iei == 0x24:
+                singleShift = self._data[offset]
+        return lockingShift, singleShift
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(len(self._index)))]
+        if self._elements == None:
+            self._elements = [None] * len(self._index)
+        ie = self._elements[i]
+        if ie == None:
+            iei, offset, ieLen = self._index[i]
+            ie = self._elements[i] = IEI_CLASS_MAP.get(iei, InformationElement)(iei, ieLen, list(self._data[offset:offset + ieLen]))
+        return ie
+
+    def __iter__(self):
+        for i in xrange(len(self._index)):
+            yield self[i]
+
+    def __repr__(self):
+        return '<UserDataHeader IEIs: {0}>'.format(', '.join('0x{0:02X}'.format(iei) for iei in self.ieis))
 
 
 class Pdu(object):
@@ -244,18 +404,212 @@ class Pdu(object):
         """
         self.data = data
         self.tpduLength = tpduLength
+        self._hexData = None
+
+    @property
+    def hexData(self):
+        """ The PDU data as upper-case hexadecimal ASCII bytes, as written to the modem (cached; "data" should not be modified) """
+        if self._hexData == None:
+            self._hexData = binascii.hexlify(self.data).upper()
+        return self._hexData
 
     def __str__(self):
         global PYTHON_VERSION
         if PYTHON_VERSION < 3:
-            return str(self.data).encode('hex').upper()
+            return self.hexData
         else: #pragma: no cover
-            return str(codecs.encode(self.data, 'hex_codec'), 'ascii').upper()
+            return self.hexData.decode('ascii')
+
+
+class PduTemplate(object):
+    """ Pre-encoded SMS-SUBMIT message body, used for sending the same text to many recipients
+
+    The data coding scheme, text division, User Data Header and packed user data of
+    every message part are encoded once when the template is created; encode() then
+    only needs to encode the destination address and the message reference for each
+    recipient, and splices them in between the cached byte buffers.
+    """
+
+    def __init__(self, text, validity=None, smsc=None, requestStatusReport=True, rejectDuplicates=False, sendFlash=False, nationalLanguages=GSM7_NATIONAL_LANGUAGES):
+        """ Constructor
+
+        :param text: the message text
+        :type text: str
+        :param validity: message validity period (absolute or relative)
+        :type validity: datetime.timedelta (relative) or datetime.datetime (absolute)
+        :param smsc: SMSC number to use (leave None to use default)
+        :type smsc: str
+        :param requestStatusReport: Flag that controls the TP-SRR parameter (request a status report for the message)
+        :type requestStatusReport: bool
+        :param rejectDuplicates: Flag that controls the TP-RD parameter (messages with same destination and reference may be rejected if True)
+        :type rejectDuplicates: bool
+        :param sendFlash: If True, the message is sent as a "flash" (class 0) message
+        :type sendFlash: bool
+        :param nationalLanguages: National language shift tables that may be used (with GSM-7) for text that the default
+                                  GSM-7 alphabet cannot encode, if that takes fewer message parts than UCS2 (empty: never)
+        :type nationalLanguages: sequence of int
+        """
+        if PYTHON_VERSION < 3:
+            if type(text) == str:
+                text = text.decode('UTF-8')
+        self.text = text
+
+        tpduFirstOctet = 0x01 # SMS-SUBMIT PDU
+        if validity != None:
+            # Validity period format (TP-VPF) is stored in bits 4,3 of the first TPDU octet
+            if type(validity) == timedelta:
+                # Relative (TP-VP is integer)
+                tpduFirstOctet |= 0x10 # bit4 == 1, bit3 == 0
+                validityPeriod = [_encodeRelativeValidityPeriod(validity)]
+            elif type(validity) == datetime:
+                # Absolute (TP-VP is semi-octet encoded date)
+                tpduFirstOctet |= 0x18 # bit4 == 1, bit3 == 1
+                validityPeriod = _encodeTimestamp(validity)
+            else:
+                raise TypeError('"validity" must be of type datetime.timedelta (for relative value) or datetime.datetime (for absolute value)')
+        else:
+            validityPeriod = None
+        if rejectDuplicates:
+            tpduFirstOctet |= 0x04 # bit2 == 1
+        if requestStatusReport:
+            tpduFirstOctet |= 0x20 # bit5 == 1
+
+        # Encode the message text once, and set data coding scheme based on text contents
+        try:
+            encodedText = encodeGsm7(text)
+        except ValueError:
+            # Cannot encode text using GSM-7; use UCS2 instead (lengths are in UTF-16 code units)
+            encodedText = encodeUcs2(text)
+            encodedTextLength = len(encodedText) // 2
+            alphabet = 0x08 # UCS2
+        else:
+            encodedTextLength = len(encodedText)
+            alphabet = 0x00 # GSM-7
+
+        # Divide the encoded text into parts if it is too long for a single PDU
+        if encodedTextLength <= MAX_MESSAGE_LENGTH[alphabet]:
+            encodedParts = [encodedText]
+        elif alphabet == 0x00:
+            encodedParts = _divideEncodedGsm7(text, encodedText)
+        else:
+            encodedParts = _divideEncodedUcs2(encodedText)
+        lockingShift = singleShift = 0
+        if alphabet == 0x08 and nationalLanguages:
+            national = _encodeGsm7National(text, len(encodedParts), nationalLanguages)
+            if national != None:
+                lockingShift, singleShift, encodedParts = national
+                alphabet = 0x00 # GSM-7
+        self.alphabet = alphabet
+        self.languageShift = (lockingShift, singleShift)
+
+        # National language shift table IEs (part of the User Data Header of every PDU)
+        languageHeader = bytearray()
+        for iei, language in ((0x25, lockingShift), (0x24, singleShift)):
+            if language:
+                languageIe = NationalLanguageShift(iei)
+                languageIe.language = language
+                languageHeader.extend(languageIe.encode())
+        # Text divided into several PDUs - add "concatenation" User Data Header
+        concatenated = len(encodedParts) > 1
+        if concatenated or languageHeader:
+            tpduFirstOctet |= 0x40
+
+        # Everything before the message reference: the SMSC field and the first TPDU octet
+        self._head = bytearray()
+        if smsc:
+            self._head.extend(_encodeAddressField(smsc, smscField=True))
+        else:
+            self._head.append(0x00) # Don't supply an SMSC number - use the one configured in the device
+        self._head.append(tpduFirstOctet)
+
+        # Protocol identifier - no higher-level protocol; data coding scheme; validity period
+        tailHead = bytearray((0x00, alphabet if not sendFlash else (0x10 if alphabet == 0x00 else 0x18)))
+        if validityPeriod:
+            tailHead.extend(validityPeriod)
+
+        # Everything after the destination address, per message part
+        self._tails = []
+        # Offset of the concatenation reference number in each tail (or None if not concatenated)
+        self._concatRefOffset = None
+        pduCount = len(encodedParts)
+        for i in xrange(pduCount):
+            if concatenated:
+                concatHeader = Concatenation()
+                concatHeader.reference = 0 # placeholder; patched in encode()
+                concatHeader.parts = pduCount
+                concatHeader.number = i + 1
+                udh = concatHeader.encode() + languageHeader
+            else:
+                udh = languageHeader
+
+            encodedPart = encodedParts[i]
+            if alphabet == 0x00: # GSM-7
+                userDataLength = len(encodedPart) # Payload size in septets/characters
+                if udh:
+                    udhOctets = len(udh) + 1 # +1 for the UDH length indicator byte
+                    shift = (udhOctets * 8) % 7 # "fill bits" needed to make the UDH end on a septet boundary
+                    userData = packSeptets(encodedPart, padBits=shift)
+                    userDataLength += (udhOctets * 8 + 6) // 7 # the UDH (and padding bits) in septets
+                else:
+                    userData = packSeptets(encodedPart)
+            elif alphabet == 0x08: # UCS2
+                userData = encodedPart
+                userDataLength = len(userData)
+                if udh:
+                    userDataLength += len(udh) + 1 # +1 for the UDH length indicator byte
+
+            if udh:
+                tail = tailHead + bytearray((userDataLength, len(udh))) + udh + userData
+                if concatenated:
+                    # The reference number is the 3rd octet of the (8-bit reference) concatenation IE
+                    self._concatRefOffset = len(tailHead) + 4
+            else:
+                tail = tailHead + bytearray((userDataLength,)) + userData
+            self._tails.append(tail)
+
+    def __len__(self):
+        """ Exposes the number of PDUs (message parts) this template encodes into """
+        return len(self._tails)
+
+    def encode(self, number, reference=0):
+        """ Creates the SMS-SUBMIT PDU(s) for sending this template's text to the specified number
 
+        :param number: the destination mobile number
+        :type number: str
+        :param reference: message reference number (also used as the concatenation reference)
+        :type reference: int
 
-def encodeSmsSubmitPdu(number, text, reference=0, validity=None, smsc=None, requestStatusReport=True, rejectDuplicates=False, sendFlash=False):
+        :return: A list of one or more Pdu objects
+        :rtype: list of gsmmodem.pdu.Pdu
+        """
+        return self._encodeAddressed(_encodeAddressField(number), reference)
+
+    def _encodeAddressed(self, address, reference):
+        """ As encode(), but for an already encoded destination address field """
+        head = self._head
+        headLength = len(head)
+        tailOffset = headLength + 1 + len(address)
+        refOffset = self._concatRefOffset
+        pdus = []
+        for tail in self._tails:
+            # Every PDU is written into a single buffer of the final size
+            pdu = bytearray(tailOffset + len(tail))
+            pdu[:headLength] = head
+            pdu[headLength] = reference # message reference
+            pdu[headLength + 1:tailOffset] = address # destination number
+            pdu[tailOffset:] = tail
+            if refOffset != None:
+                pdu[tailOffset + refOffset] = reference
+            pdus.append(Pdu(pdu, len(pdu) - 1))
+        return pdus
+
+
+def encodeSmsSubmitPdu(number, text, reference=0, validity=None, smsc=None, requestStatusReport=True, rejectDuplicates=False, sendFlash=False, nationalLanguages=GSM7_NATIONAL_LANGUAGES):
     """ Creates an SMS-SUBMIT PDU for sending a message with the specified text to the specified number
 
+    Note: when sending the same text to many recipients, create a PduTemplate once and use its
+    encode() method for each recipient instead.
+
     :param number: the destination mobile number
     :type number: str
     :param text: the message text
@@ -268,121 +622,13 @@ def encodeSmsSubmitPdu(number, text, reference=0, validity=None, smsc=None, requ
     :type smsc: str
     :param rejectDuplicates: Flag that controls the TP-RD parameter (messages with same destination and reference may be rejected if True)
     :type rejectDuplicates: bool
+    :param nationalLanguages: National language shift tables that may be used instead of UCS2 (see PduTemplate)
+    :type nationalLanguages: sequence of int
 
     :return: A list of one or more tuples containing the SMS PDU (as a bytearray, and the length of the TPDU part
     :rtype: list of tuples
     """
-    if PYTHON_VERSION < 3:
-        if type(text) == str:
-            text = text.decode('UTF-8')
-
-    tpduFirstOctet = 0x01 # SMS-SUBMIT PDU
-    if validity != None:
-        # Validity period format (TP-VPF) is stored in bits 4,3 of the first TPDU octet
-        if type(validity) == timedelta:
-            # Relative (TP-VP is integer)
-            tpduFirstOctet |= 0x10 # bit4 == 1, bit3 == 0
-            validityPeriod = [_encodeRelativeValidityPeriod(validity)]
-        elif type(validity) == datetime:
-            # Absolute (TP-VP is semi-octet encoded date)
-            tpduFirstOctet |= 0x18 # bit4 == 1, bit3 == 1
-            validityPeriod = _encodeTimestamp(validity)
-        else:
-            raise TypeError('"validity" must be of type datetime.timedelta (for relative value) or datetime.datetime (for absolute value)')
-    else:
-        validityPeriod = None
-    if rejectDuplicates:
-        tpduFirstOctet |= 0x04 # bit2 == 1
-    if requestStatusReport:
-        tpduFirstOctet |= 0x20 # bit5 == 1
-
-    # Encode message text and set data coding scheme based on text contents
-    try:
-        encodedTextLength = len(encodeGsm7(text))
-    except ValueError:
-        # Cannot encode text using GSM-7; use UCS2 instead
-        encodedTextLength = len(text)
-        alphabet = 0x08 # UCS2
-    else:
-        alphabet = 0x00 # GSM-7
-
-    # Check if message should be concatenated
-    if encodedTextLength > MAX_MESSAGE_LENGTH[alphabet]:
-        # Text too long for single PDU - add "concatenation" User Data Header
-        concatHeaderPrototype = Concatenation()
-        concatHeaderPrototype.reference = reference
-
-        # Devide whole text into parts
-        if alphabet == 0x00:
-            pduTextParts = divideTextGsm7(text)
-        elif alphabet == 0x08:
-            pduTextParts = divideTextUcs2(text)
-        else:
-            raise NotImplementedError
-
-        pduCount = len(pduTextParts)
-        concatHeaderPrototype.parts  = pduCount
-        tpduFirstOctet |= 0x40
-    else:
-        concatHeaderPrototype = None
-        pduCount = 1
-
-    # Construct required PDU(s)
-    pdus = []
-    for i in xrange(pduCount):
-        pdu = bytearray()
-        if smsc:
-            pdu.extend(_encodeAddressField(smsc, smscField=True))
-        else:
-            pdu.append(0x00) # Don't supply an SMSC number - use the one configured in the device
-
-        udh = bytearray()
-        if concatHeaderPrototype != None:
-            concatHeader = copy(concatHeaderPrototype)
-            concatHeader.number = i + 1
-            pduText = pduTextParts[i]
-            pduTextLength = len(pduText)
-            udh.extend(concatHeader.encode())
-        else:
-            pduText = text
-
-        udhLen = len(udh)
-
-        pdu.append(tpduFirstOctet)
-        pdu.append(reference) # message reference
-        # Add destination number
-        pdu.extend(_encodeAddressField(number))
-        pdu.append(0x00) # Protocol identifier - no higher-level protocol
-
-        pdu.append(alphabet if not sendFlash else (0x10 if alphabet == 0x00 else 0x18))
-        if validityPeriod:
-            pdu.extend(validityPeriod)
-
-        if alphabet == 0x00: # GSM-7
-            encodedText = encodeGsm7(pduText)
-            userDataLength = len(encodedText) # Payload size in septets/characters
-            if udhLen > 0:
-                shift = ((udhLen + 1) * 8) % 7 # "fill bits" needed to make the UDH end on a septet boundary
-                userData = packSeptets(encodedText, padBits=shift)
-                if shift > 0:
-                    userDataLength += 1 # take padding bits into account
-            else:
-                userData = packSeptets(encodedText)
-        elif alphabet == 0x08: # UCS2
-            userData = encodeUcs2(pduText)
-            userDataLength = len(userData)
-
-        if udhLen > 0:
-            userDataLength += udhLen + 1 # +1 for the UDH length indicator byte
-            pdu.append(userDataLength)
-            pdu.append(udhLen)
-            pdu.extend(udh) # UDH
-        else:
-            pdu.append(userDataLength)
-        pdu.extend(userData) # User Data (message payload)
-        tpdu_length = len(pdu) - 1
-        pdus.append(Pdu(pdu, tpdu_length))
-    return pdus
+    return PduTemplate(text, validity, smsc, requestStatusReport, rejectDuplicates, sendFlash, nationalLanguages).encode(number, reference)
 
 def decodeSmsPdu(pdu):
     """ Decodes SMS pdu data and returns a tuple in format (number, text)
@@ -395,94 +641,268 @@ def decodeSmsPdu(pdu):
     :return: The decoded SMS data as a dictionary
     :rtype: dict
     """
+    return parseSmsPdu(pdu).toDict()
+
+def parseSmsPdu(pdu):
+    """ Parses SMS PDU data into an SmsPdu object, which decodes its fields on demand
+
+    Use this instead of decodeSmsPdu() when only some fields of many PDUs are needed, e.g. when
+    filtering PDUs by type or sender.
+
+    :param pdu: PDU data as a hex string, or a bytearray containing PDU octects
+    :type pdu: str or bytearray
+
+    :raise EncodingError: If the specified PDU data cannot be parsed
+
+    :return: The parsed PDU
+    :rtype: gsmmodem.pdu.SmsPdu
+    """
     try:
-        pdu = toByteArray(pdu)
+        data = toByteArray(pdu)
     except Exception as e:
-        # Python 2 raises TypeError, Python 3 raises binascii.Error
+        # Python 2 raises TypeError, Python 3 raises ValueError
         raise EncodingError(e)
-    result = {}
-    pduIter = iter(pdu)
-
-    smscNumber, smscBytesRead = _decodeAddressField(pduIter, smscField=True)
-    result['smsc'] = smscNumber
-    result['tpdu_length'] = len(pdu) - smscBytesRead
-
-    tpduFirstOctet = next(pduIter)
-
-    pduType = tpduFirstOctet & 0x03 # bits 1-0
-    if pduType == 0x00: # SMS-DELIVER or SMS-DELIVER REPORT
-        result['type'] = 'SMS-DELIVER'
-        result['number'] = _decodeAddressField(pduIter)[0]
-        result['protocol_id'] = next(pduIter)
-        dataCoding = _decodeDataCoding(next(pduIter))
-        result['time'] = _decodeTimestamp(pduIter)
-        userDataLen = next(pduIter)
-        udhPresent = (tpduFirstOctet & 0x40) != 0
-        ud = _decodeUserData(pduIter, userDataLen, dataCoding, udhPresent)
-        result.update(ud)
-    elif pduType == 0x01: # SMS-SUBMIT or SMS-SUBMIT-REPORT
-        result['type'] = 'SMS-SUBMIT'
-        result['reference'] = next(pduIter) # message reference - we don't really use this
-        result['number'] = _decodeAddressField(pduIter)[0]
-        result['protocol_id'] = next(pduIter)
-        dataCoding = _decodeDataCoding(next(pduIter))
-        validityPeriodFormat = (tpduFirstOctet & 0x18) >> 3 # bits 4,3
-        if validityPeriodFormat == 0x02: # TP-VP field present and integer represented (relative)
-            result['validity'] = _decodeRelativeValidityPeriod(next(pduIter))
-        elif validityPeriodFormat == 0x03: # TP-VP field present and semi-octet represented (absolute)
-            result['validity'] = _decodeTimestamp(pduIter)
-        userDataLen = next(pduIter)
-        udhPresent = (tpduFirstOctet & 0x40) != 0
-        ud = _decodeUserData(pduIter, userDataLen, dataCoding, udhPresent)
-        result.update(ud)
-    elif pduType == 0x02: # SMS-STATUS-REPORT or SMS-COMMAND
-        result['type'] = 'SMS-STATUS-REPORT'
-        result['reference'] = next(pduIter)
-        result['number'] = _decodeAddressField(pduIter)[0]
-        result['time'] = _decodeTimestamp(pduIter)
-        result['discharge'] = _decodeTimestamp(pduIter)
-        result['status'] = next(pduIter)
-    else:
-        raise EncodingError('Unknown SMS message type: {0}. First TPDU octet was: {1}'.format(pduType, tpduFirstOctet))
+    if type(data) != bytearray:
+        data = bytearray(data)
+    return SmsPdu(data)
 
-    return result
+
+# Marks SmsPdu fields that have not been decoded yet
+_NOT_DECODED = object()
+
+class SmsPdu(object):
+    """ SMS PDU (SMS-DELIVER, SMS-SUBMIT or SMS-STATUS-REPORT) with lazily decoded fields
+
+    Only the fixed part of the header (the PDU type, protocol identifier, data coding, message
+    reference and status, and the offsets of the other fields) is parsed up front. The SMSC and
+    sender/destination addresses, timestamps, User Data Header and text are decoded when they
+    are first accessed (and then cached).
+
+    The attributes correspond to the keys of the dictionary returned by decodeSmsPdu() (in
+    camelCase); fields that the PDU type does not have are None. toDict() returns that dictionary.
+    """
+
+    __slots__ = ('data', 'type', 'tpduLength', 'protocolId', 'reference', 'status',
+                 '_firstOctet', '_dataCoding', '_numberOffset', '_timeOffset', '_validityOffset', '_dischargeOffset', '_userDataOffset', '_userDataLength',
+                 '_smsc', '_number', '_time', '_validity', '_discharge', '_udh', '_text')
+
+    def __init__(self, data):
+        """ Constructor
+
+        :param data: The raw PDU data
+        :type data: bytearray
+
+        :raise EncodingError: If the PDU type is unknown, or the PDU data is too short
+        """
+        self.data = data
+        self.protocolId = self.reference = self.status = None
+        self._timeOffset = self._validityOffset = self._dischargeOffset = self._userDataOffset = self._userDataLength = None
+        self._smsc = self._number = self._time = self._validity = self._discharge = self._udh = self._text = _NOT_DECODED
+        try:
+            self._parseHeader()
+        except IndexError:
+            raise EncodingError('PDU data is too short ({0} octets)'.format(len(data)))
+
+    def _parseHeader(self):
+        data = self.data
+        smscLength = _addressFieldLength(data, 0, smscField=True)
+        self.tpduLength = len(data) - smscLength
+        self._firstOctet = tpduFirstOctet = data[smscLength]
+        pos = smscLength + 1
+        pduType = tpduFirstOctet & 0x03 # bits 1-0
+        if pduType == 0x00: # SMS-DELIVER or SMS-DELIVER REPORT
+            self.type = 'SMS-DELIVER'
+            self._numberOffset = pos
+            pos += _addressFieldLength(data, pos)
+            self.protocolId = data[pos]
+            self._dataCoding = _decodeDataCoding(data[pos + 1])
+            self._timeOffset = pos + 2
+            self._userDataOffset = pos + 9
+        elif pduType == 0x01: # SMS-SUBMIT or SMS-SUBMIT-REPORT
+            self.type = 'SMS-SUBMIT'
+            self.reference = data[pos]
+            self._numberOffset = pos = pos + 1
+            pos += _addressFieldLength(data, pos)
+            self.protocolId = data[pos]
+            self._dataCoding = _decodeDataCoding(data[pos + 1])
+            pos += 2
+            validityPeriodFormat = (tpduFirstOctet & 0x18) >> 3 # bits 4,3
+            if validityPeriodFormat == 0x02: # relative
+                self._validityOffset = pos
+                pos += 1
+            elif validityPeriodFormat == 0x03: # absolute
+                self._validityOffset = pos
+                pos += 7
+            self._userDataOffset = pos
+        elif pduType == 0x02: # SMS-STATUS-REPORT or SMS-COMMAND
+            self.type = 'SMS-STATUS-REPORT'
+            self.reference = data[pos]
+            self._numberOffset = pos = pos + 1
+            pos += _addressFieldLength(data, pos)
+            self._timeOffset = pos
+            self._dischargeOffset = pos + 7
+            self.status = data[pos + 14]
+        else:
+            raise EncodingError('Unknown SMS message type: {0}. First TPDU octet was: {1}'.format(pduType, tpduFirstOctet))
+        if self._userDataOffset != None:
+            self._userDataLength = data[self._userDataOffset]
+
+    @property
+    def smsc(self):
+        if self._smsc is _NOT_DECODED:
+            self._smsc = _decodeAddressFieldAt(self.data, 0, smscField=True)[0]
+        return self._smsc
+
+    @property
+    def number(self):
+        if self._number is _NOT_DECODED:
+            self._number = _decodeAddressFieldAt(self.data, self._numberOffset)[0]
+        return self._number
+
+    @property
+    def time(self):
+        if self._time is _NOT_DECODED:
+            self._time = _decodeTimestampAt(self.data, self._timeOffset)
+        return self._time
+
+    @property
+    def discharge(self):
+        if self._discharge is _NOT_DECODED:
+            self._discharge = _decodeTimestampAt(self.data, self._dischargeOffset)
+        return self._discharge
+
+    @property
+    def validity(self):
+        if self._validity is _NOT_DECODED:
+            if self._validityOffset == None:
+                self._validity = None
+            elif self._firstOctet & 0x08: # absolute
+                self._validity = _decodeTimestampAt(self.data, self._validityOffset)
+            else: # relative
+                self._validity = _decodeRelativeValidityPeriod(self.data[self._validityOffset])
+        return self._validity
+
+    @property
+    def udh(self):
+        """ The User Data Header (a gsmmodem.pdu.UserDataHeader; None if the PDU has no User Data Header) """
+        if self._udh is _NOT_DECODED:
+            if self._userDataOffset == None or not self._firstOctet & 0x40:
+                self._udh = None
+            else:
+                self._udh = _decodeUdhAt(self.data, self._userDataOffset + 1)[0]
+        return self._udh
+
+    @property
+    def text(self):
+        if self._text is _NOT_DECODED:
+            if self._userDataOffset == None:
+                self._text = None
+            else:
+                userData = _decodeUserDataAt(self.data, self._userDataOffset + 1, self._userDataLength, self._dataCoding, self._firstOctet & 0x40 != 0)
+                if self._udh is _NOT_DECODED:
+                    self._udh = userData.get('udh')
+                self._text = userData['text']
+        return self._text
+
+    def toDict(self):
+        """ :return: The decoded PDU fields, as returned by decodeSmsPdu()
+        :rtype: dict
+        """
+        result = {'smsc': self.smsc, 'tpdu_length': self.tpduLength, 'type': self.type}
+        if self.type == 'SMS-DELIVER':
+            fields = (('number', 'number'), ('protocol_id', 'protocolId'), ('time', 'time'))
+        elif self.type == 'SMS-SUBMIT':
+            fields = (('reference', 'reference'), ('number', 'number'), ('protocol_id', 'protocolId'))
+            if self._validityOffset != None:
+                fields += (('validity', 'validity'),)
+        else:
+            fields = (('reference', 'reference'), ('number', 'number'), ('time', 'time'), ('discharge', 'discharge'), ('status', 'status'))
+        for key, attribute in fields:
+            result[key] = getattr(self, attribute)
+        if self._userDataOffset != None:
+            text = self.text
+            if self._firstOctet & 0x40:
+                result['udh'] = self.udh
+            result['text'] = text
+        return result
+
+    def __repr__(self):
+        return '<SmsPdu {0} {1}>'.format(self.type, self.number)
 
 def _decodeUserData(byteIter, userDataLen, dataCoding, udhPresent):
     """ Decodes PDU user data (UDHI (if present) and message text) """
+    return _decodeUserDataAt(bytearray(byteIter), 0, userDataLen, dataCoding, udhPresent)
+
+def _decodeUserDataAt(data, offset, userDataLen, dataCoding, udhPresent):
+    """ Decodes PDU user data (UDHI (if present) and message text) starting at the specified offset
+
+    :param data: The PDU data
+    :type data: bytearray
+    :param offset: The offset of the user data (i.e. just after the user data length octet)
+    :type offset: int
+
+    :raise EncodingError: If the User Data Header is truncated
+    """
     result = {}
+    view = bufferView(data)
+    shift = 0
     if udhPresent:
         # User Data Header is present
-        result['udh'] = []
-        udhLen = next(byteIter)
-        ieLenRead = 0
-        # Parse and store UDH fields
-        while ieLenRead < udhLen:
-            ie = InformationElement.decode(byteIter)
-            ieLenRead += len(ie)
-            result['udh'].append(ie)
-        del ieLenRead
+        udhLen = data[offset]
+        result['udh'], offset = _decodeUdhAt(data, offset)
         if dataCoding == 0x00: # GSM-7
             # Since we are using 7-bit data, "fill bits" may have been added to make the UDH end on a septet boundary
             shift = ((udhLen + 1) * 8) % 7 # "fill bits" needed to make the UDH end on a septet boundary
-            # Simulate another "shift" in the unpackSeptets algorithm in order to ignore the fill bits
-            prevOctet = next(byteIter)
-            shift += 1
+            if shift:
+                # Simulate another "shift" in the unpackSeptets algorithm in order to ignore the fill bits
+                if offset >= len(data):
+                    raise EncodingError('User data is truncated')
+                prevOctet = data[offset]
+                offset += 1
+                shift += 1
 
     if dataCoding == 0x00: # GSM-7
+        if shift:
+            userDataSeptets = unpackSeptets(data[offset:offset + userDataLen], userDataLen, prevOctet, shift)
+        else:
+            userDataSeptets = unpackSeptets(data[offset:offset + userDataLen], userDataLen)
         if udhPresent:
-            userDataSeptets = unpackSeptets(byteIter, userDataLen, prevOctet, shift)
+            result['text'] = decodeGsm7(userDataSeptets, *result['udh'].languageShift)
         else:
-            userDataSeptets = unpackSeptets(byteIter, userDataLen)
-        result['text'] = decodeGsm7(userDataSeptets)
+            result['text'] = decodeGsm7(userDataSeptets)
     elif dataCoding == 0x02: # UCS2
-        result['text'] = decodeUcs2(byteIter, userDataLen)
+        result['text'] = decodeUcs2(view[offset:], userDataLen)
     else: # 8-bit (data)
-        userData = []
-        for b in byteIter:
-            userData.append(unichr(b))
-        result['text'] = ''.join(userData)
+        result['text'] = bytes(view[offset:])
     return result
 
+def _decodeUdhAt(data, offset):
+    """ Decodes the User Data Header at the specified offset (i.e. at its length octet)
+
+    :raise EncodingError: If the User Data Header is truncated, or a recognized IE has an invalid length
+
+    :return: Tuple containing the User Data Header, and the offset just after the header
+    :rtype: tuple
+    """
+    try:
+        udhEnd = offset + 1 + data[offset]
+        offset += 1
+        index = []
+        while offset < udhEnd:
+            iei = data[offset]
+            ieLen = data[offset + 1]
+            ieEnd = offset + 2 + ieLen
+            if ieEnd > len(data):
+                raise IndexError
+            lengths = _IEI_DATA_LENGTHS.get(iei)
+            if lengths != None and (ieLen < lengths[0] or (lengths[1] != None and ieLen > lengths[1])):
+                raise EncodingError('Invalid length for information element 0x{0:02X}: {1}'.format(iei, ieLen))
+            index.append((iei, offset + 2, ieLen))
+            offset = ieEnd
+    except IndexError:
+        raise EncodingError('User Data Header is truncated')
+    return UserDataHeader(data, index), offset
+
 def _decodeRelativeValidityPeriod(tpVp):
     """ Calculates the relative SMS validity period (based on the table in section 9.2.3.12 of GSM 03.40)
     :rtype: datetime.timedelta
@@ -523,7 +943,41 @@ def _encodeRelativeValidityPeriod(validityPeriod):
 
 def _decodeTimestamp(byteIter):
     """ Decodes a 7-octet timestamp """
-    dateStr = decodeSemiOctets(byteIter, 7)
+    return _decodeTimestampAt(toByteArray(byteIter) if type(byteIter) in (str, bytes) else bytearray(islice(byteIter, 7)), 0)
+
+# Values of semi-octet encoded 2-digit decimal numbers (key: octet; None if not decimal)
+_SEMI_OCTET_VALUES = [(octet & 0x0F) * 10 + (octet >> 4) if (octet & 0x0F) <= 9 and (octet >> 4) <= 9 else None for octet in xrange(256)]
+# Shared tzinfo instances for PDU time zone octets (key: octet)
+_PDU_TIMEZONES = {}
+
+def _pduTimezone(octet):
+    """ :return: A shared tzinfo instance for the specified timestamp time zone octet
+    :rtype: datetime.tzinfo
+    """
+    tz = _PDU_TIMEZONES.get(octet)
+    if tz == None:
+        # Semi-octets: the low nibble holds the first digit
+        offset = SmsPduTzInfo('{0:x}{1:x}'.format(octet & 0x0F, octet >> 4)).utcoffset(None)
+        tz = _PDU_TIMEZONES[octet] = fixedOffsetTimezone(offset.days * 1440 + offset.seconds // 60)
+    return tz
+
+def _decodeTimestampAt(data, offset):
+    """ Decodes the 7-octet timestamp at the specified offset (None if the offset is None) """
+    if offset == None:
+        return None
+    octets = data[offset:offset + 7]
+    if len(octets) == 7 and octets[6] < 0xF0:
+        values = [_SEMI_OCTET_VALUES[octet] for octet in octets[:6]]
+        if None not in values:
+            year, month, day, hour, minute, second = values
+            if 1 <= month <= 12 and 1 <= day <= 31 and hour <= 23 and minute <= 59 and second <= 59:
+                try:
+                    # Two-digit years are interpreted as by datetime.strptime()
+                    return datetime(year + (2000 if year < 69 else 1900), month, day, hour, minute, second, tzinfo=_pduTimezone(octets[6]))
+                except ValueError:
+                    pass
+    # Invalid (or truncated) timestamp: parse it in the same way as the semi-octet string
+    dateStr = decodeSemiOctets(octets, 7)
     timeZoneStr = dateStr[-2:]
     return datetime.strptime(dateStr[:-2], '%y%m%d%H%M%S').replace(tzinfo=SmsPduTzInfo(timeZoneStr))
 
@@ -576,30 +1030,63 @@ def _decodeAddressField(byteIter, smscField=False, log=False):
     :rtype: tuple
     """
     addressLen = next(byteIter)
+    if addressLen == 0:
+        return (None, 1)
+    toa = next(byteIter)
+    field = bytearray((addressLen, toa))
+    if smscField and toa & 0x70 != 0x50:
+        field.extend(islice(byteIter, addressLen - 1))
+    else:
+        field.extend(islice(byteIter, nibble2octet(addressLen)))
+    return _decodeAddressFieldAt(field, 0, smscField)
+
+def _decodeAddressFieldAt(data, offset, smscField=False):
+    """ Decodes the address field at the specified offset
+
+    :param data: The PDU data
+    :type data: bytearray
+    :param offset: The offset of the address field (i.e. of its length octet)
+    :type offset: int
+
+    :return: Tuple containing the address value and the length of the field (value is or None if it is empty (zero-length))
+    :rtype: tuple
+    """
+    addressLen = data[offset]
     if addressLen > 0:
-        toa = next(byteIter)
+        toa = data[offset + 1]
         ton = (toa & 0x70) # bits 6,5,4 of type-of-address == type-of-number
+        offset += 2
         if ton == 0x50:
             # Alphanumberic number
             addressLen = nibble2octet(addressLen)
-            septets = unpackSeptets(byteIter, addressLen)
+            septets = unpackSeptets(data[offset:offset + addressLen], addressLen)
             addressValue = decodeGsm7(septets)
             return (addressValue, (addressLen + 2))
         else:
             # ton == 0x00: Unknown (might be international, local, etc) - leave as is
             # ton == 0x20: National number
             if smscField:
-                addressValue = decodeSemiOctets(byteIter, addressLen-1)
+                addressLen -= 1
             else:
                 addressLen = nibble2octet(addressLen)
-                addressValue = decodeSemiOctets(byteIter, addressLen)
-                addressLen += 1 # for the return value, add the toa byte
+            addressValue = decodeSemiOctets(data[offset:offset + addressLen], addressLen)
             if ton == 0x10: # International number
                 addressValue = '+' + addressValue
-            return (addressValue, (addressLen + 1))
+            return (addressValue, (addressLen + 2))
     else:
         return (None, 1)
 
+def _addressFieldLength(data, offset, smscField=False):
+    """ :return: The length (in octets) of the address field at the specified offset (as read by _decodeAddressField())
+    :rtype: int
+    """
+    addressLen = data[offset]
+    if addressLen == 0:
+        return 1
+    if smscField and data[offset + 1] & 0x70 != 0x50:
+        return addressLen + 1
+    return nibble2octet(addressLen) + 2
+
 def _encodeAddressField(address, smscField=False):
     """ Encodes the address into an address field
 
@@ -659,33 +1146,36 @@ def encodeSemiOctets(number):
     octets = [int(number[i+1] + number[i], 16) for i in xrange(0, len(number), 2)]
     return bytearray(octets)
 
+# Translation table that swaps the two semi-octets of an octet
+_SWAP_SEMI_OCTETS = bytes(bytearray(((b & 0x0F) << 4) | (b >> 4) for b in xrange(256)))
+
 def decodeSemiOctets(encodedNumber, numberOfOctets=None):
     """ Semi-octet decoding algorithm(e.g. for phone numbers)
 
     :param encodedNumber: The semi-octet-encoded telephone number (in bytearray format or hex string)
-    :type encodedNumber: bytearray, str or iter(bytearray)
+    :type encodedNumber: bytearray, memoryview, str or iter(bytearray)
     :param numberOfOctets: The expected amount of octets after decoding (i.e. when to stop)
     :type numberOfOctets: int
 
     :return: decoded telephone number
     :rtype: string
     """
-    number = []
-    if type(encodedNumber) in (str, bytes):
-        encodedNumber = bytearray(codecs.decode(encodedNumber, 'hex_codec'))
-    i = 0
-    for octet in encodedNumber:
-        hexVal = hex(octet)[2:].zfill(2)
-        number.append(hexVal[1])
-        if hexVal[0] != 'f':
-            number.append(hexVal[0])
+    if type(encodedNumber) != bytearray:
+        if type(encodedNumber) in (str, bytes):
+            encodedNumber = toByteArray(encodedNumber)
+        elif type(encodedNumber) == memoryview:
+            encodedNumber = bytearray(encodedNumber)
         else:
-            break
-        if numberOfOctets != None:
-            i += 1
-            if i == numberOfOctets:
-                break
-    return ''.join(number)
+            # Do not consume more of the iterator than required
+            encodedNumber = bytearray(islice(encodedNumber, numberOfOctets or None))
+    if numberOfOctets:
+        encodedNumber = encodedNumber[:numberOfOctets]
+    # Swap the semi-octets of every octet, and stop at the first "end" indicator (an F in the upper semi-octet)
+    digits = binascii.hexlify(encodedNumber.translate(_SWAP_SEMI_OCTETS)).decode('ascii')
+    end = digits.find('f', 1)
+    while end & 1 == 0:
+        end = digits.find('f', end + 1)
+    return digits[:end] if end != -1 else digits
 
 def encodeTextMode(plaintext):
     """ Text mode checker
@@ -705,10 +1195,7 @@ def encodeTextMode(plaintext):
         plaintext = plaintext.decode('UTF-8')
 
     for char in plaintext:
-        idx = TEXT_MODE.find(char)
-        if idx != -1:
-            continue
-        else:
+        if char not in TEXT_MODE_CHARS:
             raise ValueError('Cannot encode char "{0}" inside text mode'.format(char))
 
     if len(plaintext) > MAX_MESSAGE_LENGTH[0x00]:
@@ -716,7 +1203,7 @@ def encodeTextMode(plaintext):
 
     return plaintext
 
-def encodeGsm7(plaintext, discardInvalid=False):
+def encodeGsm7(plaintext, discardInvalid=False, lockingShift=0, singleShift=0):
     """ GSM-7 text encoding algorithm
 
     Encodes the specified text string into GSM-7 octets (characters). This method does not pack
@@ -724,53 +1211,87 @@ def encodeGsm7(plaintext, discardInvalid=False):
 
     :param text: the text string to encode
     :param discardInvalid: if True, characters that cannot be encoded will be silently discarded
+    :param lockingShift: the national language locking shift table to use instead of the default alphabet (0: none)
+    :type lockingShift: int
+    :param singleShift: the national language single shift table to use instead of the extension table (0: none)
+    :type singleShift: int
 
     :raise ValueError: if the text string cannot be encoded using GSM-7 encoding (unless discardInvalid == True)
 
     :return: A bytearray containing the string encoded in GSM-7 encoding
     :rtype: bytearray
     """
-    result = bytearray()
     if PYTHON_VERSION >= 3:
         plaintext = str(plaintext)
     elif type(plaintext) == str:
         plaintext = plaintext.decode('UTF-8')
 
-    for char in plaintext:
-        idx = GSM7_BASIC.find(char)
-        if idx != -1:
-            result.append(idx)
-        elif char in GSM7_EXTENDED:
-            result.append(0x1B) # ESC - switch to extended table
-            result.append(ord(GSM7_EXTENDED[char]))
-        elif not discardInvalid:
-            raise ValueError('Cannot encode char "{0}" using GSM-7 encoding'.format(char))
-    return result
-
-def decodeGsm7(encodedText):
+    translateTable = _gsm7TranslateTable(lockingShift, singleShift) if lockingShift or singleShift else _GSM7_TRANSLATE_TABLE
+    try:
+        return bytearray(plaintext.translate(translateTable).encode('ascii'))
+    except UnicodeEncodeError:
+        # Not all characters are in the GSM-7 tables
+        validChars = []
+        for char in plaintext:
+            if translateTable.get(ord(char), '\x80') != '\x80':
+                validChars.append(char)
+            elif not discardInvalid:
+                raise ValueError('Cannot encode char "{0}" using GSM-7 encoding'.format(char))
+        return bytearray(''.join(validChars).translate(translateTable).encode('ascii'))
+
+def _gsm7TranslateTable(lockingShift, singleShift):
+    """ :return: The encoding table (as _GSM7_TRANSLATE_TABLE) for the specified national language tables
+    (unknown languages are replaced by the default tables)
+    :rtype: dict
+    """
+    key = (lockingShift, singleShift)
+    table = _GSM7_NATIONAL_TRANSLATE_TABLES.get(key)
+    if table == None:
+        extendedCodes = GSM7_NATIONAL_SINGLE_SHIFT.get(singleShift, GSM7_EXTENDED_CODES)
+        table = dict((ord(char), '\x1b' + unichr(code)) for char, code in dictItemsIter(extendedCodes))
+        for idx, char in enumerate(GSM7_NATIONAL_LOCKING_SHIFT.get(lockingShift, GSM7_BASIC)):
+            table[ord(char)] = unichr(idx)
+        # An ESC character in the text itself could not be told apart from the single shift ones when dividing the text
+        table[0x1B] = '\x80'
+        for idx in xrange(128):
+            table.setdefault(idx, '\x80')
+        _GSM7_NATIONAL_TRANSLATE_TABLES[key] = table
+    return table
+
+def decodeGsm7(encodedText, lockingShift=0, singleShift=0):
     """ GSM-7 text decoding algorithm
 
     Decodes the specified GSM-7-encoded string into a plaintext string.
 
     :param encodedText: the text string to encode
     :type encodedText: bytearray or str
+    :param lockingShift: the national language locking shift table the text was encoded with (0 or unknown: the default alphabet)
+    :type lockingShift: int
+    :param singleShift: the national language single shift table the text was encoded with (0 or unknown: the extension table)
+    :type singleShift: int
 
     :return: A string containing the decoded text
     :rtype: str
     """
-    result = []
     if type(encodedText) == str:
         encodedText = rawStrToByteArray(encodedText) #bytearray(encodedText)
-    iterEncoded = iter(encodedText)
-    for b in iterEncoded:
-        if b == 0x1B: # ESC - switch to extended table
-            c = chr(next(iterEncoded))
-            for char, value in dictItemsIter(GSM7_EXTENDED):
-                if c == value:
-                    result.append(char)
-                    break
+    decodeTable = _GSM7_NATIONAL_DECODE_TABLES.get(lockingShift, GSM7_DECODE_TABLE)
+    if 0x1B not in encodedText:
+        return codecs.charmap_decode(encodedText, 'strict', decodeTable)[0]
+    extendedDecode = _GSM7_NATIONAL_EXTENDED_DECODE.get(singleShift, GSM7_EXTENDED_DECODE)
+    result = []
+    escaped = False
+    for b in encodedText:
+        if escaped:
+            # Extended table character (unknown extended characters are discarded)
+            escaped = False
+            char = extendedDecode.get(b)
+            if char != None:
+                result.append(char)
+        elif b == 0x1B: # ESC - switch to extended table
+            escaped = True
         else:
-            result.append(GSM7_BASIC[b])
+            result.append(decodeTable[b])
     return ''.join(result)
 
 def divideTextGsm7(plainText):
@@ -794,13 +1315,10 @@ def divideTextGsm7(plainText):
         plainText = str(plainText)
     while plainStopPtr < len(plainText):
         char = plainText[plainStopPtr]
-        idx = GSM7_BASIC.find(char)
-        if idx != -1:
-            chunkByteSize = chunkByteSize + 1;
-        elif char in GSM7_EXTENDED:
-            chunkByteSize = chunkByteSize + 2;
-        else:
+        charSize = GSM7_CHAR_SIZE.get(char)
+        if charSize == None:
             raise ValueError('Cannot encode char "{0}" using GSM-7 encoding'.format(char))
+        chunkByteSize = chunkByteSize + charSize
 
         plainStopPtr = plainStopPtr + 1
         if chunkByteSize > MAX_MULTIPART_MESSAGE_LENGTH[0x00]:
@@ -816,6 +1334,108 @@ def divideTextGsm7(plainText):
 
     return result
 
+def _divideEncodedGsm7(plainText, encodedText, maxLength=MAX_MULTIPART_MESSAGE_LENGTH[0x00]):
+    """ Divides GSM-7 encoded text into chunks, as divideTextGsm7() divides the plain text
+
+    :param plainText: the text string
+    :type plainText: str
+    :param encodedText: the text string encoded with encodeGsm7()
+    :type encodedText: bytearray
+    :param maxLength: the maximum number of septets per chunk
+    :type maxLength: int
+
+    :return: A list of bytearrays
+    :rtype: list of bytearray
+    """
+    if '\x1b' in plainText:
+        # An escape character in the text itself cannot be told apart from the extended table ones
+        return [encodeGsm7(part) for part in divideTextGsm7(plainText)]
+    result = []
+    start = 0
+    while start < len(encodedText):
+        end = start + maxLength
+        if end < len(encodedText) and encodedText[end - 1] == 0x1B:
+            end -= 1 # Do not split an extended character (ESC + code)
+        result.append(encodedText[start:end])
+        start = end
+    return result
+
+def _encodeGsm7National(plainText, maxParts, languages):
+    """ Encodes text using the combination of national language shift tables that divides it into the fewest message parts
+
+    Every national language table takes up 3 octets of the User Data Header of each message part.
+    If several combinations result in the same number of parts, the one with the fewest tables is used.
+
+    :param plainText: the text string to encode
+    :type plainText: str
+    :param maxParts: only use national language tables if the text is divided into fewer parts than this
+    :type maxParts: int
+    :param languages: the national languages whose tables may be used
+    :type languages: sequence of int
+
+    :return: Tuple containing the locking shift and single shift languages (0: default table), and the encoded text
+             divided into parts; or None if the text cannot be encoded into fewer than maxParts parts
+    :rtype: tuple
+    """
+    textChars = set(plainText)
+    if not textChars.issubset(_GSM7_NATIONAL_CHARS):
+        return None # e.g. Chinese or Cyrillic text
+    best = None
+    lockingShifts = [0] + [language for language in languages if language in GSM7_NATIONAL_LOCKING_SHIFT]
+    singleShifts = [0] + [language for language in languages if language in GSM7_NATIONAL_SINGLE_SHIFT]
+    for lockingShift in lockingShifts:
+        for singleShift in singleShifts:
+            if not (lockingShift or singleShift):
+                continue # the default alphabet
+            translateTable = _gsm7TranslateTable(lockingShift, singleShift)
+            if any(translateTable.get(ord(char), '\x80') == '\x80' for char in textChars):
+                continue # cannot be encoded with these tables
+            encodedText = bytearray(plainText.translate(translateTable).encode('ascii'))
+            languageHeaderLength = 3 * ((lockingShift != 0) + (singleShift != 0))
+            if len(encodedText) <= _maxGsm7Septets(languageHeaderLength):
+                parts = [encodedText]
+            else:
+                parts = _divideEncodedGsm7(plainText, encodedText, _maxGsm7Septets(languageHeaderLength + 5)) # +5 for the concatenation IE
+            if len(parts) < maxParts and (best == None or (len(parts), languageHeaderLength) < best[0]):
+                best = ((len(parts), languageHeaderLength), lockingShift, singleShift, parts)
+    return best[1:] if best != None else None
+
+def _maxGsm7Septets(ieLength):
+    """ :return: The maximum number of GSM-7 characters (septets) that fit into a PDU whose User Data Header
+    contains IEs with the specified total length (in octets; 0 if there is no UDH)
+    :rtype: int
+    """
+    if ieLength == 0:
+        return MAX_MESSAGE_LENGTH[0x00]
+    return (MAX_MESSAGE_LENGTH[0x04] - ieLength - 1) * 8 // 7 # -1 for the UDH length indicator byte
+
+# Bit masks used to pack/unpack septets a block at a time (key: number of septets); see _septetMasks()
+_SEPTET_MASKS = {}
+
+def _septetMasks(numSeptets):
+    """ Returns the bit masks for packing (or unpacking) the specified number of septets held in a big integer
+
+    Packing starts with one septet per 8-bit lane; every step merges pairs of adjacent lanes by
+    shifting the upper lane's bits down onto the lower lane's bits, doubling the lane width until
+    a single lane remains (i.e. log2(numSeptets) steps, each a handful of big integer operations).
+
+    :return: list of (lower mask, upper mask, shift distance) tuples, one per packing step
+    """
+    masks = _SEPTET_MASKS.get(numSeptets)
+    if masks == None:
+        masks = []
+        laneBits, usedBits, totalBits = 8, 7, numSeptets * 8
+        while laneBits < totalBits:
+            pairBits = laneBits * 2
+            pairs = -(-totalBits // pairBits)
+            repeat = ((1 << (pairBits * pairs)) - 1) // ((1 << pairBits) - 1) # 1 in the lowest bit of every pair of lanes
+            lowMask = ((1 << usedBits) - 1) * repeat
+            masks.append((lowMask, lowMask << laneBits, laneBits - usedBits))
+            laneBits, usedBits = pairBits, usedBits * 2
+        if len(_SEPTET_MASKS) < 1024:
+            _SEPTET_MASKS[numSeptets] = masks
+    return masks
+
 def packSeptets(octets, padBits=0):
     """ Packs the specified octets into septets
 
@@ -824,33 +1444,20 @@ def packSeptets(octets, padBits=0):
 
     :rtype: bytearray
     """
-    result = bytearray()
     if type(octets) == str:
-        octets = iter(rawStrToByteArray(octets))
-    elif type(octets) == bytearray:
-        octets = iter(octets)
-    shift = padBits
-    if padBits == 0:
-        try:
-            prevSeptet = next(octets)
-        except StopIteration:
-            return result
-    else:
-        prevSeptet = 0x00
-    for octet in octets:
-        septet = octet & 0x7f;
-        if shift == 7:
-            # prevSeptet has already been fully added to result
-            shift = 0
-            prevSeptet = septet
-            continue
-        b = ((septet << (7 - shift)) & 0xFF) | (prevSeptet >> shift)
-        prevSeptet = septet
-        shift += 1
-        result.append(b)
-    if shift != 7:
-        # There is a bit "left over" from prevSeptet
-        result.append(prevSeptet >> shift)
+        octets = rawStrToByteArray(octets)
+    elif type(octets) != bytearray:
+        octets = bytearray(octets)
+    if padBits:
+        # Equivalent to packing (padBits + 1) extra leading zero septets, and dropping the padBits octets holding only those
+        octets = bytearray(padBits + 1) + octets
+    numSeptets = len(octets)
+    value = bytesToIntLE(octets) & bytesToIntLE(b'\x7f' * numSeptets)
+    for lowMask, highMask, distance in _septetMasks(numSeptets):
+        value = (value & lowMask) | ((value & highMask) >> distance)
+    result = intToBytesLE(value, (numSeptets * 7 + 7) // 8)
+    if padBits:
+        del result[:padBits]
     return result
 
 def unpackSeptets(septets, numberOfSeptets=None, prevOctet=None, shift=7):
@@ -864,78 +1471,87 @@ def unpackSeptets(septets, numberOfSeptets=None, prevOctet=None, shift=7):
     :return: The septets unpacked into octets
     :rtype: bytearray
     """
-    result = bytearray()
+    if numberOfSeptets == 0:
+        return bytearray()
     if type(septets) == str:
-        septets = iter(rawStrToByteArray(septets))
+        data = rawStrToByteArray(septets)
     elif type(septets) == bytearray:
-        septets = iter(septets)
-    if numberOfSeptets == None:
-        numberOfSeptets = MAX_INT # Loop until StopIteration
-    if numberOfSeptets == 0:
-        return result
-    i = 0
-    for octet in septets:
-        i += 1
-        if shift == 7:
-            shift = 1
-            if prevOctet != None:
-                result.append(prevOctet >> 1)
-            if i <= numberOfSeptets:
-                result.append(octet & 0x7F)
-                prevOctet = octet
-            if i == numberOfSeptets:
-                break
-            else:
-                continue
-        b = ((octet << shift) & 0x7F) | (prevOctet >> (8 - shift))
-
-        prevOctet = octet
-        result.append(b)
-        shift += 1
-
-        if i == numberOfSeptets:
-            break
-    if shift == 7 and prevOctet:
-        b = prevOctet >> (8 - shift)
-        if b:
-            # The final septet value still needs to be unpacked
-            result.append(b)
+        data = septets
+    else:
+        # Do not consume more of the iterator than required
+        data = bytearray(islice(septets, numberOfSeptets))
+    if numberOfSeptets != None:
+        data = data[:numberOfSeptets]
+    if prevOctet != None:
+        # Continue unpacking from a previously read octet, of which only the top "shift" bits are still to be unpacked
+        numBits = len(data) * 8 + shift
+        value = bytesToIntLE(bytearray([prevOctet]) + data) >> (8 - shift)
+    else:
+        numBits = len(data) * 8
+        value = bytesToIntLE(data)
+    numSeptets = numBits // 7
+    value &= (1 << (numSeptets * 7)) - 1
+    for lowMask, highMask, distance in reversed(_septetMasks(numSeptets)):
+        value = (value & lowMask) | ((value & (highMask >> distance)) << distance)
+    result = intToBytesLE(value, numSeptets)
+    if numBits % 7 == 0 and numSeptets > 0 and result[-1] == 0:
+        # The final septet is just the unused top bits of the last octet
+        result.pop()
     return result
 
 def decodeUcs2(byteIter, numBytes):
-    """ Decodes UCS2-encoded text from the specified byte iterator, up to a maximum of numBytes """
-    userData = []
-    i = 0
-    try:
-        while i < numBytes:
-            userData.append(unichr((next(byteIter) << 8) | next(byteIter)))
-            i += 2
-    except StopIteration:
-        # Not enough bytes in iterator to reach numBytes; return what we have
-        pass
-    return ''.join(userData)
+    """ Decodes UCS2-encoded text from the specified byte iterator (or bytearray/memoryview), up to a maximum of numBytes
+
+    Surrogate pairs are combined into a single character; lone surrogates are kept as they are.
+    """
+    numBytes += numBytes & 1 # The last character is not cut in half
+    if type(byteIter) not in (bytearray, memoryview):
+        byteIter = bytearray(islice(byteIter, numBytes))
+    # Not enough bytes to reach numBytes; use what we have
+    numBytes = min(numBytes, len(byteIter)) & ~1
+    return codecs.decode(byteIter[:numBytes], 'utf-16-be', UCS2_ERRORS)
 
 def encodeUcs2(text):
     """ UCS2 text encoding algorithm
 
-    Encodes the specified text string into UCS2-encoded bytes.
+    Encodes the specified text string into UCS2-encoded bytes. Characters outside the Basic
+    Multilingual Plane (e.g. emoji) are encoded as UTF-16 surrogate pairs.
 
     :param text: the text string to encode
 
     :return: A bytearray containing the string encoded in UCS2 encoding
     :rtype: bytearray
     """
-    result = bytearray()
+    return bytearray(text.encode('utf-16-be', UCS2_ERRORS))
+
+def _divideEncodedUcs2(encodedText):
+    """ Divides UCS2-encoded text into chunks that fit into a single concatenated SMS message each
 
-    for b in map(ord, text):
-        result.append(b >> 8)
-        result.append(b & 0xFF)
+    Chunks never end with the high surrogate of a surrogate pair, so the parts can be decoded separately.
+
+    :param encodedText: the UCS2-encoded text
+    :type encodedText: bytearray
+
+    :return: A list of UCS2-encoded chunks
+    :rtype: list of bytearray
+    """
+    result = []
+    maxLength = MAX_MULTIPART_MESSAGE_LENGTH[0x08] * 2
+    length = len(encodedText)
+    start = 0
+    while start < length:
+        end = start + maxLength
+        if end < length and 0xD8 <= encodedText[end - 2] <= 0xDB:
+            end -= 2 # Keep the surrogate pair together
+        result.append(encodedText[start:end])
+        start = end
     return result
 
 def divideTextUcs2(plainText):
     """ UCS-2 message dividing algorithm
 
     Divides text into list of chunks that could be stored in a single, UCS-2 -encoded SMS message.
+    Surrogate pairs (e.g. emoji) are never split across chunks.
 
     :param plainText: the text string to divide
     :type plainText: str
@@ -943,16 +1559,4 @@ def divideTextUcs2(plainText):
     :return: A list of strings
     :rtype: list of str
     """
-    result = []
-    resultLength = 0
-
-    fullChunksCount = int(len(plainText) / MAX_MULTIPART_MESSAGE_LENGTH[0x08])
-    for i in range(fullChunksCount):
-        result.append(plainText[i * MAX_MULTIPART_MESSAGE_LENGTH[0x08] : (i + 1) * MAX_MULTIPART_MESSAGE_LENGTH[0x08]])
-        resultLength  = resultLength + MAX_MULTIPART_MESSAGE_LENGTH[0x08]
-
-    # Add last, not fully filled chunk
-    if resultLength < len(plainText):
-        result.append(plainText[resultLength:])
-
-    return result
+    return [decodeUcs2(part, len(part)) for part in _divideEncodedUcs2(encodeUcs2(plainText))]
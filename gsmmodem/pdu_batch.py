@@ -0,0 +1,396 @@
+# -*- coding: utf8 -*-
+
+""" Batch SMS PDU encoding and decoding
+
+Encodes or decodes many SMS PDUs in one call, e.g. for re-processing message archives or
+preparing bulk campaigns. If NumPy is installed, the heavy lifting of decoding (septet
+unpacking, semi-octet decoding of addresses and timestamps, and UCS-2 conversion) is done
+with vectorized operations over all PDUs at once; otherwise the scalar functions in
+gsmmodem.pdu are used. Either way, the results are identical to those of decodeSmsPdu()
+and encodeSmsSubmitPdu().
+"""
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from .pdu import PYTHON_VERSION, GSM7_BASIC, GSM7_NATIONAL_LANGUAGES, PduTemplate, \
+    decodeSmsPdu, toByteArray, nibble2octet, unpackSeptets, decodeGsm7, decodeUcs2, \
+    _decodeDataCoding, _decodeRelativeValidityPeriod, _encodeAddressField, _pduTimezone, _decodeUdhAt
+
+try:
+    import numpy
+except ImportError: # NumPy is optional
+    numpy = None
+
+NUMPY_AVAILABLE = numpy != None
+
+
+def decodeSmsPdus(pdus, useNumpy=None):
+    """ Decodes a sequence of SMS PDUs
+
+    The results are the same as calling gsmmodem.pdu.decodeSmsPdu() for each PDU.
+
+    :param pdus: The PDUs to decode (as hex strings, or bytearrays containing PDU octets)
+    :type pdus: iterable of str or bytearray
+    :param useNumpy: Use NumPy to decode the PDUs (default: if it is installed)
+    :type useNumpy: bool
+
+    :raise EncodingError: If a PDU cannot be decoded (as for decodeSmsPdu(), for the first such PDU)
+    :raise ImportError: If useNumpy is True, but NumPy is not installed
+
+    :return: The decoded SMS data of each PDU (in the same order as "pdus")
+    :rtype: list of dict
+    """
+    if not _useNumpy(useNumpy):
+        return [decodeSmsPdu(pdu) for pdu in pdus]
+    return _BatchDecoder(list(pdus)).decode()
+
+def encodeSmsSubmitPdus(numbers, text, reference=0, validity=None, smsc=None, requestStatusReport=True, rejectDuplicates=False, sendFlash=False, nationalLanguages=GSM7_NATIONAL_LANGUAGES, useNumpy=None):
+    """ Creates the SMS-SUBMIT PDUs for sending messages to many numbers
+
+    The results are the same as calling gsmmodem.pdu.encodeSmsSubmitPdu() for each number, but
+    every distinct message text is only encoded once (see gsmmodem.pdu.PduTemplate), and the
+    destination addresses are semi-octet encoded in bulk (if NumPy is used).
+
+    :param numbers: The destination mobile numbers
+    :type numbers: list of str
+    :param text: The message text (the same for all numbers), or a list with one text per number
+    :type text: str or list of str
+    :param reference: The message reference number (the same for all numbers), or a list with one per number
+    :type reference: int or list of int
+    :param useNumpy: Use NumPy to encode the destination addresses (default: if it is installed)
+    :type useNumpy: bool
+
+    See encodeSmsSubmitPdu() for the other parameters.
+
+    :return: The PDU(s) of each message (in the same order as "numbers")
+    :rtype: list of lists of gsmmodem.pdu.Pdu
+    """
+    numbers = list(numbers)
+    texts = [text] * len(numbers) if _isText(text) else list(text)
+    references = [reference] * len(numbers) if isinstance(reference, int) else list(reference)
+    if not len(numbers) == len(texts) == len(references):
+        raise ValueError('"text" and "reference" must have one entry per number')
+    if _useNumpy(useNumpy):
+        addresses = _encodeAddressFields(numbers)
+    else:
+        addresses = [_encodeAddressField(number) for number in numbers]
+    templates = {}
+    result = []
+    for address, text, reference in zip(addresses, texts, references):
+        template = templates.get(text)
+        if template == None:
+            template = templates[text] = PduTemplate(text, validity, smsc, requestStatusReport, rejectDuplicates, sendFlash, nationalLanguages)
+        result.append(template._encodeAddressed(address, reference))
+    return result
+
+def _useNumpy(useNumpy):
+    if useNumpy == None:
+        return NUMPY_AVAILABLE
+    if useNumpy and not NUMPY_AVAILABLE:
+        raise ImportError('NumPy is required for vectorized PDU processing, but it is not installed')
+    return useNumpy
+
+def _isText(text):
+    if PYTHON_VERSION >= 3:
+        return isinstance(text, str)
+    return isinstance(text, basestring)
+
+def _raggedRange(starts, lengths):
+    """ :return: The concatenated index ranges [start, start + length), and the offset of each range in the result """
+    lengths = numpy.asarray(lengths, dtype=numpy.intp)
+    offsets = numpy.cumsum(lengths) - lengths
+    indices = numpy.arange(int(lengths.sum()), dtype=numpy.intp) + numpy.repeat(numpy.asarray(starts, dtype=numpy.intp) - offsets, lengths)
+    return indices, offsets
+
+def _encodeAddressFields(numbers):
+    """ As gsmmodem.pdu._encodeAddressField(), for many destination numbers at once """
+    addresses = [None] * len(numbers)
+    digitRows, digits = [], []
+    for i, number in enumerate(numbers):
+        toa = 0xA1 if number.isdigit() else 0x91 if number[:1] == '+' and number[1:].isdigit() else None
+        if toa == None or not _isAscii(number):
+            # Alphanumeric (or otherwise unusual) address
+            addresses[i] = _encodeAddressField(number)
+        else:
+            if toa == 0x91:
+                number = number[1:]
+            digitRows.append((i, toa, len(number)))
+            digits.append(number if len(number) % 2 == 0 else number + 'F') # "end" indicator
+    if digitRows:
+        nibbles = numpy.frombuffer(''.join(digits).encode('ascii'), dtype=numpy.uint8) - ord('0')
+        nibbles[nibbles == ord('F') - ord('0')] = 0x0F
+        octets = ((nibbles[1::2] << 4) | nibbles[0::2]).tobytes()
+        offset = 0
+        for i, toa, numDigits in digitRows:
+            numOctets = (numDigits + 1) // 2
+            address = bytearray((numDigits, toa))
+            address.extend(octets[offset:offset + numOctets])
+            addresses[i] = address
+            offset += numOctets
+    return addresses
+
+def _isAscii(text):
+    try:
+        text.encode('ascii')
+    except UnicodeError:
+        return False
+    return True
+
+
+class _Irregular(Exception):
+    """ Raised for PDUs that must be decoded by the scalar decoder """
+
+
+class _BatchDecoder(object):
+    """ Decodes a batch of SMS PDUs with NumPy
+
+    The PDU headers are parsed one by one (by offset); the address, timestamp and user data
+    fields they point to are collected and decoded for all PDUs at once. PDUs with unusual
+    contents (invalid or truncated fields, which the scalar decoder reads in a particular
+    way) are decoded with decodeSmsPdu() instead, so that the results are always identical.
+    """
+
+    def __init__(self, pdus):
+        self.pdus = pdus
+        self.results = [None] * len(pdus)
+        self.fallback = set() # Indices of PDUs to decode with decodeSmsPdu()
+        # Fields to decode, as (PDU index, result dict, key, ...) tuples
+        self.semiOctets = []
+        self.timestamps = []
+        self.gsm7 = []
+        self.ucs2 = []
+
+    def decode(self):
+        chunks = []
+        base = 0
+        jobLists = (self.semiOctets, self.timestamps, self.gsm7, self.ucs2)
+        for i, pdu in enumerate(self.pdus):
+            jobCounts = [len(jobs) for jobs in jobLists]
+            try:
+                data = bytearray(toByteArray(pdu))
+                self.results[i] = self._parse(i, data, base)
+            except Exception:
+                # Discard the fields collected for this PDU
+                for jobs, count in zip(jobLists, jobCounts):
+                    del jobs[count:]
+                self.fallback.add(i)
+                continue
+            chunks.append(data)
+            base += len(data)
+        chunks.append(b'\x00') # Padding for reading septets 2 octets at a time
+        self.buffer = numpy.frombuffer(b''.join(chunks), dtype=numpy.uint8)
+        self._decodeSemiOctets()
+        self._decodeTimestamps()
+        self._decodeGsm7()
+        self._decodeUcs2()
+        for i in sorted(self.fallback):
+            self.results[i] = decodeSmsPdu(self.pdus[i])
+        return self.results
+
+    def _parse(self, row, data, base):
+        """ Parses a PDU's header (like decodeSmsPdu()), collecting the fields to decode
+
+        :return: The decoded SMS data (with placeholders for the collected fields)
+        :rtype: dict
+        """
+        result = {}
+        pos, smscBytesRead = self._parseAddress(row, data, 0, base, result, 'smsc', smscField=True)
+        result['tpdu_length'] = len(data) - smscBytesRead
+        tpduFirstOctet = data[pos]
+        pos += 1
+        pduType = tpduFirstOctet & 0x03 # bits 1-0
+        if pduType == 0x00: # SMS-DELIVER or SMS-DELIVER REPORT
+            result['type'] = 'SMS-DELIVER'
+            pos = self._parseAddress(row, data, pos, base, result, 'number')[0]
+            result['protocol_id'] = data[pos]
+            dataCoding = _decodeDataCoding(data[pos + 1])
+            pos = self._parseTimestamp(row, data, pos + 2, base, result, 'time')
+            self._parseUserData(row, data, pos, base, result, tpduFirstOctet, dataCoding)
+        elif pduType == 0x01: # SMS-SUBMIT or SMS-SUBMIT-REPORT
+            result['type'] = 'SMS-SUBMIT'
+            result['reference'] = data[pos]
+            pos = self._parseAddress(row, data, pos + 1, base, result, 'number')[0]
+            result['protocol_id'] = data[pos]
+            dataCoding = _decodeDataCoding(data[pos + 1])
+            pos += 2
+            validityPeriodFormat = (tpduFirstOctet & 0x18) >> 3 # bits 4,3
+            if validityPeriodFormat == 0x02: # relative
+                result['validity'] = _decodeRelativeValidityPeriod(data[pos])
+                pos += 1
+            elif validityPeriodFormat == 0x03: # absolute
+                pos = self._parseTimestamp(row, data, pos, base, result, 'validity')
+            self._parseUserData(row, data, pos, base, result, tpduFirstOctet, dataCoding)
+        elif pduType == 0x02: # SMS-STATUS-REPORT or SMS-COMMAND
+            result['type'] = 'SMS-STATUS-REPORT'
+            result['reference'] = data[pos]
+            pos = self._parseAddress(row, data, pos + 1, base, result, 'number')[0]
+            pos = self._parseTimestamp(row, data, pos, base, result, 'time')
+            pos = self._parseTimestamp(row, data, pos, base, result, 'discharge')
+            result['status'] = data[pos]
+        else:
+            raise _Irregular()
+        return result
+
+    def _parseAddress(self, row, data, pos, base, result, key, smscField=False):
+        """ :return: The position after the address field, and its length (as for _decodeAddressField()) """
+        addressLen = data[pos]
+        if addressLen == 0:
+            result[key] = None
+            return pos + 1, 1
+        ton = data[pos + 1] & 0x70 # bits 6,5,4 of type-of-address == type-of-number
+        if ton == 0x50:
+            # Alphanumeric address (short; decoded right away)
+            numOctets = nibble2octet(addressLen)
+            if pos + 2 + numOctets > len(data):
+                raise _Irregular()
+            result[key] = decodeGsm7(unpackSeptets(data[pos + 2:pos + 2 + numOctets], numOctets))
+            return pos + 2 + numOctets, numOctets + 2
+        if smscField:
+            numOctets = addressLen - 1
+            bytesRead = addressLen + 1
+        else:
+            numOctets = (addressLen + 1) // 2
+            bytesRead = numOctets + 2
+        if numOctets < 1 or pos + 2 + numOctets > len(data):
+            raise _Irregular()
+        result[key] = None
+        self.semiOctets.append((row, result, key, '+' if ton == 0x10 else '', base + pos + 2, numOctets))
+        return pos + 2 + numOctets, bytesRead
+
+    def _parseTimestamp(self, row, data, pos, base, result, key):
+        """ :return: The position after the timestamp """
+        if pos + 7 > len(data):
+            raise _Irregular()
+        result[key] = None
+        self.timestamps.append((row, result, key, base + pos))
+        return pos + 7
+
+    def _parseUserData(self, row, data, pos, base, result, tpduFirstOctet, dataCoding):
+        userDataLen = data[pos]
+        pos += 1
+        udhPresent = (tpduFirstOctet & 0x40) != 0
+        if udhPresent:
+            udhLen = data[pos]
+            result['udh'], pos = _decodeUdhAt(data, pos)
+        result['text'] = None
+        if dataCoding == 0x00: # GSM-7
+            shift = 0
+            if udhPresent:
+                # Skip the "fill bits" that make the UDH end on a septet boundary
+                shift = ((udhLen + 1) * 8) % 7
+                if shift:
+                    if pos >= len(data):
+                        raise _Irregular()
+                    pos += 1
+                    shift += 1
+            if userDataLen == 0:
+                result['text'] = ''
+                return
+            numOctets = max(min(userDataLen, len(data) - pos), 0)
+            startBit, numBits = pos * 8 - shift, numOctets * 8 + shift
+            languageShift = result['udh'].languageShift if udhPresent else (0, 0)
+            self.gsm7.append((row, result, (base * 8) + startBit, numBits, languageShift))
+        elif dataCoding == 0x02: # UCS2
+            self.ucs2.append((row, result, base + pos, max(min((userDataLen + 1) // 2, (len(data) - pos) // 2), 0)))
+        else: # 8-bit (data)
+            result['text'] = bytes(data[pos:])
+
+    def _decodeSemiOctets(self):
+        if not self.semiOctets:
+            return
+        rows, results, keys, prefixes, starts, lengths = zip(*self.semiOctets)
+        indices, offsets = _raggedRange(starts, lengths)
+        octets = self.buffer[indices]
+        highNibbles = octets >> 4
+        chars = numpy.empty(len(octets) * 2, dtype=numpy.uint8)
+        chars[0::2] = _HEX_DIGITS[octets & 0x0F]
+        chars[1::2] = _HEX_DIGITS[highNibbles]
+        text = chars.tobytes().decode('ascii')
+        # A high nibble of 0xF ends the number; it must be in the last octet
+        endMarkers = highNibbles == 0x0F
+        ends = offsets + numpy.asarray(lengths, dtype=numpy.intp)
+        markerCounts = _segmentCounts(endMarkers, offsets, ends)
+        terminated = endMarkers[ends - 1]
+        regular = (markerCounts == 0) | ((markerCounts == 1) & terminated)
+        for row, result, key, prefix, start, end, isRegular, isTerminated in zip(rows, results, keys, prefixes, offsets.tolist(), ends.tolist(), regular.tolist(), terminated.tolist()):
+            if isRegular:
+                result[key] = prefix + text[start * 2:end * 2 - isTerminated]
+            else:
+                self.fallback.add(row)
+
+    def _decodeTimestamps(self):
+        if not self.timestamps:
+            return
+        rows, results, keys, starts = zip(*self.timestamps)
+        octets = self.buffer[numpy.asarray(starts, dtype=numpy.intp)[:, None] + numpy.arange(7)]
+        lowNibbles, highNibbles = octets & 0x0F, octets >> 4
+        values = lowNibbles[:, :6].astype(numpy.intp) * 10 + highNibbles[:, :6]
+        regular = ((lowNibbles[:, :6] <= 9).all(axis=1) & (highNibbles[:, :6] <= 9).all(axis=1) & (highNibbles[:, 6] != 0x0F)
+                   & (values[:, 1] >= 1) & (values[:, 1] <= 12) & (values[:, 2] >= 1) & (values[:, 2] <= 31)
+                   & (values[:, 3] <= 23) & (values[:, 4] <= 59) & (values[:, 5] <= 59))
+        for row, result, key, (year, month, day, hour, minute, second), tzOctet, isRegular in zip(rows, results, keys, values.tolist(), octets[:, 6].tolist(), regular.tolist()):
+            if not isRegular:
+                self.fallback.add(row)
+                continue
+            try:
+                # Two-digit years are interpreted as by datetime.strptime()
+                result[key] = datetime(year + (2000 if year < 69 else 1900), month, day, hour, minute, second, tzinfo=_pduTimezone(tzOctet))
+            except ValueError:
+                self.fallback.add(row)
+
+    def _decodeGsm7(self):
+        if not self.gsm7:
+            return
+        rows, results, startBits, numBits, languageShifts = zip(*self.gsm7)
+        numBits = numpy.asarray(numBits, dtype=numpy.intp)
+        numSeptets = numBits // 7
+        septetIndices, offsets = _raggedRange(numpy.zeros(len(rows), dtype=numpy.intp), numSeptets)
+        ends = offsets + numSeptets
+        bitPositions = numpy.repeat(numpy.asarray(startBits, dtype=numpy.intp), numSeptets) + septetIndices * 7
+        octetPositions = bitPositions >> 3
+        words = self.buffer[octetPositions].astype(numpy.uint16) | (self.buffer[octetPositions + 1].astype(numpy.uint16) << 8)
+        septets = ((words >> (bitPositions & 7).astype(numpy.uint16)) & 0x7F).astype(numpy.uint8)
+        if len(septets):
+            # The final septet is just the unused top bits of the last octet (see unpackSeptets())
+            ends -= (numBits % 7 == 0) & (numSeptets > 0) & (septets[numpy.maximum(ends - 1, 0)] == 0)
+        text = _GSM7_CODE_POINTS[septets].astype('<u4').tobytes().decode('utf-32-le')
+        escapes = _segmentCounts(septets == 0x1B, offsets, ends)
+        for result, start, end, escaped, languageShift in zip(results, offsets.tolist(), ends.tolist(), escapes.tolist(), languageShifts):
+            if escaped or languageShift != (0, 0):
+                # Extension table characters, or national language tables
+                result['text'] = decodeGsm7(bytearray(septets[start:end].tobytes()), *languageShift)
+            else:
+                result['text'] = text[start:end]
+
+    def _decodeUcs2(self):
+        if not self.ucs2:
+            return
+        rows, results, starts, numChars = zip(*self.ucs2)
+        indices, offsets = _raggedRange(starts, numpy.asarray(numChars, dtype=numpy.intp) * 2)
+        octets = self.buffer[indices].astype(numpy.uint32)
+        codeUnits = (octets[0::2] << 8) | octets[1::2]
+        if PYTHON_VERSION >= 3:
+            # One character per code unit, so that every row's text can be sliced out
+            text = codeUnits.astype('<u4').tobytes().decode('utf-32-le', 'surrogatepass')
+        else: #pragma: no cover
+            text = ''.join([unichr(codeUnit) for codeUnit in codeUnits.tolist()])
+        offsets //= 2
+        # Rows containing surrogates are decoded separately, so that surrogate pairs are combined (as by decodeUcs2())
+        surrogates = _segmentCounts((codeUnits & 0xF800) == 0xD800, offsets, offsets + numpy.asarray(numChars, dtype=numpy.intp))
+        for result, start, length, surrogate in zip(results, offsets.tolist(), numChars, surrogates.tolist()):
+            if surrogate:
+                result['text'] = decodeUcs2(bytearray(codeUnits[start:start + length].astype('>u2').tobytes()), length * 2)
+            else:
+                result['text'] = text[start:start + length]
+
+
+def _segmentCounts(flags, starts, ends):
+    """ :return: The number of set flags in each [start, end) segment of the flags array """
+    counts = numpy.concatenate(([0], numpy.cumsum(flags, dtype=numpy.intp)))
+    return counts[ends] - counts[starts]
+
+if NUMPY_AVAILABLE:
+    _HEX_DIGITS = numpy.frombuffer(b'0123456789abcdef', dtype=numpy.uint8)
+    _GSM7_CODE_POINTS = numpy.array([ord(char) for char in GSM7_BASIC], dtype=numpy.uint32)
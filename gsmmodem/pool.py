@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+
+""" Load-aware distribution of outgoing SMS messages across a pool of modems """
+
+import time, threading, logging
+
+from .exceptions import GsmModemException, TimeoutException, NoModemAvailableError
+from .pdu import PduTemplate
+
+
+class ModemPool(object):
+    """ A pool of GSM modems (SIMs) that outgoing SMS messages are distributed over
+
+    Every sendSms() call is routed to the modem that is expected to submit the message soonest,
+    based on each modem's live load:
+
+    - the number of messages currently being submitted through it (queue depth),
+    - its recent submission latency (exponentially weighted moving average),
+    - its recent error rate (CMS errors and timeouts),
+    - its cellular signal strength (cached; refreshed at most every "signalRefreshInterval" seconds), and
+    - its SIM's quota (modems that have used up their quota for the current period are skipped).
+
+    If a modem times out (or fails to submit the message), it is backed off for a while. The
+    message is failed over to the next best modem only if it has definitely not been submitted
+    (see the "smsSubmitted" attribute of the exceptions raised by GsmModem.sendSms()); otherwise
+    the error is raised, so that the message is not sent twice. Each modem serializes its own AT
+    commands, so sendSms() should be called from several threads to send through all modems in parallel.
+    """
+
+    log = logging.getLogger('gsmmodem.pool.ModemPool')
+
+    def __init__(self, modems=None, quotaPeriod=86400, signalRefreshInterval=60, failureBackoff=30, maxAttempts=None):
+        """ Constructor
+
+        :param modems: The (connected) modems to add to the pool
+        :type modems: list of gsmmodem.modem.GsmModem
+        :param quotaPeriod: The period (in seconds) that per-SIM quotas apply to
+        :type quotaPeriod: int or float
+        :param signalRefreshInterval: Minimum time (in seconds) between signal strength queries to a modem
+        :type signalRefreshInterval: int or float
+        :param failureBackoff: Time (in seconds) that a modem is avoided after it timed out; doubled for every consecutive timeout
+        :type failureBackoff: int or float
+        :param maxAttempts: The maximum number of modems to try per message (None: try every modem in the pool)
+        :type maxAttempts: int
+        """
+        self.quotaPeriod = quotaPeriod
+        self.signalRefreshInterval = signalRefreshInterval
+        self.failureBackoff = failureBackoff
+        self.maxAttempts = maxAttempts
+        self._lock = threading.Lock()
+        self._members = []
+        for modem in modems or []:
+            self.addModem(modem)
+
+    @property
+    def modems(self):
+        """ :return: The modems in the pool """
+        with self._lock:
+            return [member.modem for member in self._members]
+
+    def addModem(self, modem, quota=None):
+        """ Adds a modem to the pool
+
+        :param modem: The (connected) modem to add
+        :type modem: gsmmodem.modem.GsmModem
+        :param quota: The maximum number of SMS messages (message parts) the modem's SIM may send per quota period (None: unlimited)
+        :type quota: int
+        """
+        with self._lock:
+            self._members.append(_PoolMember(modem, quota))
+
+    def removeModem(self, modem):
+        """ Removes a modem from the pool (messages currently being sent through it are not affected) """
+        with self._lock:
+            self._members = [member for member in self._members if member.modem is not modem]
+
+    def setQuota(self, modem, quota):
+        """ Changes the quota of a modem in the pool
+
+        :param quota: The maximum number of SMS messages (message parts) the modem's SIM may send per quota period (None: unlimited)
+        :type quota: int
+        """
+        with self._lock:
+            self._member(modem).quota = quota
+
+    def load(self, modem):
+        """ :return: The current load statistics of the specified modem in the pool
+        :rtype: dict
+        """
+        with self._lock:
+            member = self._member(modem)
+            return {'pending': member.pending, 'pendingParts': member.pendingParts, 'latency': member.latency, 'errorRate': member.errorRate,
+                    'signalStrength': member.signalStrength, 'sent': member.sent, 'quota': member.quota,
+                    'available': member.unavailableUntil <= time.time()}
+
+    def sendSms(self, destination, text, **kwargs):
+        """ Sends an SMS text message through the least loaded modem in the pool
+
+        Additional keyword arguments are passed on to the selected modem's sendSms() method, except
+        for "waitForDeliveryReport": use the returned message's wait() method instead.
+
+        :param destination: the recipient's phone number
+        :type destination: str
+        :param text: the message text
+        :type text: str
+
+        :raise NoModemAvailableError: if no modem is available, or all modems tried failed to send the message
+        :raise TimeoutException: if a modem timed out after the message may have been submitted (it is not failed over)
+        :raise CommandError: if a modem failed after the message may have been submitted (it is not failed over)
+        :raise ValueError: if "waitForDeliveryReport" is specified
+
+        :return: The sent message
+        :rtype: gsmmodem.modem.SentSms
+        """
+        if kwargs.get('waitForDeliveryReport'):
+            # A delivery report timeout would otherwise cause the message to be sent again through another modem
+            raise ValueError('waitForDeliveryReport is not supported; use the wait() method of the returned SentSms object instead')
+        # The number of message parts the message will be sent as; reserved against each SIM's quota while sending
+        reservedParts = len(PduTemplate(text))
+        tried = set()
+        lastError = None
+        maxAttempts = self.maxAttempts or len(self._members)
+        while len(tried) < maxAttempts:
+            member = self._acquire(tried, reservedParts)
+            if member == None:
+                break
+            tried.add(id(member))
+            startTime = time.time()
+            try:
+                sms = member.modem.sendSms(destination, text, **kwargs)
+            except TimeoutException as e:
+                self._release(member, startTime, reservedParts, timedOut=True)
+                if getattr(e, 'smsSubmitted', True):
+                    self.log.warning('Modem %s timed out after the SMS may have been submitted; not failing over', _modemName(member.modem))
+                    raise
+                lastError = e
+                self.log.warning('Modem %s timed out while sending SMS; failing over', _modemName(member.modem))
+            except GsmModemException as e:
+                self._release(member, startTime, reservedParts, failed=True)
+                if getattr(e, 'smsSubmitted', True):
+                    self.log.warning('Modem %s failed after the SMS may have been submitted (%s); not failing over', _modemName(member.modem), e)
+                    raise
+                lastError = e
+                self.log.warning('Modem %s failed to send SMS (%s); failing over', _modemName(member.modem), e)
+            except Exception:
+                # Not a modem failure (e.g. invalid input) - do not try other modems
+                self._release(member, startTime, reservedParts)
+                raise
+            else:
+                self._release(member, startTime, reservedParts, parts=len(getattr(sms, 'references', None) or [None]))
+                self._refreshSignalStrength(member)
+                return sms
+        if lastError != None:
+            raise NoModemAvailableError('Failed to send SMS through {0} modem(s)'.format(len(tried)), lastError)
+        raise NoModemAvailableError('No modem available to send SMS')
+
+    def refreshSignalStrength(self):
+        """ Queries the signal strength of every modem in the pool """
+        with self._lock:
+            members = list(self._members)
+        for member in members:
+            self._refreshSignalStrength(member, force=True)
+
+    def _member(self, modem):
+        for member in self._members:
+            if member.modem is modem:
+                return member
+        raise ValueError('Modem is not in this pool')
+
+    def _acquire(self, exclude, parts):
+        """ Selects the modem to send the next message through, and adds the message (and its parts) to its queue
+
+        :return: The selected pool member, or None if no modem is available
+        """
+        with self._lock:
+            now = time.time()
+            candidates = []
+            backedOff = []
+            for member in self._members:
+                if id(member) in exclude:
+                    continue
+                member.resetQuotaPeriod(now, self.quotaPeriod)
+                # The parts of messages being sent count towards the quota, so that concurrent senders cannot exceed it
+                if member.quota != None and member.sent + member.pendingParts + parts > member.quota:
+                    continue
+                if member.unavailableUntil > now:
+                    backedOff.append(member)
+                else:
+                    candidates.append(member)
+            if candidates:
+                # Modems without a measured latency yet are assumed to be as fast as the fastest known modem
+                latencies = [member.latency for member in self._members if member.latency != None]
+                defaultLatency = min(latencies) if latencies else 1.0
+                member = min(candidates, key=lambda member: (member.cost(defaultLatency), member.sent))
+            elif backedOff:
+                # All remaining modems have failed recently - try the one that has been backed off longest
+                member = min(backedOff, key=lambda member: member.unavailableUntil)
+            else:
+                return None
+            member.pending += 1
+            member.pendingParts += parts
+            return member
+
+    def _release(self, member, startTime, reservedParts, timedOut=False, failed=False, parts=0):
+        """ Removes a message (and the parts reserved for it) from a modem's queue, and updates the modem's statistics """
+        with self._lock:
+            member.pending -= 1
+            member.pendingParts -= reservedParts
+            if timedOut or failed:
+                member.errorRate += _ERROR_RATE_WEIGHT * (1 - member.errorRate)
+            else:
+                member.errorRate -= _ERROR_RATE_WEIGHT * member.errorRate
+            if timedOut:
+                member.consecutiveTimeouts += 1
+                member.unavailableUntil = time.time() + self.failureBackoff * 2 ** min(member.consecutiveTimeouts - 1, 5)
+            elif parts:
+                member.consecutiveTimeouts = 0
+                member.unavailableUntil = 0
+                member.sent += parts
+                latency = (time.time() - startTime) / parts
+                if member.latency == None:
+                    member.latency = latency
+                else:
+                    member.latency += _LATENCY_WEIGHT * (latency - member.latency)
+
+    def _refreshSignalStrength(self, member, force=False):
+        """ Updates the cached signal strength of a modem, if it is stale """
+        now = time.time()
+        if not force and now - member.signalTime < self.signalRefreshInterval:
+            return
+        member.signalTime = now
+        try:
+            member.signalStrength = member.modem.signalStrength
+        except GsmModemException:
+            member.signalStrength = -1
+
+
+# Weights of new samples in the moving averages of modem latency and error rate
+_LATENCY_WEIGHT = 0.3
+_ERROR_RATE_WEIGHT = 0.2
+# Signal strength (AT+CSQ value) at and above which no penalty is applied
+_GOOD_SIGNAL_STRENGTH = 15
+
+
+class _PoolMember(object):
+    """ A modem in a ModemPool, along with its load statistics """
+
+    __slots__ = ('modem', 'quota', 'sent', 'periodStart', 'pending', 'pendingParts', 'latency', 'errorRate',
+                 'signalStrength', 'signalTime', 'unavailableUntil', 'consecutiveTimeouts')
+
+    def __init__(self, modem, quota):
+        self.modem = modem
+        self.quota = quota
+        self.sent = 0 # Message parts sent in the current quota period
+        self.periodStart = time.time()
+        self.pending = 0 # Messages currently being sent (or waiting to be sent) through this modem
+        self.pendingParts = 0 # Message parts of the pending messages (reserved against the quota)
+        self.latency = None # Average submission time per message part
+        self.errorRate = 0.0
+        self.signalStrength = None # Unknown until the first message has been sent through this modem
+        self.signalTime = 0
+        self.unavailableUntil = 0
+        self.consecutiveTimeouts = 0
+
+    def resetQuotaPeriod(self, now, quotaPeriod):
+        if now - self.periodStart >= quotaPeriod:
+            self.periodStart = now
+            self.sent = 0
+
+    def cost(self, defaultLatency):
+        """ :return: The expected time until a new message would be submitted through this modem """
+        latency = self.latency if self.latency != None else defaultLatency
+        # Expected number of attempts, given the recent error rate
+        cost = (self.pending + 1) * latency / max(1 - self.errorRate, 0.05)
+        if self.signalStrength != None:
+            if self.signalStrength < 0: # No (or unknown) signal
+                cost *= 2
+            elif self.signalStrength < _GOOD_SIGNAL_STRENGTH:
+                cost *= 1 + (_GOOD_SIGNAL_STRENGTH - self.signalStrength) / float(_GOOD_SIGNAL_STRENGTH)
+        return cost
+
+
+def _modemName(modem):
+    return getattr(modem, 'port', None) or repr(modem)
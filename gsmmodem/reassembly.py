@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+
+""" Reassembly of concatenated (multipart) SMS messages """
+
+import time, threading, logging
+from collections import OrderedDict
+
+from .pdu import Concatenation, UserDataHeader
+
+
+def concatenationInfo(sms):
+    """ :return: The Concatenation information element of a received SMS message, or None if it is not part of a concatenated message
+    :rtype: gsmmodem.pdu.Concatenation
+    """
+    udh = getattr(sms, 'udh', None)
+    if isinstance(udh, UserDataHeader):
+        # Only creates the Concatenation IE
+        return udh.concatenation
+    for ie in udh or []:
+        if isinstance(ie, Concatenation):
+            return ie
+    return None
+
+
+class SmsReassembler(object):
+    """ Combines the parts of concatenated SMS messages into single messages
+
+    Parts are grouped by (sender, concatenation reference, number of parts). Once all parts of a
+    message have been received, a gsmmodem.modem.ConcatenatedSms is passed to the callback. Messages
+    that are not part of a concatenated message are passed to the callback as-is.
+
+    Memory use is bounded: incomplete messages are delivered as they are (with their "complete"
+    attribute set to False) if their remaining parts do not arrive within "timeout" seconds, or
+    if more than "maxParts" parts are buffered (oldest message first). Duplicate parts (e.g.
+    retransmissions) are discarded, including those arriving within "duplicateWindow" seconds after
+    their message was delivered - but only if their text and timestamp match the part already
+    received, as senders may reuse a concatenation reference for a new message.
+
+    Each part may be added with a "handle" identifying where it is stored (e.g. its index in the
+    modem's SMS memory). A part must be kept in storage until it is released: once its message
+    has been delivered, or if it is discarded as a duplicate. Released parts are returned by add()
+    and flush(); parts released by the expiry timer (or while the callback raised an exception)
+    are passed to "releaseCallback" instead. If the callback raises an exception for a message,
+    its parts are neither released nor kept, so that the message can be added again (e.g. when its
+    parts are read from storage again); the exception is passed on to the caller of add() or flush().
+    """
+
+    log = logging.getLogger('gsmmodem.reassembly.SmsReassembler')
+
+    def __init__(self, callback, timeout=600, maxParts=10000, duplicateWindow=60, releaseCallback=None):
+        """ Constructor
+
+        :param callback: Function called with each complete (or expired) message
+        :type callback: func
+        :param timeout: Time (in seconds) to wait for the remaining parts of a message, counted from its first part
+        :type timeout: int or float
+        :param maxParts: The maximum number of message parts to buffer
+        :type maxParts: int
+        :param duplicateWindow: Time (in seconds) after delivering a message during which its parts are recognised as duplicates
+        :type duplicateWindow: int or float
+        :param releaseCallback: Function called with a list of released (part, handle) tuples that were not returned by add() or flush()
+        :type releaseCallback: func
+        """
+        self.callback = callback
+        self.timeout = timeout
+        self.maxParts = maxParts
+        self.duplicateWindow = duplicateWindow
+        self.releaseCallback = releaseCallback
+        self.duplicates = 0 # Number of duplicate parts discarded
+        self._lock = threading.Lock()
+        self._pending = OrderedDict() # key: (number, reference, parts), value: _PendingMessage (oldest first)
+        self._completed = OrderedDict() # key: (number, reference, parts) of recently delivered messages, value: (expiry time, part fingerprints)
+        self._handles = set() # Handles of the buffered parts
+        self._bufferedParts = 0
+        self._timer = None # threading.Timer
+
+    def add(self, sms, handle=None):
+        """ Adds a received SMS message (or part of a concatenated message)
+
+        The callback is invoked (from the calling thread) if this completes a message, or if
+        buffered messages had to be evicted to make room for it. If the callback raises an
+        exception, the remaining messages are still delivered and the first exception is re-raised.
+
+        :param sms: The received message
+        :type sms: gsmmodem.modem.ReceivedSms
+        :param handle: Identifies where the message is stored (None if it is not stored)
+
+        :return: The parts (including "sms" itself, unless it is buffered) that have been released, as (part, handle) tuples
+        :rtype: list
+        """
+        concat = concatenationInfo(sms)
+        if concat == None or concat.parts < 2 or not 0 < concat.number <= concat.parts:
+            # Not (a valid part of) a concatenated message
+            return self._deliver([(sms, [(sms, handle)], None)])
+        ready = []
+        released = []
+        with self._lock:
+            now = time.time()
+            ready.extend(self._expire(now))
+            key = (sms.number, concat.reference, concat.parts)
+            completed = self._completed.get(key)
+            if completed != None and completed[1][concat.number - 1] == _fingerprint(sms):
+                self.duplicates += 1
+                self.log.debug('Discarding part %d of already completed message %s', concat.number, key)
+                released.append((sms, handle))
+            else:
+                if completed != None:
+                    # A new message reusing the reference of a recently completed one
+                    del self._completed[key]
+                message = self._pending.get(key)
+                if message == None:
+                    message = self._pending[key] = _PendingMessage(concat.parts, now + self.timeout)
+                index = concat.number - 1
+                if message.parts[index] != None:
+                    self.duplicates += 1
+                    self.log.debug('Discarding duplicate part %d of message %s', concat.number, key)
+                    if handle == None or handle != message.handles[index]:
+                        released.append((sms, handle))
+                else:
+                    message.parts[index] = sms
+                    message.handles[index] = handle
+                    message.received += 1
+                    self._bufferedParts += 1
+                    if handle != None:
+                        self._handles.add(handle)
+                    if message.received == len(message.parts):
+                        self._remove(key)
+                        ready.append(self._ready(message, key))
+                    else:
+                        ready.extend(self._evictOversize())
+            self._schedule(now)
+        try:
+            released.extend(self._deliver(ready))
+        except Exception:
+            self._release(released)
+            raise
+        return released
+
+    def holds(self, handle):
+        """ :return: True if the part stored at the specified handle is buffered (i.e. must be kept in storage)
+        :rtype: bool
+        """
+        with self._lock:
+            return handle in self._handles
+
+    def flush(self):
+        """ Delivers all buffered (incomplete) messages immediately
+
+        :return: The released parts, as (part, handle) tuples
+        :rtype: list
+        """
+        with self._lock:
+            ready = [self._ready(message) for message in self._pending.values()]
+            self._pending.clear()
+            self._handles.clear()
+            self._bufferedParts = 0
+        return self._deliver(ready)
+
+    def close(self):
+        """ Stops the expiry timer (buffered messages are discarded, and their parts are not released; use flush() to deliver them first) """
+        with self._lock:
+            if self._timer != None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()
+            self._handles.clear()
+            self._bufferedParts = 0
+
+    def __len__(self):
+        """ :return: The number of incomplete messages currently buffered """
+        return len(self._pending)
+
+    def _remove(self, key):
+        """ Removes a buffered message
+
+        :return: The removed message
+        """
+        message = self._pending.pop(key)
+        self._bufferedParts -= message.received
+        self._handles.difference_update(message.handles)
+        return message
+
+    def _ready(self, message, key=None):
+        """ :return: A (message to deliver, its (part, handle) tuples, key of the completed message or None) tuple """
+        parts = [(part, handle) for part, handle in zip(message.parts, message.handles) if part != None]
+        return self._combine(message), parts, key
+
+    def _expire(self, now):
+        """ Removes messages whose remaining parts have not arrived in time (and forgets old completed messages)
+
+        :return: The expired messages, ready for delivery
+        """
+        while self._completed and next(iter(self._completed.values()))[0] <= now:
+            self._completed.popitem(last=False)
+        expired = []
+        while self._pending:
+            key, message = next(iter(self._pending.items()))
+            if message.deadline > now:
+                break
+            self._remove(key)
+            self.log.debug('Timed out waiting for the remaining parts of message %s', key)
+            expired.append(self._ready(message))
+        return expired
+
+    def _evictOversize(self):
+        """ Removes the oldest messages until no more than maxParts parts are buffered
+
+        :return: The evicted messages, ready for delivery
+        """
+        evicted = []
+        while self._bufferedParts > self.maxParts and self._pending:
+            key = next(iter(self._pending))
+            message = self._remove(key)
+            self.log.warning('SMS reassembly buffer full; delivering incomplete message %s', key)
+            evicted.append(self._ready(message))
+        return evicted
+
+    def _schedule(self, now):
+        """ Starts the timer that expires the oldest buffered message, if required """
+        if self._timer == None and self._pending:
+            delay = max(next(iter(self._pending.values())).deadline - now, 0)
+            self._timer = threading.Timer(delay, self._onTimer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _onTimer(self):
+        with self._lock:
+            self._timer = None
+            now = time.time()
+            ready = self._expire(now)
+            self._schedule(now)
+        try:
+            self._release(self._deliver(ready))
+        except Exception:
+            # There is no caller to pass the error on to
+            self.log.error('error in SMS reassembly callback', exc_info=True)
+
+    def _combine(self, message):
+        from .modem import ConcatenatedSms
+        return ConcatenatedSms(message.parts)
+
+    def _deliver(self, ready):
+        """ Passes messages to the callback
+
+        The first exception raised by the callback (if any) is re-raised after all messages were delivered;
+        the parts of the messages that were delivered successfully are then passed to releaseCallback.
+
+        :param ready: (message, its (part, handle) tuples, key of the completed message or None) tuples
+
+        :return: The parts of the delivered messages, as (part, handle) tuples
+        """
+        released = []
+        error = None
+        for sms, parts, key in ready:
+            try:
+                self.callback(sms)
+            except Exception as e:
+                if error != None:
+                    self.log.error('error in SMS reassembly callback', exc_info=True)
+                else:
+                    error = e
+                continue
+            released.extend(parts)
+            if key != None:
+                # Only delivered messages are remembered, so that a message can be added again if its callback failed
+                with self._lock:
+                    self._completed[key] = (time.time() + self.duplicateWindow, [_fingerprint(part) for part in sms.parts])
+                    if len(self._completed) > self.maxParts:
+                        self._completed.popitem(last=False)
+        if error != None:
+            self._release(released)
+            raise error
+        return released
+
+    def _release(self, released):
+        """ Passes released parts to releaseCallback (if set) """
+        if released and self.releaseCallback != None:
+            try:
+                self.releaseCallback(released)
+            except Exception:
+                self.log.error('error in SMS reassembly release callback', exc_info=True)
+
+
+def _fingerprint(sms):
+    """ :return: The values that identify a retransmission of a message part """
+    return (getattr(sms, 'text', None), getattr(sms, 'time', None))
+
+
+class _PendingMessage(object):
+    """ The parts of a concatenated SMS message received so far """
+
+    __slots__ = ('parts', 'handles', 'received', 'deadline')
+
+    def __init__(self, partCount, deadline):
+        self.parts = [None] * partCount
+        self.handles = [None] * partCount
+        self.received = 0
+        self.deadline = deadline
@@ -7,9 +7,14 @@ import sys, threading, logging
 import re
 import serial # pyserial: http://pyserial.sourceforge.net
 
-from .exceptions import TimeoutException
+from .exceptions import TimeoutException, InvalidStateException
 from . import compat # For Python 2.6 compatibility
 
+if sys.version_info[0] >= 3:
+    import queue
+else: #pragma: no cover
+    import Queue as queue
+
 class SerialComms(object):
     """ Wraps all low-level serial communications (actual read/write operations) """
 
@@ -21,6 +26,9 @@ class SerialComms(object):
     RESPONSE_TERM = re.compile('^OK|ERROR|(\+CM[ES] ERROR: \d+)|(COMMAND NOT SUPPORT)$')
     # Default timeout for serial port reads (in seconds)
     timeout = 1
+    # Unsolicited notifications that are always followed by exactly one data line (e.g. an SMS PDU); if
+    # set, these notifications (and their data lines) are never mistaken for a response to a written command
+    NOTIFICATION_WITH_DATA_REGEX = None
 
     def __init__(self, port, baudrate=115200, notifyCallbackFunc=None, fatalErrorCallbackFunc=None, *args, **kwargs):
         """ Constructor
@@ -35,7 +43,9 @@ class SerialComms(object):
         self._responseEvent = None # threading.Event()
         self._expectResponseTermSeq = None # expected response terminator sequence
         self._response = None # Buffer containing response to a written command
+        self._responseQueue = None # queue.Queue receiving the response lines of a written command as they are read (see writeIter())
         self._notification = [] # Buffer containing lines from an unsolicited notification from the modem
+        self._notificationDataPending = False # Whether the data line of a NOTIFICATION_WITH_DATA_REGEX notification is still to be read
         # Reentrant lock for managing concurrent write access to the underlying serial port
         self._txLock = threading.RLock()
 
@@ -63,9 +73,23 @@ class SerialComms(object):
 
     def _handleLineRead(self, line, checkForResponseTerm=True):
         #print 'sc.hlineread:',line
-        if self._responseEvent and not self._responseEvent.is_set():
+        if self._notificationDataPending:
+            # Data line of a notification (these may arrive in the middle of a command's response)
+            self._notificationDataPending = False
+            self._notification.append(line)
+            self._flushNotification()
+        elif self._isNotificationWithData(line):
+            if len(self._notification) > 0:
+                self._flushNotification()
+            self._notification.append(line)
+            self._notificationDataPending = True
+        elif self._responseEvent and not self._responseEvent.is_set():
             # A response event has been set up (another thread is waiting for this response)
-            self._response.append(line)
+            if self._responseQueue != None:
+                # Response is being streamed; do not buffer it
+                self._responseQueue.put(line)
+            else:
+                self._response.append(line)
             if not checkForResponseTerm or self.RESPONSE_TERM.match(line):
                 # End of response reached; notify waiting thread
                 #print 'response:', self._response
@@ -76,10 +100,18 @@ class SerialComms(object):
             self._notification.append(line)
             if self.serial.inWaiting() == 0:
                 # No more chars on the way for this notification - notify higher-level callback
-                #print 'notification:', self._notification
-                self.log.debug('notification: %s', self._notification)
-                self.notifyCallback(self._notification)
-                self._notification = []
+                self._flushNotification()
+
+    def _isNotificationWithData(self, line):
+        """ :return: True if the line is an unsolicited notification that is followed by exactly one data line (see NOTIFICATION_WITH_DATA_REGEX) """
+        return self.NOTIFICATION_WITH_DATA_REGEX != None and self.NOTIFICATION_WITH_DATA_REGEX.match(line) != None
+
+    def _flushNotification(self):
+        """ Passes the buffered unsolicited notification lines to the notification callback """
+        #print 'notification:', self._notification
+        self.log.debug('notification: %s', self._notification)
+        self.notifyCallback(self._notification)
+        self._notification = []
 
     def _placeholderCallback(self, *args, **kwargs):
         """ Placeholder callback function (does nothing) """
@@ -122,8 +154,10 @@ class SerialComms(object):
             self.fatalErrorCallback(e)
 
     def write(self, data, waitForResponse=True, timeout=5, expectedResponseTermSeq=None):
-        data = data.encode()
+        if type(data) not in (bytes, bytearray):
+            data = data.encode()
         with self._txLock:
+            self._checkNotIterating()
             if waitForResponse:
                 if expectedResponseTermSeq:
                     self._expectResponseTermSeq = bytearray(expectedResponseTermSeq.encode())
@@ -144,3 +178,55 @@ class SerialComms(object):
                         raise TimeoutException()
             else:
                 self.serial.write(data)
+
+    def writeIter(self, data, timeout=5):
+        """ Writes data to the device, and yields the lines of the response as they are read
+
+        Unlike write(), the response is not buffered, which is useful for commands with very long
+        responses. The write lock is held until the response is complete; if the caller stops
+        iterating early, the rest of the response is read (and discarded) when the generator is closed.
+        Other threads writing to the device block until then; writing from the iterating thread
+        itself raises an InvalidStateException.
+
+        :param data: The data to write
+        :type data: str
+        :param timeout: Maximum amount of time in seconds to wait for each response line
+        :type timeout: int or float
+
+        :raise TimeoutException: if no (further) response lines are received within the timeout
+        :raise InvalidStateException: if called while iterating over the response of another command
+
+        :return: generator yielding the response lines (the last line is the final result code, e.g. "OK")
+        """
+        data = data.encode()
+        with self._txLock:
+            self._checkNotIterating()
+            lines = self._responseQueue = queue.Queue()
+            self._response = []
+            self._responseEvent = threading.Event()
+            done = False
+            try:
+                self.serial.write(data)
+                while not done:
+                    try:
+                        line = lines.get(timeout=timeout)
+                    except queue.Empty:
+                        raise TimeoutException()
+                    done = self.RESPONSE_TERM.match(line) != None
+                    yield line
+            finally:
+                if not done and self._responseEvent != None:
+                    # Discard the rest of the response
+                    self._responseEvent.wait(timeout)
+                self._responseEvent = None
+                self._responseQueue = None
+
+    def _checkNotIterating(self):
+        """ Prevents writing a command while the response to another command is being iterated over (see writeIter())
+
+        Must be called while holding the write lock: as writeIter() holds the lock until the response is
+        complete, a pending response queue means that the lock was re-entered by the iterating thread,
+        which would otherwise corrupt both responses.
+        """
+        if self._responseQueue != None:
+            raise InvalidStateException('Cannot write to the device while iterating over the response to another command; finish (or close) the iteration first')
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+""" Correlation of SMS status reports with the sent SMS messages they refer to """
+
+import sys, re, time, calendar, threading, logging
+from collections import OrderedDict
+
+from .exceptions import TimeoutException
+
+PYTHON_VERSION = sys.version_info[0]
+
+if PYTHON_VERSION >= 3:
+    import queue
+    dictValuesIter = dict.values
+else: #pragma: no cover
+    import Queue as queue
+    dictValuesIter = dict.itervalues
+
+
+def _numberKey(number):
+    """ Returns the part of a phone number used for matching status reports to sent messages
+
+    Status reports may contain the destination number in a different format (international
+    or national) than the one used when sending the message; only the trailing digits are compared.
+    """
+    if not number:
+        return None
+    digits = re.sub('[^0-9]', '', number)
+    return digits[-9:] if digits else None
+
+def _timestamp(dt):
+    """ :return: The specified datetime as a UNIX timestamp (naive datetimes are assumed to be in UTC, as in gsmmodem.inbox) """
+    return calendar.timegm(dt.utctimetuple())
+
+
+class SentSmsStore(object):
+    """ Persistent storage interface for a SentSmsIndex
+
+    This default implementation does not persist anything. Subclasses may store the records
+    in a file or database so that status reports can still be correlated with messages
+    after a restart.
+
+    Records are dicts containing the following keys: "modem", "references", "number", "text",
+    "timeSubmitted" (UNIX timestamp) and "status" (SentSms status).
+    """
+
+    def save(self, key, record):
+        """ Stores (or replaces) the record with the specified key """
+
+    def delete(self, key):
+        """ Removes the record with the specified key (evicted from the index) """
+
+    def load(self):
+        """ :return: All stored (key, record) tuples
+        :rtype: list
+        """
+        return []
+
+    def close(self):
+        """ Closes the store """
+
+
+class ShelveSentSmsStore(SentSmsStore):
+    """ SentSmsStore implementation that uses the standard library's shelve module """
+
+    def __init__(self, filename):
+        """ Constructor
+
+        :param filename: The shelf file to use
+        :type filename: str
+        """
+        import shelve
+        self._shelf = shelve.open(filename)
+        self._lock = threading.Lock()
+
+    def save(self, key, record):
+        with self._lock:
+            self._shelf[str(key)] = record
+            self._shelf.sync()
+
+    def delete(self, key):
+        with self._lock:
+            try:
+                del self._shelf[str(key)]
+            except KeyError:
+                pass
+
+    def load(self):
+        with self._lock:
+            return [(int(key), self._shelf[key]) for key in self._shelf.keys()]
+
+    def close(self):
+        with self._lock:
+            self._shelf.close()
+
+
+class SentSmsIndex(object):
+    """ Index of sent SMS messages, used for matching received status reports to the messages they refer to
+
+    Messages are keyed by (modem, message reference, destination number, time submitted): the 8-bit
+    TP-MR reference wraps around quickly, so if more than one indexed message matches a status
+    report's modem, reference and destination, the message submitted closest to the report's
+    "time sent" (service centre time stamp) is used. The references of all parts of a
+    multipart message map to the same SentSms object.
+
+    The index holds strong references to its messages (they are not lost if the caller
+    discards the SentSms object). It is bounded in size, and messages older than "maxAge"
+    seconds are evicted.
+
+    Indexing by reference alone is supported for backwards compatibility, e.g.:
+    ``modem.sentSms[reference]`` returns the most recently sent message with that reference.
+    """
+
+    log = logging.getLogger('gsmmodem.tracking.SentSmsIndex')
+
+    def __init__(self, maxSize=10000, maxAge=172800, timeWindow=600, store=None):
+        """ Constructor
+
+        :param maxSize: The maximum number of messages to keep in the index
+        :type maxSize: int
+        :param maxAge: Time (in seconds) after which a sent message is evicted from the index
+        :type maxAge: int or float
+        :param timeWindow: Maximum difference (in seconds) between a message's submit time and a status report's
+                           "time sent" for the time to be used to choose between messages sharing the same reference
+        :type timeWindow: int or float
+        :param store: Persistent storage for the index (None: nothing is persisted)
+        :type store: gsmmodem.tracking.SentSmsStore
+        """
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+        self.timeWindow = timeWindow
+        self.store = store or SentSmsStore()
+        self._lock = threading.RLock()
+        self._entries = OrderedDict() # key: entry key, value: _Entry (in order of submission)
+        self._byRef = {} # key: (modemId, reference), value: list of entry keys (oldest first)
+        self._byObject = {} # key: id(sms), value: entry key
+        self._nextKey = 0
+        self._restore()
+
+    def add(self, sms, modemId=None, timeSubmitted=None):
+        """ Adds a sent SMS message to the index
+
+        :param sms: The sent message; all of its "references" are indexed
+        :type sms: gsmmodem.modem.SentSms
+        :param modemId: Identifies the modem that sent the message (to allow sharing an index between modems)
+        :param timeSubmitted: UNIX timestamp of when the message was submitted (default: now)
+        :type timeSubmitted: float
+        """
+        with self._lock:
+            key = self._nextKey
+            self._nextKey += 1
+            entry = _Entry(key, modemId, tuple(sms.references), _numberKey(sms.number), timeSubmitted or time.time(), sms)
+            self._insert(entry)
+            self._evict()
+            self._save(entry)
+
+    def lookup(self, reference, number=None, timeSent=None, modemId=None):
+        """ Finds the sent SMS message that a status report refers to
+
+        :param reference: The status report's message reference
+        :type reference: int
+        :param number: The status report's recipient address (optional)
+        :type number: str
+        :param timeSent: The status report's service centre time stamp (optional)
+        :type timeSent: datetime.datetime
+        :param modemId: Identifies the modem that received the status report
+
+        :return: The sent message, or None if no message matches
+        :rtype: gsmmodem.modem.SentSms
+        """
+        with self._lock:
+            self._evict()
+            keys = self._byRef.get((modemId, reference))
+            if not keys:
+                return None
+            candidates = [self._entries[key] for key in reversed(keys)] # newest first
+            numberKey = _numberKey(number)
+            if numberKey != None:
+                candidates = [entry for entry in candidates if entry.numberKey in (numberKey, None)]
+                if not candidates:
+                    return None
+            # Prefer messages that are still waiting for a report
+            pending = [entry for entry in candidates if entry.sms.report == None]
+            candidates = pending or candidates
+            if len(candidates) > 1 and timeSent != None:
+                reportTime = _timestamp(timeSent)
+                nearest = min(candidates, key=lambda entry: abs(entry.timeSubmitted - reportTime))
+                if abs(nearest.timeSubmitted - reportTime) <= self.timeWindow:
+                    return nearest.sms
+            return candidates[0].sms
+
+    def update(self, sms):
+        """ Persists changes to an indexed message's state (e.g. after a status report was received) """
+        with self._lock:
+            key = self._byObject.get(id(sms))
+            if key != None:
+                self._save(self._entries[key])
+
+    def remove(self, sms):
+        """ Removes a message from the index """
+        with self._lock:
+            key = self._byObject.get(id(sms))
+            if key != None:
+                self._remove(key)
+
+    def clear(self):
+        """ Removes all messages from the index (and its store) """
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        """ Iterates over the indexed messages, oldest first """
+        with self._lock:
+            messages = [entry.sms for entry in dictValuesIter(self._entries)]
+        return iter(messages)
+
+    def __contains__(self, reference):
+        return self._newestByReference(reference) != None
+
+    def __getitem__(self, reference):
+        sms = self._newestByReference(reference)
+        if sms == None:
+            raise KeyError(reference)
+        return sms
+
+    def _newestByReference(self, reference):
+        """ :return: The most recently sent message (from any modem) with the specified reference, or None """
+        with self._lock:
+            for entry in reversed(list(dictValuesIter(self._entries))):
+                if reference in entry.references:
+                    return entry.sms
+        return None
+
+    def _insert(self, entry):
+        self._entries[entry.key] = entry
+        self._byObject[id(entry.sms)] = entry.key
+        for reference in set(entry.references):
+            self._byRef.setdefault((entry.modemId, reference), []).append(entry.key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._byObject.pop(id(entry.sms), None)
+        for reference in set(entry.references):
+            refKey = (entry.modemId, reference)
+            keys = self._byRef.get(refKey)
+            if keys != None:
+                keys.remove(key)
+                if not keys:
+                    del self._byRef[refKey]
+        self.store.delete(key)
+
+    def _evict(self):
+        """ Removes messages that are too old, or exceed the maximum index size """
+        oldest = time.time() - self.maxAge
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) > self.maxSize or entry.timeSubmitted < oldest:
+                self._remove(key)
+            else:
+                break
+
+    def _save(self, entry):
+        sms = entry.sms
+        self.store.save(entry.key, {'modem': entry.modemId, 'references': list(entry.references), 'number': sms.number,
+                                    'text': sms.text, 'timeSubmitted': entry.timeSubmitted, 'status': sms.status})
+
+    def _restore(self):
+        """ Loads messages that are still waiting for status reports from the store """
+        records = sorted(self.store.load(), key=lambda item: item[0])
+        if not records:
+            return
+        from .modem import SentSms
+        for key, record in records:
+            if record['status'] != SentSms.ENROUTE:
+                # Already finalized - no more status reports are expected for this message
+                self.store.delete(key)
+                continue
+            sms = SentSms(record['number'], record['text'], record['references'][0], references=record['references'])
+            self._insert(_Entry(key, record['modem'], tuple(record['references']), _numberKey(record['number']), record['timeSubmitted'], sms))
+        self._nextKey = records[-1][0] + 1
+        self._evict()
+        self.log.debug('Restored %d sent SMS messages from store', len(self._entries))
+
+
+class _Entry(object):
+    """ A sent SMS message in a SentSmsIndex """
+
+    __slots__ = ('key', 'modemId', 'references', 'numberKey', 'timeSubmitted', 'sms')
+
+    def __init__(self, key, modemId, references, numberKey, timeSubmitted, sms):
+        self.key = key
+        self.modemId = modemId
+        self.references = references
+        self.numberKey = numberKey
+        self.timeSubmitted = timeSubmitted
+        self.sms = sms
+
+
+def asCompleted(messages, timeout=None):
+    """ Waits for the final status reports of many sent SMS messages at once
+
+    Yields each message as soon as its final status report has been received (in
+    the order the reports arrive), e.g.::
+
+        messages = [modem.sendSms(number, text) for number in numbers]
+        for sms in asCompleted(messages, timeout=60):
+            print(sms.number, sms.status)
+
+    :param messages: The sent messages to wait for
+    :type messages: iterable of gsmmodem.modem.SentSms
+    :param timeout: Maximum total time to wait, in seconds (None: wait indefinitely)
+    :type timeout: int or float
+
+    :raise TimeoutException: if not all messages' status reports were received within the timeout
+
+    :return: generator yielding the messages as their status reports are received
+    """
+    messages = list(messages)
+    completed = queue.Queue()
+    for sms in messages:
+        sms.addDoneCallback(completed.put)
+    deadline = time.time() + timeout if timeout != None else None
+    for _ in messages:
+        try:
+            sms = completed.get(timeout=max(deadline - time.time(), 0) if deadline != None else None)
+        except queue.Empty:
+            raise TimeoutException()
+        yield sms
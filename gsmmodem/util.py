@@ -6,6 +6,12 @@
 from datetime import datetime, timedelta, tzinfo
 import re
 
+try:
+    from datetime import timezone
+except ImportError: #pragma: no cover
+    # Python 2
+    timezone = None
+
 class SimpleOffsetTzInfo(tzinfo):    
     """ Very simple implementation of datetime.tzinfo offering set timezone offset for datetime instances """
     
@@ -27,6 +33,29 @@ class SimpleOffsetTzInfo(tzinfo):
     def __repr__(self):
         return 'gsmmodem.util.SimpleOffsetTzInfo({0})'.format(self.offsetInHours)
 
+# Shared fixed-offset tzinfo instances (key: UTC offset in minutes)
+_TIMEZONES = {}
+
+def fixedOffsetTimezone(offsetInMinutes):
+    """ Returns a shared tzinfo instance with the specified fixed UTC offset
+
+    :param offsetInMinutes: The timezone offset, in minutes (may be negative)
+    :type offsetInMinutes: int
+
+    :return: A datetime.timezone instance (gsmmodem.util.SimpleOffsetTzInfo on Python 2)
+    :rtype: datetime.tzinfo
+    """
+    tz = _TIMEZONES.get(offsetInMinutes)
+    if tz == None:
+        if timezone != None:
+            tz = timezone(timedelta(minutes=offsetInMinutes))
+        else: #pragma: no cover
+            tz = SimpleOffsetTzInfo(offsetInMinutes / 60.0)
+        _TIMEZONES[offsetInMinutes] = tz
+    return tz
+
+_TEXT_MODE_TIME_REGEX = re.compile(r'^(\d\d)/(\d\d)/(\d\d),(\d\d):(\d\d):(\d\d)([+-]\d\d)$')
+
 def parseTextModeTimeStr(timeStr):
     """ Parses the specified SMS text mode time string
     
@@ -40,9 +69,13 @@ def parseTextModeTimeStr(timeStr):
     :return: datetime object representing the specified time string
     :rtype: datetime.datetime
     """
-    msgTime = timeStr[:-3]
-    tzOffsetHours = int(int(timeStr[-3:]) * 0.25)
-    return datetime.strptime(msgTime, '%y/%m/%d,%H:%M:%S').replace(tzinfo=SimpleOffsetTzInfo(tzOffsetHours))
+    tz = fixedOffsetTimezone(int(timeStr[-3:]) * 15)
+    match = _TEXT_MODE_TIME_REGEX.match(timeStr)
+    if match == None:
+        return datetime.strptime(timeStr[:-3], '%y/%m/%d,%H:%M:%S').replace(tzinfo=tz)
+    year, month, day, hour, minute, second = [int(field) for field in match.groups()[:6]]
+    # Two-digit years are interpreted as by datetime.strptime()
+    return datetime(year + (2000 if year < 69 else 1900), month, day, hour, minute, second, tzinfo=tz)
 
 def lineStartingWith(string, lines):
     """ Searches through the specified list of strings and returns the 
@@ -115,6 +115,7 @@ Bundled utilities:
       scripts=['tools/gsmterm.py', 'tools/sendsms.py', 'tools/identify-modem.py'],
       install_requires=requires,
       tests_require=tests_require,
-      extras_require={'docs': ['sphinx']},
+      extras_require={'docs': ['sphinx'],
+                      'numpy': ['numpy']}, # Vectorized batch PDU encoding/decoding (gsmmodem.pdu_batch)
       cmdclass = {'test': RunUnitTests,
                   'coverage': RunUnitTestsCoverage})
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+""" Test suite for gsmmodem.dedup """
+
+from __future__ import print_function
+
+import sys, unittest
+from datetime import datetime
+
+from . import compat # For Python 2.6 compatibility
+
+import gsmmodem.modem
+from gsmmodem.modem import ReceivedSms, Sms
+from gsmmodem.pdu import Concatenation
+from gsmmodem.dedup import SmsDeduplicator, smsKey
+from gsmmodem.util import SimpleOffsetTzInfo
+
+class FakeModem(object):
+    """ Placeholder for the modem referenced by received messages """
+
+def createSms(number, text, second=0, reference=None, partNumber=1):
+    udh = []
+    if reference != None:
+        concat = Concatenation()
+        concat.reference, concat.parts, concat.number = reference, 2, partNumber
+        udh.append(concat)
+    time = datetime(2013, 3, 8, 15, 2, second, tzinfo=SimpleOffsetTzInfo(2))
+    return ReceivedSms(FakeModem(), Sms.STATUS_RECEIVED_UNREAD, number, time, text, None, udh)
+
+
+class TestSmsDeduplicator(unittest.TestCase):
+    """ Tests filtering out duplicate received SMS messages """
+
+    def test_smsKey(self):
+        """ Tests that messages are identified by sender, timestamp, concatenation info and text """
+        sms = createSms('+27820000001', 'Hello')
+        self.assertEqual(smsKey(sms), smsKey(createSms('+27820000001', 'Hello')))
+        self.assertEqual(len(smsKey(sms)), 20)
+        for other in (createSms('+27820000002', 'Hello'), createSms('+27820000001', 'Hello', second=1),
+                      createSms('+27820000001', 'Hello', reference=1), createSms('+27820000001', 'Hello!')):
+            self.assertNotEqual(smsKey(sms), smsKey(other))
+        self.assertNotEqual(smsKey(createSms('+27820000001', 'Hello', reference=1, partNumber=1)),
+                            smsKey(createSms('+27820000001', 'Hello', reference=1, partNumber=2)))
+
+    def test_binaryPayload(self):
+        """ Tests identifying and filtering 8-bit data messages, whose text is bytes """
+        sms = createSms('+27820000001', b'\x00\xffdata')
+        self.assertEqual(smsKey(sms), smsKey(createSms('+27820000001', b'\x00\xffdata')))
+        self.assertNotEqual(smsKey(sms), smsKey(createSms('+27820000001', b'\x00\xfedata')))
+        dedup = SmsDeduplicator()
+        self.assertFalse(dedup.isDuplicate(sms))
+        self.assertTrue(dedup.isDuplicate(createSms('+27820000001', b'\x00\xffdata')))
+
+    def test_lru(self):
+        """ Tests the (default) LRU cache mode """
+        dedup = SmsDeduplicator(maxEntries=2)
+        self.assertFalse(dedup.isDuplicate(createSms('+27820000001', 'One')))
+        self.assertFalse(dedup.isDuplicate(createSms('+27820000001', 'Two')))
+        self.assertTrue(dedup.isDuplicate(createSms('+27820000001', 'One')))
+        # "Two" is now the least recently seen message, and is forgotten first
+        self.assertFalse(dedup.isDuplicate(createSms('+27820000001', 'Three')))
+        self.assertTrue(dedup.isDuplicate(createSms('+27820000001', 'One')))
+        self.assertFalse(dedup.isDuplicate(createSms('+27820000001', 'Two')))
+        self.assertEqual(dedup.duplicates, 2)
+        dedup.clear()
+        self.assertFalse(dedup.isDuplicate(createSms('+27820000001', 'One')))
+        self.assertRaises(ValueError, SmsDeduplicator, maxEntries=0)
+
+    def test_bloom(self):
+        """ Tests the Bloom filter mode """
+        dedup = SmsDeduplicator(maxEntries=1000, bloom=True, errorRate=0.01)
+        messages = [createSms('+2782{0:07d}'.format(i), 'Message {0}'.format(i)) for i in range(1000)]
+        falsePositives = sum(dedup.isDuplicate(sms) for sms in messages)
+        self.assertLess(falsePositives, 50)
+        for sms in messages:
+            self.assertTrue(dedup.isDuplicate(sms))
+        # Messages are remembered for two generations
+        for i in range(2000):
+            dedup.isDuplicate(createSms('+27830000000', 'Other message {0}'.format(i)))
+        self.assertLess(sum(dedup.isDuplicate(sms) for sms in messages), 50)
+        self.assertRaises(ValueError, SmsDeduplicator, bloom=True, errorRate=1)
+
+    def test_checkOnly(self):
+        """ Tests checking messages without remembering them """
+        for dedup in (SmsDeduplicator(), SmsDeduplicator(bloom=True)):
+            sms = createSms('+27820000001', 'Hello')
+            self.assertFalse(dedup.isDuplicate(sms, remember=False))
+            self.assertFalse(dedup.isDuplicate(sms, remember=False))
+            dedup.remember(sms)
+            self.assertTrue(dedup.isDuplicate(sms, remember=False))
+            self.assertTrue(dedup.isDuplicate(sms))
+            self.assertEqual(dedup.duplicates, 2)
+
+    def test_modemIntegration(self):
+        """ Tests the optional deduplication stage of GsmModem """
+        delivered = []
+        modem = gsmmodem.modem.GsmModem('-- PORT IGNORED DURING TESTS --', smsReceivedCallbackFunc=delivered.append, deduplicateSms=True)
+        modem._dispatchReceivedSms(createSms('+27820000001', 'Hello'))
+        modem._dispatchReceivedSms(createSms('+27820000001', 'Hello'))
+        modem._dispatchReceivedSms(createSms('+27820000001', 'Hello', second=5))
+        self.assertEqual(len(delivered), 2)
+        self.assertEqual(modem.smsDeduplicator.duplicates, 1)
+        # Messages are only remembered once the callback has handled them
+        def failingCallback(sms):
+            raise ValueError('Application failure')
+        modem.smsReceivedCallback = failingCallback
+        self.assertRaises(ValueError, modem._dispatchReceivedSms, createSms('+27820000002', 'Retry'))
+        modem.smsReceivedCallback = delivered.append
+        modem._dispatchReceivedSms(createSms('+27820000002', 'Retry'))
+        self.assertEqual(delivered[-1].text, 'Retry')
+        # Disabled by default
+        modem = gsmmodem.modem.GsmModem('-- PORT IGNORED DURING TESTS --', smsReceivedCallbackFunc=delivered.append)
+        self.assertEqual(modem.smsDeduplicator, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
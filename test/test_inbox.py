@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+""" Test suite for gsmmodem.inbox """
+
+from __future__ import print_function
+
+import sys, os, time, unittest, tempfile, shutil
+from datetime import datetime
+
+from . import compat # For Python 2.6 compatibility
+
+from gsmmodem.modem import ReceivedSms, Sms
+from gsmmodem.inbox import SmsInbox
+from gsmmodem.util import SimpleOffsetTzInfo
+
+class FakeModem(object):
+    """ Placeholder for the modem referenced by received messages """
+
+def createSms(number, text, hour, pdu=None):
+    time = datetime(2013, 3, 8, hour, 2, 0, tzinfo=SimpleOffsetTzInfo(2))
+    return ReceivedSms(FakeModem(), Sms.STATUS_RECEIVED_UNREAD, number, time, text, '+27831000015', [], pdu)
+
+
+class TestSmsInbox(unittest.TestCase):
+    """ Tests the SQLite inbox journal """
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempDir, 'inbox.db')
+        self.inbox = SmsInbox(self.path)
+
+    def tearDown(self):
+        self.inbox.close()
+        shutil.rmtree(self.tempDir)
+
+    def test_add(self):
+        """ Tests persisting messages, and reading them back after reopening the journal """
+        messages = [createSms('+27820000001', 'Hello', 10, '07917248014000F3240B917247587706F400003110824115248012C8329BFD06C9C373B8B82C97E741F034'),
+                    createSms('+27820000002', 'World', 9)]
+        ids = self.inbox.add(messages, 'SM')
+        self.assertEqual(len(ids), 2)
+        self.inbox.close()
+        self.inbox = SmsInbox(self.path)
+        self.assertEqual(len(self.inbox), 2)
+        entry = self.inbox.get(ids[0])
+        self.assertEqual(entry.number, '+27820000001')
+        self.assertEqual(entry.text, 'Hello')
+        self.assertEqual(entry.smsc, '+27831000015')
+        self.assertEqual(entry.time, messages[0].time)
+        self.assertEqual(entry.time.utcoffset(), messages[0].time.utcoffset())
+        self.assertEqual(entry.pdu, messages[0].pdu)
+        self.assertEqual(entry.memory, 'SM')
+        self.assertFalse(entry.processed)
+        self.assertEqual(self.inbox.get(ids[1]).pdu, None)
+        self.assertEqual(self.inbox.get(12345), None)
+
+    def test_find(self):
+        """ Tests looking up messages by sender and time """
+        self.inbox.add([createSms('+27820000001', 'One', 10), createSms('+27820000002', 'Two', 11), createSms('+27820000001', 'Three', 12)])
+        self.assertEqual([entry.text for entry in self.inbox.find(number='+27820000001')], ['One', 'Three'])
+        start = datetime(2013, 3, 8, 11, 0, 0, tzinfo=SimpleOffsetTzInfo(2))
+        end = datetime(2013, 3, 8, 10, 0, 0, tzinfo=SimpleOffsetTzInfo(0)) # 12:00 at +2
+        self.assertEqual([entry.text for entry in self.inbox.find(start=start)], ['Two', 'Three'])
+        self.assertEqual([entry.text for entry in self.inbox.find(start=start, end=end)], ['Two'])
+        self.assertEqual([entry.text for entry in self.inbox.find(number='+27820000001', start=start)], ['Three'])
+        self.assertEqual([entry.text for entry in self.inbox.find(limit=1)], ['One'])
+
+    def test_processed(self):
+        """ Tests tracking which messages have been processed, and purging them """
+        ids = self.inbox.add([createSms('+27820000001', 'One', 10), createSms('+27820000002', 'Two', 11), createSms('+27820000003', 'Three', 12)])
+        self.inbox.markProcessed(ids[:1] + ids[2:])
+        self.assertEqual([entry.id for entry in self.inbox.unprocessed()], ids[1:2])
+        self.assertTrue(self.inbox.get(ids[0]).processed)
+        self.assertEqual(self.inbox.purge(before=time.time() - 60), 0)
+        self.assertEqual(self.inbox.purge(), 2)
+        self.assertEqual(len(self.inbox), 1)
+        self.assertEqual(len(self.inbox.unprocessed(limit=0)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -394,6 +394,32 @@ class TestGsmModemGeneralApi(unittest.TestCase):
             self.modem.serial.responseSequence = ['{0}\r\n'.format(toWrite), 'OK\r\n']
             self.assertEqual(name, self.modem.smsSupportedEncoding)
 
+    def test_settingsShadow(self):
+        """ Tests that modem settings are only written if they changed, and are re-written after the modem restarts """
+        written = []
+        def writeCallbackFunc(data):
+            written.append(data)
+        self.modem.serial.writeCallbackFunc = writeCallbackFunc
+        self.modem._smsSupportedEncodingNames = ['GSM', 'UCS2']
+        self.modem.smsEncoding = 'UCS2'
+        self.modem.smsEncoding = 'UCS2'
+        self.modem.smsTextMode = True
+        self.modem.smsTextMode = True
+        self.assertEqual(written, ['AT+CSCS="UCS2"\r', 'AT+CMGF=1\r'])
+        # The modem restarts: all settings should be restored (SMS mode first)
+        del written[:]
+        self.modem.serial.responseSequence = ['^SYSSTART\r\n']
+        for i in range(50):
+            if len(written) >= 5:
+                break
+            time.sleep(0.05)
+        self.assertEqual(written, ['AT+CMGF=1\r', 'AT+CNMI={0}\r'.format(self.modem.AT_CNMI), 'AT+CPMS="ME","ME","ME"\r',
+                                   'AT+CSCS="UCS2"\r', 'AT+CSMP=49,167,0,0\r'])
+        del written[:]
+        self.modem.smsEncoding = 'UCS2'
+        self.modem.smsTextMode = True
+        self.assertEqual(written, [])
+
 
 class TestUssd(unittest.TestCase):
     """ Tests USSD session handling """
@@ -1440,6 +1466,7 @@ class TestSms(unittest.TestCase):
             self.modem._smsTextMode = True # Set modem to text mode
             self.modem._smsEncoding = "GSM" # Set encoding to GSM-7
             self.modem._smsSupportedEncodingNames = None # Force modem to ask about possible encoding names
+            self.modem._settings.clear() # Force modem to write the mode and encoding settings again
         self.modem.close()
 
     def test_sendSmsTextMode(self):
@@ -1474,9 +1501,15 @@ class TestSms(unittest.TestCase):
         self.modem._smsEncoding = "GSM"
         self.assertFalse(self.modem.smsTextMode)
         self.firstSMS = True
+        self.lastEncoding = None
         for number, message, index, smsTime, smsc, pdu, sms_deliver_tpdu_length, ref, mem in self.tests:
             self.modem._smsRef = ref
             calcPdu = gsmmodem.pdu.encodeSmsSubmitPdu(number, message, ref)[0]
+            try:
+                gsmmodem.pdu.encodeGsm7(message)
+                encoding = 'GSM'
+            except ValueError:
+                encoding = 'UCS2'
             pduHex = codecs.encode(compat.str(calcPdu.data), 'hex_codec').upper()
             if PYTHON_VERSION >= 3:
                 pduHex = str(pduHex, 'ascii')
@@ -1498,11 +1531,18 @@ class TestSms(unittest.TestCase):
 
                 if self.firstSMS:
                     return writeCallbackFuncReadCSCS(data)
-                self.assertEqual('AT+CSCS="{0}"\r'.format(self.modem._smsEncoding), data, 'Invalid data written to modem; expected "{0}", got: "{1}"'.format('AT+CSCS="{0}"'.format(self.modem._smsEncoding), data))
-                self.modem.serial.writeCallbackFunc = writeCallbackFunc2
+                if data.startswith('AT+CSCS='):
+                    # The SMS encoding should only be written if it changed
+                    self.assertNotEqual(encoding, self.lastEncoding, 'SMS encoding written to modem, but it did not change')
+                    self.assertEqual('AT+CSCS="{0}"\r'.format(encoding), data, 'Invalid data written to modem; expected "{0}", got: "{1}"'.format('AT+CSCS="{0}"'.format(encoding), data))
+                    self.modem.serial.writeCallbackFunc = writeCallbackFunc2
+                else:
+                    self.assertEqual(encoding, self.lastEncoding, 'SMS encoding changed, but not written to modem')
+                    writeCallbackFunc2(data)
 
             self.modem.serial.writeCallbackFunc = writeCallbackFunc
             sms = self.modem.sendSms(number, message)
+            self.lastEncoding = encoding
             self.assertIsInstance(sms, gsmmodem.modem.SentSms)
             self.assertEqual(sms.number, number, 'Sent SMS has invalid number. Expected "{0}", got "{1}"'.format(number, sms.number))
             self.assertEqual(sms.text, message, 'Sent SMS has invalid text. Expected "{0}", got "{1}"'.format(message, sms.text))
@@ -1520,9 +1560,15 @@ class TestSms(unittest.TestCase):
         self.modem.smsTextMode = False # Set modem to PDU mode
         self.modem._smsEncoding = "GSM"
         self.firstSMS = True
+        self.lastEncoding = None
         for number, message, index, smsTime, smsc, pdu, sms_deliver_tpdu_length, ref, mem in self.tests:
             self.modem._smsRef = ref
             calcPdu = gsmmodem.pdu.encodeSmsSubmitPdu(number, message, ref)[0]
+            try:
+                gsmmodem.pdu.encodeGsm7(message)
+                encoding = 'GSM'
+            except ValueError:
+                encoding = 'UCS2'
             pduHex = codecs.encode(compat.str(calcPdu.data), 'hex_codec').upper()
             if PYTHON_VERSION >= 3:
                 pduHex = str(pduHex, 'ascii')
@@ -1546,11 +1592,18 @@ class TestSms(unittest.TestCase):
 
                 if self.firstSMS:
                     return writeCallbackFuncReadCSCS(data)
-                self.assertEqual('AT+CSCS="{0}"\r'.format(self.modem._smsEncoding), data, 'Invalid data written to modem; expected "{0}", got: "{1}"'.format('AT+CSCS="{0}"'.format(self.modem._smsEncoding), data))
-                self.modem.serial.writeCallbackFunc = writeCallbackFunc2
+                if data.startswith('AT+CSCS='):
+                    # The SMS encoding should only be written if it changed
+                    self.assertNotEqual(encoding, self.lastEncoding, 'SMS encoding written to modem, but it did not change')
+                    self.assertEqual('AT+CSCS="{0}"\r'.format(encoding), data, 'Invalid data written to modem; expected "{0}", got: "{1}"'.format('AT+CSCS="{0}"'.format(encoding), data))
+                    self.modem.serial.writeCallbackFunc = writeCallbackFunc2
+                else:
+                    self.assertEqual(encoding, self.lastEncoding, 'SMS encoding changed, but not written to modem')
+                    writeCallbackFunc2(data)
 
             self.modem.serial.writeCallbackFunc = writeCallbackFunc
             sms = self.modem.sendSms(number, message)
+            self.lastEncoding = encoding
             self.assertIsInstance(sms, gsmmodem.modem.SentSms)
             self.assertEqual(sms.number, number, 'Sent SMS has invalid number. Expected "{0}", got "{1}"'.format(number, sms.number))
             self.assertEqual(sms.text, message, 'Sent SMS has invalid text. Expected "{0}", got "{1}"'.format(message, sms.text))
@@ -1729,6 +1782,144 @@ class TestSms(unittest.TestCase):
         self.assertRaises(gsmmodem.exceptions.TimeoutException, self.modem.sendSms, **{'destination': '0829200000', 'text': 'Test message', 'waitForDeliveryReport': True, 'deliveryTimeout': 0.05})
         self.modem.close()
     
+    def test_sendSms_afterModemRestart(self):
+        """ Tests that delivery reports are still requested (AT+CSMP) after the modem restarts """
+        self.initModem(None)
+        self.modem.smsTextMode = True
+        written = []
+        def writeCallbackFunc(data):
+            written.append(data)
+            if data.startswith('AT+CMGS'):
+                self.modem.serial.flushResponseSequence = False
+                # Fake a delivery report notification after sending SMS
+                self.modem.serial.responseSequence = ['> \r\n', '+CMGS: 183\r\n', 'OK\r\n', 0.1, '+CDSI: "SM",3\r\n']
+            elif data.startswith('AT+CMGR'):
+                self.modem.serial.responseSequence = ['+CMGR: ,6,183,"0829200000",129,"13/04/29,19:58:00+04","13/04/29,19:59:00+04",0\r\n', 'OK\r\n']
+            else:
+                self.modem.serial.flushResponseSequence = True
+        self.modem.serial.writeCallbackFunc = writeCallbackFunc
+        # The modem restarts: all of its settings are reset
+        self.modem.serial.responseSequence = ['^SYSSTART\r\n']
+        for i in range(50):
+            if 'AT+CNMI={0}\r'.format(self.modem.AT_CNMI) in written:
+                break
+            time.sleep(0.05)
+        self.assertEqual(written[0], 'AT+CMGF=1\r')
+        self.assertIn('AT+CSMP=49,167,0,0\r', written)
+        del written[:]
+        self.modem._smsRef = 183
+        sms = self.modem.sendSms('0829200000', 'Test message', waitForDeliveryReport=True)
+        self.assertEqual(written[:2], ['AT+CMGS="0829200000"\r', 'Test message{0}'.format(chr(26))])
+        self.assertEqual(sms.status, gsmmodem.modem.SentSms.DELIVERED)
+        self.modem.close()
+
+    def test_sendSmsToMany(self):
+        """ Tests sending the same message to many recipients from modem storage (AT+CMGW / AT+CMSS) """
+        destinations = ['+27820000001', '+27820000002', '+27820000003']
+        for textMode, text in ((False, 'Hello everyone'), (False, 'Hello everyone ' * 15), (True, 'Hello everyone')):
+            self.initModem(None)
+            self.modem.smsTextMode = textMode
+            if textMode:
+                pdus = None
+                storeCommands = ['AT+CMGW\r']
+            else:
+                pdus = gsmmodem.pdu.encodeSmsSubmitPdu(destinations[0], text, reference=self.modem._smsRef)
+                storeCommands = ['AT+CMGW={0}\r'.format(pdu.tpduLength) for pdu in pdus]
+            responses = self.modem.serial.modem.responses
+            for i, command in enumerate(storeCommands):
+                responses[command] = ['> \r\n']
+                payload = str(pdus[i]) if pdus else text
+                responses['{0}{1}'.format(payload, chr(26))] = ['+CMGW: {0}\r\n'.format(i + 5), 'OK\r\n']
+            reference = [40]
+            written = []
+            def writeCallbackFunc(data):
+                written.append(data)
+                if data.startswith('AT+CMSS='):
+                    self.modem.serial.responseSequence = ['+CMSS: {0}\r\n'.format(reference[0]), 'OK\r\n']
+                    reference[0] += 1
+            self.modem.serial.writeCallbackFunc = writeCallbackFunc
+            messages = self.modem.sendSmsToMany(destinations, text)
+            self.assertEqual(len(messages), len(destinations))
+            indexes = list(range(5, 5 + len(storeCommands)))
+            # The message content should have been written only once, and submitted once per destination
+            self.assertEqual([data for data in written if data.startswith('AT+CMGW')], storeCommands)
+            expectedCmss = ['AT+CMSS={0},"{1}"\r'.format(index, number) for number in destinations for index in indexes]
+            self.assertEqual([data for data in written if data.startswith('AT+CMSS')], expectedCmss)
+            # Stored message should have been deleted
+            self.assertEqual([data for data in written if data.startswith('AT+CMGD')], ['AT+CMGD={0},0\r'.format(index) for index in indexes])
+            ref = 40
+            for sms, number in zip(messages, destinations):
+                self.assertIsInstance(sms, gsmmodem.modem.SentSms)
+                self.assertEqual(sms.number, number)
+                self.assertEqual(sms.text, text)
+                self.assertEqual(sms.references, list(range(ref, ref + len(indexes))))
+                self.assertIs(self.modem.sentSms.lookup(ref, number, modemId=self.modem.port), sms)
+                ref += len(indexes)
+            self.assertEqual(self.modem._smsRef, ref)
+            self.modem.close()
+
+    def test_sendSmsToMany_partialFailure(self):
+        """ Tests that the messages sent before sendSmsToMany() failed are reported, and that the stored message is always deleted """
+        destinations = ['+27820000001', '+27820000002', '+27820000003']
+        text = 'Hello everyone ' * 15
+        self.initModem(None)
+        self.modem.smsTextMode = False
+        pdus = gsmmodem.pdu.encodeSmsSubmitPdu(destinations[0], text, reference=self.modem._smsRef)
+        responses = self.modem.serial.modem.responses
+        for i, pdu in enumerate(pdus):
+            responses['AT+CMGW={0}\r'.format(pdu.tpduLength)] = ['> \r\n']
+            responses['{0}{1}'.format(pdu, chr(26))] = ['+CMGW: {0}\r\n'.format(i + 5), 'OK\r\n']
+        written = []
+        def writeCallbackFunc(data):
+            written.append(data)
+            if data.startswith('AT+CMSS=') and destinations[1] in data:
+                self.modem.serial.responseSequence = ['+CMS ERROR: 500\r\n']
+            elif data.startswith('AT+CMSS='):
+                self.modem.serial.responseSequence = ['+CMSS: 40\r\n', 'OK\r\n']
+        self.modem.serial.writeCallbackFunc = writeCallbackFunc
+        deleteStoredSms = self.modem.deleteStoredSms
+        def deleteStoredSmsTimeout(index, memory=None):
+            deleteStoredSms(index, memory)
+            if index == 5:
+                raise TimeoutException()
+        self.modem.deleteStoredSms = deleteStoredSmsTimeout
+        try:
+            self.modem.sendSmsToMany(destinations, text)
+        except CmsError as e:
+            self.assertEqual([sms.number for sms in e.sentMessages], destinations[:1])
+            self.assertEqual(e.failedDestination, destinations[1])
+        else:
+            self.fail('CmsError not raised')
+        # Deleting the other stored PDUs continues after a timeout
+        self.assertEqual([data for data in written if data.startswith('AT+CMGD')], ['AT+CMGD=5,0\r', 'AT+CMGD=6,0\r'])
+        self.assertEqual([data for data in written if data.startswith('AT+CMSS')][-1], 'AT+CMSS=5,"{0}"\r'.format(destinations[1]))
+        self.modem.close()
+
+    def test_sendSmsToMany_unknownMemory(self):
+        """ Tests that sendSmsToMany() deletes the stored message from the memory it was written to, if that memory is unknown """
+        self.initModem(None)
+        self.modem._invalidateSettings() # e.g. after a modem restart
+        responses = self.modem.serial.modem.responses
+        responses['AT+CPMS?\r'] = ['+CPMS: "SM",2,20,"ME",1,100,"SM",2,20\r\n', 'OK\r\n']
+        responses['AT+CPMS="ME"\r'] = responses['AT+CPMS="SM"\r'] = ['+CPMS: 1,100,1,100,2,20\r\n', 'OK\r\n']
+        pdu = gsmmodem.pdu.encodeSmsSubmitPdu('+27820000001', 'Hello', reference=self.modem._smsRef)[0]
+        responses['AT+CMGW={0}\r'.format(pdu.tpduLength)] = ['> \r\n']
+        responses['{0}{1}'.format(pdu, chr(26))] = ['+CMGW: 3\r\n', 'OK\r\n']
+        written = []
+        def writeCallbackFunc(data):
+            written.append(data)
+            if data.startswith('AT+CMSS='):
+                self.modem.serial.responseSequence = ['+CMSS: 40\r\n', 'OK\r\n']
+        self.modem.serial.writeCallbackFunc = writeCallbackFunc
+        self.modem.smsTextMode = False
+        self.modem.sendSmsToMany(['+27820000001'], 'Hello')
+        commands = [data for data in written if data.startswith(('AT+CPMS', 'AT+CMGW=', 'AT+CMSS', 'AT+CMGD'))]
+        self.assertEqual(commands, ['AT+CPMS?\r', 'AT+CPMS="ME"\r', 'AT+CMGW={0}\r'.format(pdu.tpduLength), 'AT+CMSS=3,"+27820000001"\r',
+                                    'AT+CMGD=3,0\r', 'AT+CPMS="SM"\r'])
+        self.assertEqual(self.modem._smsMemReadDelete, 'SM')
+        self.assertEqual(self.modem._smsMemWrite, 'ME')
+        self.modem.close()
+
     def test_sendSms_reply(self):
         """ Test the reply() method of the ReceivedSms class """
         self.initModem(None)
@@ -1755,6 +1946,145 @@ class TestSms(unittest.TestCase):
         self.assertRaises(gsmmodem.exceptions.CommandError, self.modem.sendSms, '+27820000000', 'Test message')
         self.modem.close()
 
+    def test_sendSms_submitted(self):
+        """ Tests the "smsSubmitted" attribute of errors raised by GsmModem.sendSms() """
+        self.initModem(None)
+        # The modem rejects the message before it is sent
+        def writeCallbackFunc(data):
+            if data.startswith('AT+CMGS'):
+                self.modem.serial.responseSequence = ['+CMS ERROR: 500\r\n']
+        self.modem.serial.writeCallbackFunc = writeCallbackFunc
+        try:
+            self.modem.sendSms('+27820000000', 'Test message')
+        except gsmmodem.exceptions.CmsError as e:
+            self.assertFalse(e.smsSubmitted)
+        else:
+            self.fail('CmsError not raised')
+        # The message was written, but the modem did not confirm it
+        self.modem.serial.writeCallbackFunc = None
+        try:
+            self.modem.sendSms('+27820000000', 'Test message')
+        except gsmmodem.exceptions.CommandError as e:
+            self.assertTrue(e.smsSubmitted)
+        else:
+            self.fail('CommandError not raised')
+        self.modem.close()
+
+class TestSmsDirectDelivery(unittest.TestCase):
+    """ Tests receiving SMS messages routed directly to the TE (+CMT) """
+
+    PDU = '06917228195339040A9110325476980000313080512061800CC8329BFD06DDDF72363904'
+
+    def initModem(self, csmsService=1, cnmiSupported=True):
+        global FAKE_MODEM
+        FAKE_MODEM = copy(fakemodems.GenericTestModem())
+        FAKE_MODEM.responses = copy(FAKE_MODEM.responses)
+        FAKE_MODEM.responses['AT+CSMS?\r'] = ['+CSMS: {0},1,1,1\r\n'.format(csmsService), 'OK\r\n']
+        if not cnmiSupported:
+            FAKE_MODEM.responses['AT+CNMI=2,2,0,2\r'] = ['ERROR\r\n']
+        self.received = []
+        self.written = []
+        self.mockSerial = MockSerialPackage()
+        gsmmodem.serial_comms.serial = self.mockSerial
+        self.modem = gsmmodem.modem.GsmModem('-- PORT IGNORED DURING TESTS --', smsReceivedCallbackFunc=self.received.append, directSmsDelivery=True)
+        self.modem.connect()
+        FAKE_MODEM = None
+        self.modem.serial.writeCallbackFunc = self.written.append
+
+    def waitForSms(self, count=1):
+        for i in range(50):
+            if len(self.received) >= count:
+                break
+            time.sleep(0.05)
+        time.sleep(0.1) # Give the acknowledgement a chance to be written
+        self.assertEqual(len(self.received), count)
+
+    def test_connect(self):
+        """ Tests selecting direct delivery and detecting whether acknowledgements are required during connect() """
+        self.initModem()
+        self.assertEqual(self.modem._settings['+CNMI'], '2,2,0,2')
+        self.assertTrue(self.modem._smsAckRequired)
+        self.modem.close()
+        self.initModem(csmsService=0)
+        self.assertEqual(self.modem._settings['+CNMI'], '2,2,0,2')
+        self.assertFalse(self.modem._smsAckRequired)
+        self.modem.close()
+        # Fall back to storage mode if direct delivery is not supported
+        self.initModem(cnmiSupported=False)
+        self.assertEqual(self.modem._settings['+CNMI'], '2,1,0,2')
+        self.assertFalse(self.modem._smsAckRequired)
+        self.modem.close()
+
+    def test_receiveSmsPduMode(self):
+        """ Tests receiving a directly delivered SMS message in PDU mode, including one that arrives during a command's response """
+        self.initModem()
+        self.modem.serial.responseSequence = ['+CMT: ,29\r\n', '{0}\r\n'.format(self.PDU)]
+        self.waitForSms()
+        sms = self.received[0]
+        self.assertIsInstance(sms, gsmmodem.modem.ReceivedSms)
+        self.assertEqual(sms.number, '+0123456789')
+        self.assertEqual(sms.text, 'Hello world!')
+        self.assertEqual(sms.time, datetime(2013, 3, 8, 15, 2, 16, tzinfo=SimpleOffsetTzInfo(2)))
+        self.assertEqual(sms.smsc, '+2782913593')
+        self.assertEqual(sms.status, gsmmodem.modem.Sms.STATUS_RECEIVED_UNREAD)
+        # No storage round trips; only an acknowledgement
+        self.assertEqual(self.written, ['AT+CNMA\r'])
+        del self.written[:]
+        self.modem.serial.modem.responses['AT+CGMI\r'] = ['+CMT: "Test",29\r\n', '{0}\r\n'.format(self.PDU), 'huawei\r\n', 'OK\r\n']
+        self.assertEqual(self.modem.manufacturer, 'huawei')
+        self.waitForSms(2)
+        self.assertEqual(self.received[1].text, 'Hello world!')
+        self.assertEqual(self.written, ['AT+CGMI\r', 'AT+CNMA\r'])
+        # Undecodable messages are acknowledged negatively
+        del self.written[:]
+        self.modem.serial.responseSequence = ['+CMT: ,29\r\n', '0011\r\n']
+        time.sleep(0.3)
+        self.assertEqual(len(self.received), 2)
+        self.assertEqual(self.written, ['AT+CNMA=2\r'])
+        self.modem.close()
+
+    def test_receiveSmsTextMode(self):
+        """ Tests that messages are not routed directly to the TE in text mode (their text may span several lines) """
+        self.initModem()
+        self.modem.smsTextMode = True
+        self.assertEqual(self.written, ['AT+CMGF=1\r', 'AT+CNMI=2,1,0,2\r'])
+        del self.written[:]
+        # Messages that were already on their way are still received as a whole
+        self.modem.serial.responseSequence = ['+CMT: "+0123456789",,"13/03/08,15:02:16+08"\r\n', 'Hello\r\n', 'world!\r\n']
+        self.waitForSms()
+        sms = self.received[0]
+        self.assertEqual(sms.number, '+0123456789')
+        self.assertEqual(sms.text, 'Hello\nworld!')
+        self.assertEqual(sms.time, datetime(2013, 3, 8, 15, 2, 16, tzinfo=SimpleOffsetTzInfo(2)))
+        # Direct delivery is used again in PDU mode
+        del self.written[:]
+        self.modem.smsTextMode = False
+        self.assertEqual(self.written, ['AT+CMGF=0\r', 'AT+CNMI=2,2,0,2\r', 'AT+CSMS?\r'])
+        self.assertTrue(self.modem._smsAckRequired)
+        self.modem.close()
+
+    def test_acknowledgementFailure(self):
+        """ Tests falling back to storage mode if acknowledging a message fails """
+        self.initModem()
+        self.modem.serial.modem.responses['AT+CNMA\r'] = ['+CMS ERROR: 500\r\n']
+        self.modem.serial.responseSequence = ['+CMT: ,29\r\n', '{0}\r\n'.format(self.PDU)]
+        self.waitForSms()
+        time.sleep(0.1)
+        self.assertEqual(self.written, ['AT+CNMA\r', 'AT+CNMI=2,1,0,2\r'])
+        self.assertFalse(self.modem.directSmsDelivery)
+        self.assertFalse(self.modem._smsAckRequired)
+        self.modem.close()
+        # "No acknowledgement expected" errors only disable acknowledgements
+        self.initModem()
+        self.modem.serial.modem.responses['AT+CNMA\r'] = ['+CMS ERROR: 340\r\n']
+        self.modem.serial.responseSequence = ['+CMT: ,29\r\n', '{0}\r\n'.format(self.PDU)]
+        self.waitForSms()
+        self.assertEqual(self.written, ['AT+CNMA\r'])
+        self.assertTrue(self.modem.directSmsDelivery)
+        self.assertFalse(self.modem._smsAckRequired)
+        self.modem.close()
+
+
 class TestStoredSms(unittest.TestCase):
     """ Tests processing/accessing SMS messages stored on the SIM card """
     
@@ -1856,7 +2186,7 @@ class TestStoredSms(unittest.TestCase):
         
         # Test deleting filtered messages
         expectedFilter[0] = 1
-        expectedFilter[1] = ['1,0', '2,0']
+        expectedFilter[1] = ['1,1']
         delCount[0] = 0
         self.modem.serial.writeCallbackFunc = writeCallbackFunc3
         messages = self.modem.listStoredSms(status=Sms.STATUS_RECEIVED_READ, delete=True)
@@ -1919,7 +2249,7 @@ class TestStoredSms(unittest.TestCase):
         
         # Test deleting filtered messages
         expectedFilter[0] = 'REC READ'
-        expectedFilter[1] = ['1,0', '2,0']
+        expectedFilter[1] = ['1,1']
         delCount[0] = 0
         self.modem.serial.writeCallbackFunc = writeCallbackFunc3
         messages = self.modem.listStoredSms(status=Sms.STATUS_RECEIVED_READ, delete=True)
@@ -1970,6 +2300,247 @@ class TestStoredSms(unittest.TestCase):
         self.assertTrue(commandsWritten[1], 'AT+CMGD command not written to modem')
         self.assertEqual(i[0], 1, 'Message received callback count incorrect; expected 1, got {0}'.format(i[0]))
     
+    def test_processStoredSms_deduplicateRetry(self):
+        """ Tests that a stored message whose callback failed is delivered when it is processed again (with deduplication enabled) """
+        from gsmmodem.dedup import SmsDeduplicator
+        self.initFakeModemResponses(textMode=False)
+        received = []
+        def smsCallbackFunc(sms):
+            if not received:
+                received.append(None)
+                raise ValueError('Application failure')
+            received.append(sms)
+        self.initModem(False, smsCallbackFunc)
+        self.modem.smsDeduplicator = SmsDeduplicator()
+        deleted = []
+        self.modem.serial.writeCallbackFunc = lambda data: deleted.append(data) if data.startswith('AT+CMGD') else None
+        self.modem.processStoredSms(unreadOnly=True)
+        self.assertEqual(received, [None])
+        self.assertEqual(deleted, [])
+        self.modem.processStoredSms(unreadOnly=True)
+        self.assertEqual(len(received), 2)
+        self.assertEqual(received[1].text, self.expectedMessages[0].text)
+        self.assertEqual(deleted, ['AT+CMGD=0,0\r'])
+
+    def test_deliverStoredSms_reassembly(self):
+        """ Tests that stored parts of a concatenated message are only deleted once the whole message has been delivered """
+        from gsmmodem.pdu import Concatenation
+        from gsmmodem.reassembly import SmsReassembler
+        self.initFakeModemResponses(textMode=False)
+        delivered = []
+        def smsCallbackFunc(sms):
+            if not delivered:
+                delivered.append(None)
+                raise ValueError('Application failure')
+            delivered.append(sms)
+        self.initModem(False, smsCallbackFunc)
+        self.modem.smsReassembler = SmsReassembler(self.modem._handleReassembledSms, releaseCallback=self.modem._releaseSmsParts)
+        parts = []
+        for partNumber, text in ((1, 'Hello '), (2, 'World')):
+            concat = Concatenation()
+            concat.reference, concat.parts, concat.number = 9, 2, partNumber
+            parts.append(ReceivedSms(self.modem, Sms.STATUS_RECEIVED_UNREAD, '+27820000001', datetime(2013, 3, 8, 15, 2, partNumber, tzinfo=SimpleOffsetTzInfo(2)), text, None, [concat]))
+        deleted = []
+        self.modem.serial.writeCallbackFunc = lambda data: deleted.append(data) if data.startswith('AT+CMGD') else None
+        # The first part is kept in storage while it is buffered, even if it is read again
+        self.modem._deliverStoredSms([(3, parts[0])])
+        self.modem._deliverStoredSms([(3, parts[0])])
+        self.assertEqual(deleted, [])
+        # The callback fails: both parts are kept in storage
+        self.modem._deliverStoredSms([(4, parts[1])])
+        self.assertEqual(delivered, [None])
+        self.assertEqual(deleted, [])
+        # ...and are delivered (and deleted) when processed again
+        self.modem._deliverStoredSms([(3, parts[0]), (4, parts[1])])
+        self.assertEqual([sms.text for sms in delivered[1:]], ['Hello World'])
+        self.assertEqual(deleted, ['AT+CMGD=3,0;+CMGD=4,0\r'])
+        self.modem.smsReassembler.close()
+
+    def test_receiveSmsBurst(self):
+        """ Tests coalescing a burst of "new SMS" indications into a single AT+CMGL and compound AT+CMGD command """
+        self.initFakeModemResponses(textMode=False)
+        pdus = [line for line in FAKE_MODEM.responses['AT+CMGL=4\r'] if not line.startswith('+CMGL') and line != 'OK\r\n']
+        received = []
+        self.initModem(False, received.append)
+        self.assertEqual(self.modem.smsCoalesceWindow, 0) # Disabled by default
+        self.modem.smsCoalesceWindow = 0.1
+        self.modem.serial.modem.responses['AT+CMGL=0\r'] = ['+CMGL: 3,0,,35\r\n', pdus[0], '+CMGL: 5,0,,161\r\n', pdus[1], '+CMGL: 7,0,,159\r\n', pdus[2], 'OK\r\n']
+        written = []
+        self.modem.serial.writeCallbackFunc = lambda data: written.append(data) if data.startswith('AT+CMG') else None
+        # Indications arriving together, and separately within the coalescing window
+        self.modem.serial.responseSequence = ['+CMTI: "SM",5\r\n', '+CMTI: "SM",3\r\n']
+        time.sleep(0.03)
+        self.modem.serial.responseSequence = ['+CMTI: "SM",7\r\n']
+        for i in range(40):
+            if len(received) == 3 and len(written) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual([sms.number for sms in received], [self.expectedMessages[1].number, self.expectedMessages[0].number, self.expectedMessages[2].number])
+        self.assertEqual(written, ['AT+CMGL=0\r', 'AT+CMGD=5,0;+CMGD=3,0;+CMGD=7,0\r'])
+        # A single indication is still handled with AT+CMGR
+        del written[:]
+        del received[:]
+        self.modem.serial.responseSequence = ['+CMTI: "SM",0\r\n']
+        for i in range(40):
+            if len(received) == 1 and len(written) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(written, ['AT+CMGR=0\r', 'AT+CMGD=0,0\r'])
+        # Compound commands not supported by the modem
+        self.modem.serial.modem.responses['AT+CMGD=1,0;+CMGD=2,0\r'] = ['ERROR\r\n']
+        del written[:]
+        self.modem._deleteStoredSmsBatch([1, 2])
+        self.assertEqual(written, ['AT+CMGD=1,0;+CMGD=2,0\r', 'AT+CMGD=1,0\r', 'AT+CMGD=2,0\r'])
+        # Messages already deleted by the failed compound command
+        self.modem.serial.modem.responses['AT+CMGD=1,0\r'] = ['+CMS ERROR: 321\r\n']
+        del written[:]
+        self.modem._deleteStoredSmsBatch([1, 2])
+        self.assertEqual(written, ['AT+CMGD=1,0;+CMGD=2,0\r', 'AT+CMGD=1,0\r', 'AT+CMGD=2,0\r'])
+        self.assertRaises(CmsError, self.modem._deleteStoredSmsBatch, [1])
+        # Pending indications are cancelled when the modem is closed
+        self.modem.serial.responseSequence = ['+CMTI: "SM",5\r\n']
+        for i in range(20):
+            if self.modem._smsCoalesceTimer != None:
+                break
+            time.sleep(0.01)
+        timer = self.modem._smsCoalesceTimer
+        self.assertNotEqual(timer, None)
+        self.modem.close()
+        timer.join(1)
+        self.assertFalse(timer.is_alive())
+        self.assertEqual(self.modem._pendingSmsIndications, [])
+        self.modem = None
+
+    def test_iterStoredSms(self):
+        """ Tests streaming SMSs that are currently stored on the SIM card as the AT+CMGL response arrives """
+        self.initFakeModemResponses(textMode=False)
+        self.initModem(False, None)
+        response = self.modem.serial.modem.responses['AT+CMGL=4\r']
+        self.modem.serial.modem.responses['AT+CMGL=4\r'] = response[:2] + [0.3] + response[2:]
+        written = []
+        self.modem.serial.writeCallbackFunc = lambda data: written.append(data)
+        startTime = time.time()
+        messages = self.modem.iterStoredSms(delete=True)
+        message = next(messages)
+        self.assertLess(time.time() - startTime, 0.25, 'First message not yielded before the AT+CMGL response was complete')
+        self.assertEqual(message.number, self.expectedMessages[0].number)
+        self.assertEqual(message.text, self.expectedMessages[0].text)
+        for expected, message in zip(self.expectedMessages[1:], messages):
+            self.assertEqual(message.number, expected.number)
+            self.assertEqual(message.status, expected.status)
+            self.assertEqual(message.text, expected.text)
+            self.assertEqual(message.time, expected.time)
+        self.assertRaises(StopIteration, next, messages)
+        # Yielded messages are deleted with a single command once iteration ends
+        self.assertEqual(written, ['AT+CMGL=4\r', 'AT+CMGD=0,0;+CMGD=1,0;+CMGD=2,0\r'])
+        # Stopping early: the message the consumer stopped at is not deleted
+        del written[:]
+        messages = self.modem.iterStoredSms(delete=True)
+        next(messages)
+        next(messages)
+        messages.close()
+        self.assertEqual(written, ['AT+CMGL=4\r', 'AT+CMGD=0,0\r'])
+        # The modem is usable again afterwards
+        self.assertEqual(len(self.modem.listStoredSms(status=Sms.STATUS_RECEIVED_READ)), 2)
+        # Commands cannot be sent from within the loop
+        messages = self.modem.iterStoredSms()
+        next(messages)
+        self.assertRaises(gsmmodem.exceptions.InvalidStateException, self.modem.deleteStoredSms, 0)
+        self.assertEqual(len(list(messages)), len(self.expectedMessages) - 1)
+        # Errors
+        self.modem.serial.modem.responses['AT+CMGL=4\r'] = ['ERROR\r\n']
+        self.assertRaises(CommandError, list, self.modem.iterStoredSms())
+
+    def test_receiveSmsInbox(self):
+        """ Tests persisting received SMS messages to the inbox journal before deleting them from the modem and dispatching them """
+        from gsmmodem.inbox import SmsInbox
+        self.initFakeModemResponses(textMode=False)
+        events = []
+        def smsReceivedCallbackFunc(sms):
+            events.append('callback')
+            raise ValueError('Application failure')
+        self.initModem(False, smsReceivedCallbackFunc)
+        self.modem.smsInbox = inbox = SmsInbox(':memory:')
+        self.modem.serial.writeCallbackFunc = lambda data: events.append(data) if data.startswith('AT+CMG') else None
+        self.modem.serial.responseSequence = ['+CMTI: "SM",0\r\n']
+        for i in range(40):
+            if len(events) == 3:
+                break
+            time.sleep(0.05)
+        # Deleted from the modem before the (failing) callback, but kept in the journal
+        self.assertEqual(events, ['AT+CMGR=0\r', 'AT+CMGD=0,0\r', 'callback'])
+        entries = inbox.unprocessed()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].number, self.expectedMessages[0].number)
+        self.assertEqual(entries[0].text, self.expectedMessages[0].text)
+        self.assertEqual(entries[0].time, self.expectedMessages[0].time)
+        self.assertEqual(entries[0].pdu, '07917248014000F3240B917247587706F400003110824115248012C8329BFD06C9C373B8B82C97E741F034')
+        # Successfully dispatched messages are marked as processed
+        self.modem.smsReceivedCallback = lambda sms: events.append('callback')
+        self.modem.serial.responseSequence = ['+CMTI: "SM",0\r\n']
+        for i in range(40):
+            if len(events) == 6:
+                break
+            time.sleep(0.05)
+        self.assertEqual(len(inbox), 2)
+        self.assertEqual(len(inbox.unprocessed()), 1)
+        # Messages are not deleted from the modem if they could not be persisted
+        inbox.close()
+        del events[:]
+        self.modem.serial.responseSequence = ['+CMTI: "SM",0\r\n']
+        for i in range(40):
+            if len(events) == 3:
+                break
+            time.sleep(0.05)
+        self.assertEqual(events, ['AT+CMGR=0\r', 'callback', 'AT+CMGD=0,0\r'])
+
+    def test_smsStorageMonitor(self):
+        """ Tests monitoring SMS storage usage, and draining stored messages before the storage fills up """
+        global FAKE_MODEM
+        self.initFakeModemResponses(textMode=False)
+        FAKE_MODEM.responses['AT+CPMS?\r'] = ['+CPMS: "SM",2,20,"SM",2,20,"SM",2,20\r\n', 'OK\r\n']
+        FAKE_MODEM.responses['AT+CIND=?\r'] = ['+CIND: ("battchg",(0-5)),("signal",(0-5)),("smsfull",(0-1))\r\n', 'OK\r\n']
+        gsmmodem.serial_comms.serial = MockSerialPackage()
+        received = []
+        self.modem = gsmmodem.modem.GsmModem('-- PORT IGNORED DURING TESTS --', smsReceivedCallbackFunc=received.append, monitorSmsStorage=True)
+        self.modem.connect()
+        FAKE_MODEM = None
+        self.assertEqual(self.modem.smsStorage, {'SM': (2, 20)})
+        self.assertEqual(self.modem._smsFullIndicator, 3)
+        self.assertFalse(self.modem.checkSmsStorage())
+        self.assertEqual(received, [])
+        # Drain once the threshold is reached
+        written = []
+        self.modem.serial.writeCallbackFunc = lambda data: written.append(data) if data.startswith('AT+CMG') else None
+        self.modem.serial.modem.responses['AT+CPMS?\r'] = ['+CPMS: "SM",16,20,"SM",16,20,"SM",16,20\r\n', 'OK\r\n']
+        self.assertTrue(self.modem.checkSmsStorage())
+        self.assertEqual(len(received), 3)
+        self.assertEqual(written, ['AT+CMGL=4\r', 'AT+CMGD=1,0;+CMGD=2,0;+CMGD=0,0\r'])
+        # "Storage full" notifications
+        for notification in ('^SMMEMFULL: "SM"\r\n', '+CIEV: 3,1\r\n', '+CIEV: "SMSFULL",1\r\n'):
+            del written[:]
+            self.modem.serial.responseSequence = [notification]
+            for i in range(40):
+                if len(written) == 2:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(written[0], 'AT+CMGL=4\r', 'Storage not drained after notification: {0}'.format(notification))
+        del written[:]
+        self.modem.serial.responseSequence = ['+CIEV: 3,0\r\n']
+        time.sleep(0.2)
+        self.assertEqual(written, [])
+        # A high message index in a "new SMS" indication triggers a storage check
+        self.modem.serial.writeCallbackFunc = lambda data: written.append(data) if data.startswith('AT+CPMS?') else None
+        self.modem.serial.responseSequence = ['+CMTI: "SM",1\r\n']
+        time.sleep(0.3)
+        self.assertEqual(written, [])
+        self.modem.serial.responseSequence = ['+CMTI: "SM",17\r\n']
+        for i in range(40):
+            if written:
+                break
+            time.sleep(0.05)
+        self.assertEqual(written[:1], ['AT+CPMS?\r'])
+
     def test_deleteStoredSms(self):
         self.initFakeModemResponses(textMode=True)
         self.initModem(True, None)
@@ -2023,6 +2594,31 @@ class TestStoredSms(unittest.TestCase):
         for delFlag in tests:
             self.assertRaises(ValueError, self.modem.deleteMultipleStoredSms, **{'delFlag': delFlag})
     
+    def test_deleteStoredSms_singleParameter(self):
+        """ Tests deleting messages on modems whose AT+CMGD command does not take the <delflag> parameter (e.g. Siemens MC35/TC35) """
+        self.initFakeModemResponses(textMode=False)
+        FAKE_MODEM.responses['AT+CMGD=?\r'] = ['+CMGD: (0,1,2)\r\n', 'OK\r\n']
+        self.initModem(False, None)
+        written = []
+        self.modem.serial.writeCallbackFunc = written.append
+        self.modem.deleteStoredSms(1)
+        self.assertEqual(written, ['AT+CMGD=1\r'])
+        del written[:]
+        self.modem.listStoredSms(status=Sms.STATUS_RECEIVED_READ, delete=True)
+        self.assertEqual(written, ['AT+CMGL=1\r', 'AT+CMGD=1;+CMGD=2\r'])
+        del written[:]
+        self.modem.deleteMultipleStoredSms(1)
+        self.assertEqual(written, ['AT+CMGL=4\r', 'AT+CMGD=1;+CMGD=2\r'])
+        # Messages with a status that cannot be selected by <delflag> are deleted with a compound command
+        self.modem.close()
+        self.initFakeModemResponses(textMode=False)
+        FAKE_MODEM.responses['AT+CMGD=?\r'] = ['+CMGD: (0,1,2),(0-4)\r\n', 'OK\r\n']
+        self.initModem(False, None)
+        self.modem.serial.writeCallbackFunc = written.append
+        del written[:]
+        self.modem.listStoredSms(status=Sms.STATUS_RECEIVED_UNREAD, delete=True)
+        self.assertEqual(written, ['AT+CMGL=0\r', 'AT+CMGD=0,0\r'])
+
     def test_readStoredSms_pdu(self):
         """ Tests reading stored SMS messages (PDU mode) """
         self.initFakeModemResponses(textMode=False)
@@ -2238,6 +2834,90 @@ class TestSmsStatusReports(unittest.TestCase):
 
 
 
+class TestStatusReportDirectDelivery(unittest.TestCase):
+    """ Tests receiving SMS status reports routed directly to the TE (+CDS) """
+
+    PDU = '07917248014000F506B70AA18092020000317071518590803170715185418000'
+
+    def initModem(self, cnmiSupported=True):
+        global FAKE_MODEM
+        FAKE_MODEM = copy(fakemodems.GenericTestModem())
+        FAKE_MODEM.responses = copy(FAKE_MODEM.responses)
+        FAKE_MODEM.responses['AT+CSMS?\r'] = ['+CSMS: 1,1,1,1\r\n', 'OK\r\n']
+        if not cnmiSupported:
+            FAKE_MODEM.responses['AT+CNMI=2,1,0,1\r'] = ['ERROR\r\n']
+        self.reports = []
+        self.written = []
+        self.mockSerial = MockSerialPackage()
+        gsmmodem.serial_comms.serial = self.mockSerial
+        self.modem = gsmmodem.modem.GsmModem('-- PORT IGNORED DURING TESTS --', smsStatusReportCallback=self.reports.append, directStatusReports=True)
+        self.modem.connect()
+        FAKE_MODEM = None
+        self.modem.serial.writeCallbackFunc = self.written.append
+
+    def waitForReports(self, count=1):
+        for i in range(50):
+            if len(self.reports) >= count:
+                break
+            time.sleep(0.05)
+        self.assertEqual(len(self.reports), count)
+
+    def test_connect(self):
+        """ Tests selecting direct status report delivery during connect(), and falling back to storage mode """
+        self.initModem()
+        self.assertEqual(self.modem._settings['+CNMI'], '2,1,0,1')
+        self.assertTrue(self.modem._smsAckRequired)
+        self.modem.close()
+        self.initModem(cnmiSupported=False)
+        self.assertEqual(self.modem._settings['+CNMI'], '2,1,0,2')
+        self.assertFalse(self.modem._smsAckRequired)
+        self.modem.close()
+
+    def test_receiveStatusReportPduMode(self):
+        """ Tests receiving a directly delivered status report in PDU mode, during a command's response """
+        self.initModem()
+        sms = gsmmodem.modem.SentSms('0829200000', 'Test', 183)
+        self.modem.sentSms.add(sms, self.modem.port)
+        self.modem.serial.modem.responses['AT+CGMI\r'] = ['+CDS: 24\r\n', '{0}\r\n'.format(self.PDU), 'huawei\r\n', 'OK\r\n']
+        self.assertEqual(self.modem.manufacturer, 'huawei')
+        self.waitForReports()
+        report = self.reports[0]
+        self.assertIsInstance(report, StatusReport)
+        self.assertEqual(report.reference, 183)
+        self.assertEqual(report.number, '0829200000')
+        self.assertEqual(report.timeSent, datetime(2013, 7, 17, 15, 58, 9, tzinfo=SimpleOffsetTzInfo(2)))
+        self.assertEqual(report.deliveryStatus, StatusReport.DELIVERED)
+        self.assertEqual(sms.status, gsmmodem.modem.SentSms.DELIVERED)
+        # Acknowledged; no storage round trips
+        self.assertEqual(self.written, ['AT+CGMI\r', 'AT+CNMA\r'])
+        # Failed acknowledgements cause a fallback to storage mode
+        del self.written[:]
+        self.modem.serial.modem.responses['AT+CNMA\r'] = ['ERROR\r\n']
+        self.modem.serial.responseSequence = ['+CDS: 24\r\n', '{0}\r\n'.format(self.PDU)]
+        self.waitForReports(2)
+        time.sleep(0.1)
+        self.assertEqual(self.written, ['AT+CNMA\r', 'AT+CNMI=2,1,0,2\r'])
+        self.assertFalse(self.modem.directStatusReports)
+        self.modem.close()
+
+    def test_receiveStatusReportTextMode(self):
+        """ Tests receiving a directly delivered status report in text mode (a single notification line) """
+        self.initModem()
+        self.modem.smsTextMode = True
+        del self.written[:]
+        self.modem.serial.responseSequence = ['+CDS: 6,20,"0870000000",129,"13/04/29,19:58:00+04","13/04/29,19:59:00+04",0\r\n']
+        self.waitForReports()
+        report = self.reports[0]
+        self.assertEqual(report.reference, 20)
+        self.assertEqual(report.number, '0870000000')
+        self.assertEqual(report.timeSent, datetime(2013, 4, 29, 19, 58, 0, tzinfo=SimpleOffsetTzInfo(1)))
+        self.assertEqual(report.timeFinalized, datetime(2013, 4, 29, 19, 59, 0, tzinfo=SimpleOffsetTzInfo(1)))
+        self.assertEqual(report.deliveryStatus, StatusReport.DELIVERED)
+        time.sleep(0.1)
+        self.assertEqual(self.written, ['AT+CNMA\r'])
+        self.modem.close()
+
+
 
 if __name__ == "__main__":
     logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
@@ -31,7 +31,7 @@ class TestSemiOctets(unittest.TestCase):
         """ Tests the semi-octet decoding algorithm """        
         for plaintext, encoded in self.tests:
             # Test different parameter types: bytearray, str
-            for param in (encoded, codecs.encode(compat.str(encoded), 'hex_codec')):
+            for param in (encoded, memoryview(encoded), codecs.encode(compat.str(encoded), 'hex_codec')):
                 result = gsmmodem.pdu.decodeSemiOctets(param)
                 self.assertEqual(result, plaintext, 'Failed to decode data. Expected: "{0}", got: "{1}"'.format(plaintext, result))
         
@@ -99,15 +99,45 @@ class TestGsm7(unittest.TestCase):
             result = gsmmodem.pdu.unpackSeptets(septets, limit)
             self.assertEqual(result, encoded, 'Failed to unpack GSM-7 septets into {0} octets for string: "{1}". Expected: "{2}", got: "{3}"'.format(len(encoded), plaintext, [b for b in encoded], [b for b in result]))
 
+    def test_packSeptets_fillBits(self):
+        """ Tests packing septets after "fill bits", and unpacking them again by continuing from the first octet (as done after a UDH) """
+        for plaintext, encoded, septets in self.tests:
+            for udhBits in range(1, 7): # number of UDH bits modulo 7, i.e. the "shift" used for UDH fill bits
+                packed = gsmmodem.pdu.packSeptets(encoded, padBits=udhBits)
+                if len(encoded) == 0:
+                    continue
+                self.assertEqual(packed[0] & ((1 << (7 - udhBits)) - 1), 0, 'Fill bits not zero')
+                result = gsmmodem.pdu.unpackSeptets(iter(packed[1:]), len(encoded), packed[0], udhBits + 1)
+                self.assertEqual(result, encoded, 'Failed to unpack GSM-7 septets after {0} fill bits for string: "{1}". Expected: "{2}", got: "{3}"'.format(7 - udhBits, plaintext, [b for b in encoded], [b for b in result]))
+
     def test_encodeInvalid(self):
         """ Test encoding a string that cannot be encoded with GSM-7 """
-        tests = ('世界您好！',)
+        tests = ('世界您好！', 'tab\tcharacter')
         for invalidStr in tests:
             self.assertRaises(ValueError, gsmmodem.pdu.encodeGsm7, invalidStr, discardInvalid=False)
+            self.assertRaises(ValueError, gsmmodem.pdu.divideTextGsm7, invalidStr)
+
+    def test_nationalLanguageTables(self):
+        """ Tests encoding and decoding with national language locking shift and single shift tables """
+        turkish, spanish, portuguese = gsmmodem.pdu.NATIONAL_LANGUAGE_TURKISH, gsmmodem.pdu.NATIONAL_LANGUAGE_SPANISH, gsmmodem.pdu.NATIONAL_LANGUAGE_PORTUGUESE
+        for table in gsmmodem.pdu.GSM7_NATIONAL_LOCKING_SHIFT.values():
+            self.assertEqual(len(table), 128)
+        tests = (('Ağaç İş', turkish, 0, bytearray([0x41, 0x0C, 0x61, 0x60, 0x20, 0x40, 0x1D])),
+                 ('Ağaç İş', 0, turkish, bytearray([0x41, 0x1B, 0x67, 0x61, 0x1B, 0x63, 0x20, 0x1B, 0x49, 0x1B, 0x73])),
+                 ('Sí, ¿qué?', 0, spanish, bytearray([0x53, 0x1B, 0x69, 0x2C, 0x20, 0x60, 0x71, 0x75, 0x05, 0x3F])),
+                 ('Não {é}', portuguese, portuguese, bytearray([0x4E, 0x7B, 0x6F, 0x20, 0x1B, 0x28, 0x05, 0x1B, 0x29])))
+        for plaintext, lockingShift, singleShift, encoded in tests:
+            self.assertEqual(gsmmodem.pdu.encodeGsm7(plaintext, lockingShift=lockingShift, singleShift=singleShift), encoded)
+            self.assertEqual(gsmmodem.pdu.decodeGsm7(encoded, lockingShift, singleShift), plaintext)
+        self.assertRaises(ValueError, gsmmodem.pdu.encodeGsm7, 'Ağaç', lockingShift=portuguese)
+        self.assertEqual(gsmmodem.pdu.encodeGsm7('Ağaç', discardInvalid=True, lockingShift=portuguese), bytearray([0x41, 0x61, 0x09]))
+        # The default tables are used for unknown (e.g. unsupported) languages
+        self.assertEqual(gsmmodem.pdu.decodeGsm7(bytearray([0x04, 0x1B, 0x65]), 0x0A, 0x0A), 'è€')
 
     def test_encodeInvalidDiscard(self):
         """ Tests encoding a string containing invalid GSM-7 characters when set to discard them """
-        tests = (('a世界b您c好！', bytearray([97, 98, 99])),)
+        tests = (('a世界b您c好！', bytearray([97, 98, 99])),
+                 ('a\t{b}', bytearray([97, 0x1B, 0x28, 98, 0x1B, 0x29])))
         for invalidStr, encoded in tests:
             result = gsmmodem.pdu.encodeGsm7(invalidStr, discardInvalid=True)
             self.assertEqual(result, encoded, 'Failed to GSM-7 encode invalid plaintext string: "{0}". Expected: "{1}", got: "{2}"'.format(invalidStr, [b for b in encoded], [b for b in result]))
@@ -131,6 +161,24 @@ class TestUcs2(unittest.TestCase):
         for plaintext, encoded in self.tests:
             result = gsmmodem.pdu.decodeUcs2(iter(encoded), len(encoded))
             self.assertEqual(result, plaintext, 'Failed to decode UCS-2 string: "{0}". Expected: "{1}", got: "{2}"'.format([b for b in encoded], plaintext, result))
+            self.assertEqual(gsmmodem.pdu.decodeUcs2(encoded + bytearray([0x00, 0x41]), len(encoded)), plaintext)
+
+    def test_decode_truncated(self):
+        """ Tests decoding when there are fewer bytes than specified """
+        self.assertEqual(gsmmodem.pdu.decodeUcs2(bytearray([0x30, 0x42, 0x53]), 6), 'あ')
+        self.assertEqual(gsmmodem.pdu.decodeUcs2(iter(bytearray([0x30, 0x42, 0x53, 0xF6])), 3), 'あ叶')
+
+    @unittest.skipIf(sys.version_info[0] < 3, 'Python 2 cannot decode lone surrogates')
+    def test_decode_surrogates(self):
+        """ Tests decoding characters outside the Basic Multilingual Plane (surrogate pairs) """
+        encoded = bytearray([0xD8, 0x3D, 0xDE, 0x00, 0x00, 0x21])
+        self.assertEqual(gsmmodem.pdu.decodeUcs2(encoded, len(encoded)), '\U0001F600!')
+        # A surrogate pair split across two messages
+        self.assertEqual(len(gsmmodem.pdu.decodeUcs2(encoded[:2], 2)), 1)
+
+    def test_encode_surrogates(self):
+        """ Tests encoding characters outside the Basic Multilingual Plane as surrogate pairs """
+        self.assertEqual(gsmmodem.pdu.encodeUcs2('\U0001F600!'), bytearray([0xD8, 0x3D, 0xDE, 0x00, 0x00, 0x21]))
             
 
 class TestSmsPduAddressFields(unittest.TestCase):
@@ -236,6 +284,23 @@ class TestTimestamp(unittest.TestCase):
         for timestamp, encoded in self.tests:
             result = gsmmodem.pdu._decodeTimestamp(encoded)
             self.assertEqual(result, timestamp, 'Failed to decode timestamp: {0}. Expected: "{1}", got: "{2}"'.format(encoded, timestamp, result))
+
+    def test_decode_timezones(self):
+        """ Tests decoding time zone offsets (including quarter hours), and that the tzinfo instances are shared """
+        tests = ((b'51117200000032', timedelta(hours=5, minutes=45)),
+                 (b'5111720000002A', timedelta(hours=-5, minutes=-30)),
+                 (b'51117200000040', timedelta(hours=1)))
+        for encoded, offset in tests:
+            result = gsmmodem.pdu._decodeTimestamp(encoded)
+            self.assertEqual(result.utcoffset(), offset)
+            self.assertIs(gsmmodem.pdu._decodeTimestamp(encoded).tzinfo, result.tzinfo)
+
+    def test_decode_invalid(self):
+        """ Tests decoding invalid timestamps """
+        for encoded in (b'51317200000000', # month 13
+                        b'51112300000000', # 32 November
+                        b'5111A200000000'): # non-decimal digit
+            self.assertRaises(ValueError, gsmmodem.pdu._decodeTimestamp, encoded)
             
     def test_encode_noTimezone(self):
         """ Tests encoding without timezone information """
@@ -345,6 +410,60 @@ class TestUdhPortAddress(unittest.TestCase):
             self.assertEqual(result.source, source, 'Invalid origin port number; expected {0}, got {1}'.format(source, result.source))
             self.assertEqual(result.destination, destination, 'Invalid destination port number; expected {0}, got {1}'.format(destination, result.destination))
 
+class TestUserDataHeader(unittest.TestCase):
+    """ Tests for the lazily decoded User Data Header """
+
+    def test_decode(self):
+        """ Tests that information elements are only created when they are accessed """
+        # Port addressing (16-bit), an unknown IE and concatenation (16-bit reference)
+        data = bytearray(codecs.decode(b'10050404D21466F00201020804018004020000', 'hex_codec'))
+        udh, offset = gsmmodem.pdu._decodeUdhAt(data, 0)
+        self.assertEqual(offset, 17)
+        self.assertEqual(len(udh), 3)
+        self.assertEqual(udh.ieis, [0x05, 0xF0, 0x08])
+        concat = udh.concatenation
+        self.assertIsInstance(concat, gsmmodem.pdu.Concatenation)
+        self.assertEqual((concat.reference, concat.parts, concat.number), (384, 4, 2))
+        self.assertIs(udh[2], concat)
+        self.assertEqual(udh._elements[:2], [None, None])
+        ports, other = udh[0:2]
+        self.assertIsInstance(ports, gsmmodem.pdu.PortAddress)
+        self.assertEqual((ports.destination, ports.source), (1234, 5222))
+        self.assertEqual((other.__class__, other.id, other.data), (gsmmodem.pdu.InformationElement, 0xF0, [0x01, 0x02]))
+        self.assertEqual([ie.id for ie in udh], [0x05, 0xF0, 0x08])
+        # No concatenation IE
+        udh = gsmmodem.pdu._decodeUdhAt(bytearray(codecs.decode(b'0404026432', 'hex_codec')), 0)[0]
+        self.assertEqual(udh.concatenation, None)
+        self.assertEqual(udh._elements, None)
+
+    def test_decode_invalid(self):
+        """ Tests decoding User Data Headers with truncated or invalid information elements """
+        for udhHex in (b'0500030102', # truncated
+                       b'0400020102', # 8-bit concatenation IE too short
+                       b'050803010203'): # 16-bit concatenation IE too short
+            data = bytearray(codecs.decode(udhHex, 'hex_codec'))
+            self.assertRaises(gsmmodem.exceptions.EncodingError, gsmmodem.pdu._decodeUdhAt, data, 0)
+
+    def test_languageShift(self):
+        """ Tests looking up the national language tables (single shift: IEI 0x24, locking shift: IEI 0x25) """
+        udh = gsmmodem.pdu._decodeUdhAt(bytearray(codecs.decode(b'0B0003010201250103240102', 'hex_codec')), 0)[0]
+        self.assertEqual(udh.languageShift, (3, 2))
+        self.assertEqual(udh._elements, None)
+        locking, single = udh[1:3]
+        self.assertIsInstance(locking, gsmmodem.pdu.NationalLanguageShift)
+        self.assertEqual((locking.id, locking.language, single.id, single.language), (0x25, 3, 0x24, 2))
+        self.assertEqual(gsmmodem.pdu._decodeUdhAt(bytearray(codecs.decode(b'050003010201', 'hex_codec')), 0)[0].languageShift, (0, 0))
+        ie = gsmmodem.pdu.NationalLanguageShift(0x25)
+        ie.language = 1
+        self.assertEqual(ie.encode(), bytearray([0x25, 0x01, 0x01]))
+        self.assertRaises(gsmmodem.exceptions.EncodingError, gsmmodem.pdu._decodeUdhAt, bytearray(codecs.decode(b'0424020101', 'hex_codec')), 0)
+
+    def test_slots(self):
+        """ Tests that information elements do not have an instance dictionary """
+        for ie in (gsmmodem.pdu.InformationElement(0xF0, 1, [1]), gsmmodem.pdu.Concatenation(0x00, 3, [1, 2, 3]), gsmmodem.pdu.PortAddress(0x04, 2, [1, 2]), gsmmodem.pdu.NationalLanguageShift(0x24, 1, [1])):
+            self.assertFalse(hasattr(ie, '__dict__'))
+
+
 class TestSmsPdu(unittest.TestCase):
     """ Tests encoding/decoding of SMS PDUs """
 
@@ -413,7 +532,7 @@ class TestSmsPdu(unittest.TestCase):
                   {'type': 'SMS-SUBMIT',
                    'number': '+27821234567',
                    'smsc': '+2781191',
-                   'text': 'Hello world!'}),
+                   'text': b'Hello world!'}),
                  (b'0019000B917228001011F100003170013193008017D474BB3CA787DB70903DCC4E93D3F43C885E9ED301', # absolute validity period
                   {'text': 'Timestamp validity test',
                    'validity': datetime(2013, 7, 10, 13, 39, tzinfo=SimpleOffsetTzInfo(2))}),
@@ -476,6 +595,50 @@ class TestSmsPdu(unittest.TestCase):
                 self.assertEqual(pdu.data, expectedPdu, 'Failed to encode concatentated SMS PDU (PDU {0}/{1}). Expected: "{2}", got: "{3}"'.format(i+1, len(result), expectedPduHex, codecs.encode(compat.str(pdu.data), 'hex_codec').upper()))
                 i += 1
     
+    def test_pduTemplate(self):
+        """ Tests that a PduTemplate produces the same PDUs as encodeSmsSubmitPdu for every recipient """
+        tests = (('Hello', {}),
+                 ('Hello world, this is a flash message', {'sendFlash': True, 'requestStatusReport': False}),
+                 ('Relative validity', {'validity': timedelta(hours=4), 'smsc': '+2782913593'}),
+                 ('Absolute validity', {'validity': datetime(2013, 4, 1, 11, 20, 33, tzinfo=SimpleOffsetTzInfo(2))}),
+                 ('ĄĘĆŹŻŁÓŚŃ ąęćźżłóśń' * 5, {'rejectDuplicates': True}),
+                 ('12345-010 12345-020 12345-030 12345-040 12345-050 12345-060 12345-070 12345-080 12345-090 12345-100 ' * 4, {}))
+        for text, kwargs in tests:
+            template = gsmmodem.pdu.PduTemplate(text, **kwargs)
+            for number, reference in (('+15125551234', 0), ('0821234567', 17), ('123', 255)):
+                expected = gsmmodem.pdu.encodeSmsSubmitPdu(number, text, reference=reference, **kwargs)
+                result = template.encode(number, reference)
+                self.assertEqual(len(result), len(template))
+                self.assertEqual([(pdu.data, pdu.tpduLength) for pdu in result], [(pdu.data, pdu.tpduLength) for pdu in expected])
+
+    def test_pduHexData(self):
+        """ Tests the (cached) hexadecimal form of encoded PDUs """
+        pdu = gsmmodem.pdu.encodeSmsSubmitPdu('+27820001111', 'Hello')[0]
+        self.assertEqual(pdu.hexData, b'0021000B917228001011F1000005C8329BFD06')
+        self.assertIs(pdu.hexData, pdu.hexData)
+        self.assertEqual(str(pdu), '0021000B917228001011F1000005C8329BFD06')
+
+    def test_encode_Gsm7_concatenatedParts(self):
+        """ Tests that GSM-7 text is divided into the same parts as by divideTextGsm7() (extended characters are not split) """
+        for text in ('a' * 152 + '{' + 'b' * 10, 'a' * 151 + '€€' + 'b' * 200, '[' * 200, 'a' * 153 + 'b' * 153 + 'c'):
+            parts = [gsmmodem.pdu.decodeSmsPdu(str(pdu))['text'] for pdu in gsmmodem.pdu.encodeSmsSubmitPdu('+27820001111', text)]
+            expected = gsmmodem.pdu.divideTextGsm7(text)
+            self.assertEqual(len(parts), len(expected))
+            self.assertEqual([len(gsmmodem.pdu.encodeGsm7(part)) for part in parts], [len(gsmmodem.pdu.encodeGsm7(part)) for part in expected])
+
+    def test_pduTemplate_concatReference(self):
+        """ Tests that the concatenation reference of a PduTemplate's parts is set per message """
+        template = gsmmodem.pdu.PduTemplate('a' * 200)
+        self.assertEqual(len(template), 2)
+        for reference in (1, 200):
+            for i, pdu in enumerate(template.encode('+15125551234', reference)):
+                decoded = gsmmodem.pdu.decodeSmsPdu(str(pdu))
+                concat = decoded['udh'][0]
+                self.assertIsInstance(concat, gsmmodem.pdu.Concatenation)
+                self.assertEqual(concat.reference, reference)
+                self.assertEqual(concat.number, i + 1)
+                self.assertEqual(concat.parts, 2)
+
     def test_encodeSmsSubmit_invalidValidityType(self):
         """ Tests SMS PDU encoding when specifying an invalid object type for validity """
         self.assertRaises(TypeError, gsmmodem.pdu.encodeSmsSubmitPdu, **{'number': '123', 'text': 'abc', 'validity': 'INVALID'})
@@ -493,6 +656,61 @@ class TestSmsPdu(unittest.TestCase):
         pdu = 'AEFDSDFSDFSDFS'
         self.assertRaises(gsmmodem.exceptions.EncodingError, gsmmodem.pdu.decodeSmsPdu, pdu)
 
+    def test_decode_truncated(self):
+        """ Tests SMS PDU decoding when the PDU data is truncated """
+        for pdu in ('06917228195339040B917228214365F7000031', # header
+                    '0591721891F1400781721881F800003160526104848059050003'): # User Data Header
+            self.assertRaises(gsmmodem.exceptions.EncodingError, gsmmodem.pdu.decodeSmsPdu, pdu)
+
+    def test_parse(self):
+        """ Tests that SmsPdu objects decode to the same values as decodeSmsPdu() """
+        pdus = ('06917228195339040B917228214365F700003130805120618005D4F29C2E03', # SMS-DELIVER
+                '07911326040000F0310D0B911326880736F40000A90FF7FBDD454E87CDE1B0DB357EB701', # SMS-SUBMIT, relative validity
+                '0019000B917228001011F100003170013193008017D474BB3CA787DB70903DCC4E93D3F43C885E9ED301', # SMS-SUBMIT, absolute validity
+                '0297F1061C0F910B487228297020F5317062419272803170624192138000', # SMS-STATUS-REPORT
+                '0591721891F1400781721881F800003160526104848059050003C30101916536FB1DCABEEB2074D85E064941B19CAB060319A5C522289C96D3D3ED32286C0FA7D96131BBEC024941B19CAB0603DDD36C36A88C87A7E565D0DB0D82C55EB0DB4B068BCD5C20', # UDH
+                '0041010C910661345542F60008A0050003000301306F3044', # UCS-2
+                '0591721891F101000B917228214365F700040C48656C6C6F20776F726C6421', # 8-bit
+                '07919762020033F1400DD0CDF2396C7EBB010008415072411084618C0500035602010053004D005300200063006F00640065003A00200034003800350036002C00200063006F006E006600690072006D006100740069006F006E0020006F00660020006100730073006F00630069006100740069006F006E0020006200650074007700650065006E0020006100630063006F0075006E007400200061006E00640020004D00650067') # alphanumeric sender
+        for pduHex in pdus:
+            expected = gsmmodem.pdu.decodeSmsPdu(pduHex)
+            for pdu in (pduHex, bytearray(codecs.decode(pduHex, 'hex_codec'))):
+                result = gsmmodem.pdu.parseSmsPdu(pdu)
+                self.assertIsInstance(result, gsmmodem.pdu.SmsPdu)
+                decoded = result.toDict()
+                self.assertEqual(list(decoded.keys()), list(expected.keys()))
+                for key, value in expected.items():
+                    if key == 'udh':
+                        self.assertEqual([(ie.id, ie.data) for ie in decoded[key]], [(ie.id, ie.data) for ie in value])
+                    else:
+                        self.assertEqual(decoded[key], value)
+        result = gsmmodem.pdu.parseSmsPdu(pdus[3])
+        self.assertEqual((result.type, result.reference, result.status), ('SMS-STATUS-REPORT', 28, 0))
+        self.assertEqual((result.text, result.udh, result.validity, result.protocolId), (None, None, None, None))
+
+    def test_parse_lazy(self):
+        """ Tests that SmsPdu fields are only decoded when they are accessed """
+        # SMS-DELIVER with a corrupt timestamp (month 13) and UDH (IE length too long)
+        pdu = gsmmodem.pdu.parseSmsPdu('06917228195339440B917228214365F7000031318051206180474005FF')
+        self.assertEqual(pdu.type, 'SMS-DELIVER')
+        self.assertEqual(pdu.number, '+27821234567')
+        self.assertEqual(pdu.smsc, '+2782913593')
+        self.assertEqual(pdu.tpduLength, 22)
+        self.assertRaises(ValueError, getattr, pdu, 'time')
+        self.assertRaises(gsmmodem.exceptions.EncodingError, getattr, pdu, 'udh')
+        # The User Data Header is decoded separately from the text
+        pdu = gsmmodem.pdu.parseSmsPdu('0591721891F1400781721881F800003160526104848059050003C30101916536FB1DCABEEB2074D85E064941B19CAB060319A5C522289C96D3D3ED32286C0FA7D96131BBEC024941B19CAB0603DDD36C36A88C87A7E565D0DB0D82C55EB0DB4B068BCD5C20')
+        self.assertEqual([(ie.reference, ie.parts, ie.number) for ie in pdu.udh], [(0xC3, 1, 1)])
+        self.assertEqual(pdu.text, 'Hello!You have R 19.50 FREE airtime available. R 19.50 will expire on 01/07/2013. ')
+
+    def test_parse_invalid(self):
+        """ Tests parsing invalid, truncated and unknown-type PDUs """
+        for pdu in ('AEFDSDFSDFSDFS', # not hex
+                    '0043010C910661345542F60008A0050003000301306F3044', # invalid PDU type
+                    '06917228195339040B917228214365F7000031', # truncated header
+                    '0006D60B911326880736F4111011719551401110117195'): # truncated status report
+            self.assertRaises(gsmmodem.exceptions.EncodingError, gsmmodem.pdu.parseSmsPdu, pdu)
+
     def test_encode_Gsm7_divideSMS(self):
         """ Tests whether text will be devided into a correct number of chunks while using GSM-7 alphabet"""
         text = "12345-010 12345-020 12345-030 12345-040 12345-050 12345-060"
@@ -521,5 +739,47 @@ class TestSmsPdu(unittest.TestCase):
         text = "12345-010,12345-020,12345-030,12345-040,12345-050,12345-060,123456 12345-010,12345-020,12345-030,12345-040,12345-050,12345-060,1234567"
         self.assertEqual(len(gsmmodem.pdu.divideTextUcs2(text)), 2)
 
+    def test_encode_nationalLanguages(self):
+        """ Tests using national language tables for text that would otherwise be sent (in more parts) as UCS-2 """
+        tests = (('Ağaç İş ışık ' * 20, (1, 0), 2, 4), # Turkish locking shift
+                 ('Şş' * 75, (1, 0), 1, 3), # 150 characters fit into a single message with a 4 octet UDH
+                 ('¿Qué tal? Sí, canción, ó á ú ' * 10, (0, 2), 3, 5), # Spanish single shift
+                 ('Não é fácil, coração ê â ô ' * 10, (3, 0), 2, 5), # Portuguese locking shift
+                 ('ıú' + 'a' * 149, (1, 2), 1, 3), # Turkish locking shift and Spanish single shift, 7 octet UDH (no fill bits)
+                 ('ıúaaaa' * 50, (1, 2), 3, 5)) # 12 octet UDH
+        for text, languageShift, numParts, numUcs2Parts in tests:
+            template = gsmmodem.pdu.PduTemplate(text)
+            self.assertEqual((template.alphabet, template.languageShift), (0x00, languageShift))
+            self.assertEqual(len(gsmmodem.pdu.PduTemplate(text, nationalLanguages=())), numUcs2Parts)
+            pdus = template.encode('+905321234567', reference=9)
+            self.assertEqual(len(pdus), numParts)
+            decoded = [gsmmodem.pdu.decodeSmsPdu(str(pdu)) for pdu in pdus]
+            self.assertEqual(''.join(result['text'] for result in decoded), text)
+            for result in decoded:
+                self.assertEqual(result['udh'].languageShift, languageShift)
+                if numParts > 1:
+                    self.assertEqual(result['udh'].concatenation.reference, 9)
+        # Text that does not need fewer parts with national language tables is still sent as UCS-2
+        self.assertEqual(gsmmodem.pdu.PduTemplate('Ağaç').alphabet, 0x08)
+        self.assertEqual(gsmmodem.pdu.PduTemplate('Ağaç İş ışık ' * 20, nationalLanguages=(gsmmodem.pdu.NATIONAL_LANGUAGE_SPANISH,)).alphabet, 0x08)
+        # A hand-encoded SMS-DELIVER PDU: "ğ" using the Turkish locking shift table, after a UDH and 3 fill bits
+        result = gsmmodem.pdu.decodeSmsPdu('06917228195339440B917228214365F700003130805120618006032501016000')
+        self.assertEqual(result['text'], 'ğ')
+
+    def test_encode_Ucs2_divideSMS_surrogates(self):
+        """ Tests that surrogate pairs (e.g. emoji) are not split across UCS-2 message parts """
+        text = 'a' * 66 + '\U0001F600' * 3
+        parts = gsmmodem.pdu.divideTextUcs2(text)
+        self.assertEqual(parts, ['a' * 66, '\U0001F600' * 3])
+        text = 'a' * 65 + '\U0001F600' * 3
+        self.assertEqual(gsmmodem.pdu.divideTextUcs2(text), ['a' * 65 + '\U0001F600', '\U0001F600' * 2])
+        # Each PDU must hold at most 67 UTF-16 code units, and contain complete characters
+        pdus = gsmmodem.pdu.encodeSmsSubmitPdu('+27820001111', text, reference=1)
+        self.assertEqual(len(pdus), 2)
+        self.assertEqual(''.join(gsmmodem.pdu.decodeSmsPdu(str(pdu))['text'] for pdu in pdus), text)
+        # Message length is counted in code units: 35 emoji fit into a single PDU, 35 emoji and a letter do not
+        self.assertEqual(len(gsmmodem.pdu.encodeSmsSubmitPdu('+27820001111', '\U0001F600' * 35)), 1)
+        self.assertEqual(len(gsmmodem.pdu.encodeSmsSubmitPdu('+27820001111', '\U0001F600' * 35 + 'a')), 2)
+
 if __name__ == "__main__":
     unittest.main()
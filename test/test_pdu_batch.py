@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test suite for gsmmodem.pdu_batch """
+
+from __future__ import unicode_literals
+
+import unittest, random, codecs
+from datetime import datetime, timedelta
+
+from . import compat # For Python 2.6, 3.0-2 compatibility
+
+import gsmmodem.pdu
+from gsmmodem.pdu_batch import decodeSmsPdus, encodeSmsSubmitPdus, NUMPY_AVAILABLE
+from gsmmodem.exceptions import EncodingError
+from gsmmodem.util import SimpleOffsetTzInfo
+
+# PDUs from test_pdu.TestSmsPdu.test_decode (SMS-DELIVER, SMS-SUBMIT and SMS-STATUS-REPORT; GSM-7, UCS-2 and 8-bit; with and without UDH),
+# UCS-2 SMS-DELIVER PDUs containing a surrogate pair and a lone surrogate, and a GSM-7 one using a national language table
+PDUS = ('06917228195339040B917228214365F700003130805120618005D4F29C2E03',
+        '07915892000000F0040B915892214365F700007040213252242331493A283D0795C3F33C88FE06C9CB6132885EC6D341EDF27C1E3E97E7207B3A0C0A5241E377BB1D7693E72E',
+        '06917228195339040B917228214365F70000313062315352800A800D8A5E98D337A910',
+        '07911326040000F0310D0B911326880736F40000A90FF7FBDD454E87CDE1B0DB357EB701',
+        '0006D60B911326880736F4111011719551401110117195714000',
+        '0591721891F1400781721881F800003160526104848059050003C30101916536FB1DCABEEB2074D85E064941B19CAB060319A5C522289C96D3D3ED32286C0FA7D96131BBEC024941B19CAB0603DDD36C36A88C87A7E565D0DB0D82C55EB0DB4B068BCD5C20',
+        '07914346466554F601000B914316565811F9000806304253F68449',
+        '0041010C910661345542F60008A0050003000301306F3044',
+        '0591721891F101000B917228214365F700040C48656C6C6F20776F726C6421',
+        '0019000B917228001011F100003170013193008017D474BB3CA787DB70903DCC4E93D3F43C885E9ED301',
+        '0297F1061C0F910B487228297020F5317062419272803170624192138000',
+        '07919762020033F1400DD0CDF2396C7EBB010008415072411084618C0500035602010053004D005300200063006F00640065003A00200034003800350036002C00200063006F006E006600690072006D006100740069006F006E0020006F00660020006100730073006F00630069006100740069006F006E0020006200650074007700650065006E0020006100630063006F0075006E007400200061006E00640020004D00650067',
+        '06917228195339040B917228214365F700083130805120618006D83DDE000021',
+        '06917228195339040B917228214365F700083130805120618004D83D0021',
+        '06917228195339440B917228214365F700003130805120618006032501016000')
+
+def createCorpus():
+    """ :return: Valid PDUs, plus (mostly) corrupted copies of them, as hex strings and bytearrays """
+    rand = random.Random(1234)
+    pdus = list(PDUS)
+    for text in ('Hello', 'Test message: {escaped} [characters] €', 'あ叶葉 ĄĘĆŹŻŁÓŚŃ', 'a' * 200, '世界您好！' * 30, 'Ağaç İş ışık {€} ' * 12, 'ıú' + 'a' * 149):
+        for number in ('+27820001111', '0126541234', 'Megafon'):
+            for validity in (None, timedelta(days=3), datetime(2013, 7, 10, 13, 39, tzinfo=SimpleOffsetTzInfo(-3))):
+                pdus.extend(str(pdu) for pdu in gsmmodem.pdu.encodeSmsSubmitPdu(number, text, 7, validity, '+2782913593'))
+    validPdus = list(pdus)
+    for i in range(2000):
+        data = bytearray(codecs.decode(rand.choice(validPdus), 'hex_codec'))
+        for j in range(rand.randint(1, 3)):
+            data[rand.randrange(len(data))] = rand.randrange(256)
+        if rand.random() < 0.3:
+            data = data[:rand.randrange(len(data) + 1)]
+        pdus.append(data)
+    return pdus
+
+def normalize(result):
+    """ :return: A comparable representation of a decoded PDU (or of the exception raised while decoding it) """
+    if isinstance(result, Exception):
+        return result.__class__
+    items = []
+    for key, value in result.items():
+        if key == 'udh':
+            value = [(ie.__class__, ie.id, ie.dataLength, ie.data) for ie in value]
+        elif isinstance(value, datetime):
+            value = (value.replace(tzinfo=None), value.utcoffset())
+        items.append((key, value))
+    return sorted(items)
+
+
+class TestDecodeSmsPdus(unittest.TestCase):
+    """ Tests decoding batches of SMS PDUs """
+
+    def setUp(self):
+        self.pdus = createCorpus()
+        self.expected = []
+        for pdu in self.pdus:
+            try:
+                self.expected.append(normalize(gsmmodem.pdu.decodeSmsPdu(pdu)))
+            except Exception as e:
+                self.expected.append(normalize(e))
+
+    def decodeEach(self, useNumpy):
+        """ Decodes every PDU in a batch of its own, so that errors can be compared """
+        result = []
+        for pdu in self.pdus:
+            try:
+                result.append(normalize(decodeSmsPdus([pdu], useNumpy=useNumpy)[0]))
+            except Exception as e:
+                result.append(normalize(e))
+        return result
+
+    def test_decode(self):
+        """ Tests that the scalar fallback gives the same results as decodeSmsPdu() """
+        self.assertEqual(self.decodeEach(False), self.expected)
+        validPdus = [pdu for pdu, expected in zip(self.pdus, self.expected) if isinstance(expected, list)]
+        self.assertEqual([normalize(result) for result in decodeSmsPdus(iter(validPdus), useNumpy=False)], [expected for expected in self.expected if isinstance(expected, list)])
+
+    @unittest.skipUnless(NUMPY_AVAILABLE, 'NumPy is not installed')
+    def test_decodeNumpy(self):
+        """ Tests that the vectorized decoder gives the same results as decodeSmsPdu() """
+        self.assertEqual(self.decodeEach(True), self.expected)
+        validPdus = [pdu for pdu, expected in zip(self.pdus, self.expected) if isinstance(expected, list)]
+        self.assertEqual([normalize(result) for result in decodeSmsPdus(validPdus, useNumpy=True)], [expected for expected in self.expected if isinstance(expected, list)])
+        self.assertEqual(decodeSmsPdus([], useNumpy=True), [])
+
+    def test_decodeInvalid(self):
+        """ Tests that the error for the first invalid PDU in a batch is raised """
+        pdus = [PDUS[0], 'AEFDSDFSDFSDFS', '0043010C910661345542F60008A0050003000301306F3044']
+        for useNumpy in ((False, True) if NUMPY_AVAILABLE else (False,)):
+            self.assertRaises(EncodingError, decodeSmsPdus, pdus, useNumpy=useNumpy)
+        if not NUMPY_AVAILABLE:
+            self.assertRaises(ImportError, decodeSmsPdus, pdus, useNumpy=True)
+
+
+class TestEncodeSmsSubmitPdus(unittest.TestCase):
+    """ Tests encoding batches of SMS-SUBMIT PDUs """
+
+    def test_encode(self):
+        """ Tests that the same PDUs are created as by encodeSmsSubmitPdu() """
+        numbers = ['+27820001111', '0126541234', '123', 'Megafon', '+1', '+123456789012345', '0821234567']
+        texts = ['Hello', 'あ叶葉', 'a' * 200, 'Hello', '{escaped}', 'Hello', 'a' * 200]
+        references = [0, 1, 17, 255, 3, 4, 5]
+        for useNumpy in ((False, True) if NUMPY_AVAILABLE else (False,)):
+            for kwargs in ({}, {'validity': timedelta(hours=4), 'smsc': '+2782913593', 'sendFlash': True}):
+                result = encodeSmsSubmitPdus(numbers, texts, references, useNumpy=useNumpy, **kwargs)
+                expected = [gsmmodem.pdu.encodeSmsSubmitPdu(number, text, reference, **kwargs) for number, text, reference in zip(numbers, texts, references)]
+                self.assertEqual([[(pdu.data, pdu.tpduLength) for pdu in pdus] for pdus in result], [[(pdu.data, pdu.tpduLength) for pdu in pdus] for pdus in expected])
+            # The same text and reference for all numbers
+            result = encodeSmsSubmitPdus(numbers, 'Campaign', 9, useNumpy=useNumpy)
+            self.assertEqual([str(pdus[0]) for pdus in result], [str(gsmmodem.pdu.encodeSmsSubmitPdu(number, 'Campaign', 9)[0]) for number in numbers])
+            self.assertRaises(ValueError, encodeSmsSubmitPdus, numbers, texts[:2], useNumpy=useNumpy)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+""" Test suite for gsmmodem.pool """
+
+from __future__ import print_function
+
+import sys, time, unittest, threading
+
+from . import compat # For Python 2.6 compatibility
+
+from gsmmodem.modem import SentSms
+from gsmmodem.pool import ModemPool
+from gsmmodem.pdu import PduTemplate
+from gsmmodem.exceptions import TimeoutException, CmsError, NoModemAvailableError
+
+class FakePoolModem(object):
+    """ Stand-in for a GsmModem that records the messages sent through it """
+
+    def __init__(self, port, delay=0, signalStrength=20, error=None):
+        self.port = port
+        self.delay = delay
+        self._signalStrength = signalStrength
+        self.error = error
+        self.sent = []
+        self._lock = threading.Lock() # A modem processes one command at a time
+
+    @property
+    def signalStrength(self):
+        return self._signalStrength
+
+    def sendSms(self, destination, text, **kwargs):
+        with self._lock:
+            time.sleep(self.delay)
+            if self.error != None:
+                raise self.error
+            self.sent.append(destination)
+            reference = len(self.sent)
+            return SentSms(destination, text, reference, references=[reference] * len(PduTemplate(text)))
+
+
+def notSubmitted(error):
+    """ Marks a modem error as having occurred before the message was submitted (as GsmModem.sendSms() does) """
+    error.smsSubmitted = False
+    return error
+
+
+class TestModemPool(unittest.TestCase):
+    """ Tests routing SMS messages across a pool of modems """
+
+    def test_leastLoaded(self):
+        """ Tests that concurrent messages are spread over the modems by queue depth """
+        modems = [FakePoolModem('/dev/ttyUSB{0}'.format(i), delay=0.05) for i in range(3)]
+        pool = ModemPool(modems)
+        threads = [threading.Thread(target=pool.sendSms, args=('+2782000000{0}'.format(i), 'Test')) for i in range(6)]
+        startTime = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([len(modem.sent) for modem in modems], [2, 2, 2])
+        # Messages should have been sent in parallel
+        self.assertLess(time.time() - startTime, 0.25)
+        for modem in modems:
+            load = pool.load(modem)
+            self.assertEqual(load['pending'], 0)
+            self.assertEqual(load['sent'], 2)
+            self.assertEqual(load['signalStrength'], 20)
+
+    def test_latencyAndSignal(self):
+        """ Tests that slow modems, and modems with a weak signal, are avoided """
+        fast = FakePoolModem('fast')
+        slow = FakePoolModem('slow', delay=0.05)
+        pool = ModemPool([slow, fast])
+        pool.sendSms('+27820000001', 'Test')
+        pool.sendSms('+27820000002', 'Test')
+        self.assertEqual(len(slow.sent), 1)
+        self.assertEqual(len(fast.sent), 1)
+        for i in range(5):
+            pool.sendSms('+27820000003', 'Test')
+        self.assertEqual(len(slow.sent), 1)
+        self.assertEqual(len(fast.sent), 6)
+        # Weak signal
+        weak = FakePoolModem('weak', signalStrength=1)
+        strong = FakePoolModem('strong', signalStrength=25)
+        pool = ModemPool([weak, strong])
+        pool.refreshSignalStrength()
+        for i in range(3):
+            pool.sendSms('+27820000001', 'Test')
+        self.assertEqual(len(weak.sent), 0)
+        self.assertEqual(len(strong.sent), 3)
+
+    def test_quota(self):
+        """ Tests per-SIM quotas """
+        modem1 = FakePoolModem('modem1')
+        modem2 = FakePoolModem('modem2')
+        pool = ModemPool(quotaPeriod=0.1)
+        pool.addModem(modem1, quota=1)
+        pool.addModem(modem2, quota=2)
+        for i in range(3):
+            pool.sendSms('+27820000001', 'Test')
+        self.assertEqual(len(modem1.sent), 1)
+        self.assertEqual(len(modem2.sent), 2)
+        self.assertRaises(NoModemAvailableError, pool.sendSms, '+27820000001', 'Test')
+        # Quotas are reset at the start of each period
+        time.sleep(0.15)
+        pool.sendSms('+27820000001', 'Test')
+        self.assertEqual(len(modem1.sent) + len(modem2.sent), 4)
+        pool.setQuota(modem1, None)
+        self.assertEqual(pool.load(modem1)['quota'], None)
+
+    def test_quotaConcurrent(self):
+        """ Tests that messages being sent count towards a SIM's quota """
+        modem = FakePoolModem('modem', delay=0.05)
+        pool = ModemPool()
+        pool.addModem(modem, quota=2)
+        errors = []
+        def send():
+            try:
+                pool.sendSms('+27820000001', 'Test')
+            except NoModemAvailableError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=send) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(modem.sent), 2)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(pool.load(modem)['sent'], 2)
+        self.assertEqual(pool.load(modem)['pending'], 0)
+
+    def test_quotaMultipart(self):
+        """ Tests that the parts of concatenated messages being sent count towards a SIM's quota """
+        modem = FakePoolModem('modem', delay=0.05)
+        pool = ModemPool()
+        pool.addModem(modem, quota=5)
+        text = 'Test ' * 40 # 2 message parts
+        errors = []
+        def send():
+            try:
+                pool.sendSms('+27820000001', text)
+            except NoModemAvailableError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=send) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(modem.sent), 2)
+        self.assertEqual(len(errors), 1)
+        load = pool.load(modem)
+        self.assertEqual(load['sent'], 4)
+        self.assertEqual(load['pending'], 0)
+        self.assertEqual(load['pendingParts'], 0)
+        # A message with more parts than the remaining quota is not sent
+        self.assertRaises(NoModemAvailableError, pool.sendSms, '+27820000001', text)
+        pool.sendSms('+27820000001', 'Test')
+        self.assertEqual(pool.load(modem)['sent'], 5)
+
+    def test_failover(self):
+        """ Tests failing over to another modem when a modem times out or returns an error """
+        broken = FakePoolModem('broken', error=notSubmitted(TimeoutException()))
+        working = FakePoolModem('working', delay=0.01)
+        pool = ModemPool([broken, working], failureBackoff=0.1)
+        sms = pool.sendSms('+27820000001', 'Test')
+        self.assertEqual(working.sent, ['+27820000001'])
+        self.assertEqual(sms.number, '+27820000001')
+        self.assertFalse(pool.load(broken)['available'])
+        self.assertGreater(pool.load(broken)['errorRate'], 0)
+        # The timed out modem is avoided while backed off
+        broken.error = None
+        pool.sendSms('+27820000002', 'Test')
+        self.assertEqual(len(broken.sent), 0)
+        time.sleep(0.15)
+        self.assertTrue(pool.load(broken)['available'])
+        # CMS errors also cause failover
+        working.error = notSubmitted(CmsError('AT+CMGS', 500))
+        pool.sendSms('+27820000003', 'Test')
+        self.assertEqual(broken.sent, ['+27820000003'])
+        # No modem left
+        broken.error = notSubmitted(TimeoutException())
+        try:
+            pool.sendSms('+27820000004', 'Test')
+        except NoModemAvailableError as e:
+            self.assertIsInstance(e.cause, (TimeoutException, CmsError))
+        else:
+            self.fail('NoModemAvailableError not raised')
+        # Non-modem errors are not failed over
+        invalid = FakePoolModem('invalid', error=ValueError())
+        pool = ModemPool([invalid, FakePoolModem('unused')])
+        self.assertRaises(ValueError, pool.sendSms, '+27820000005', 'Test')
+        self.assertTrue(pool.load(invalid)['available'])
+        self.assertRaises(NoModemAvailableError, ModemPool().sendSms, '+27820000001', 'Test')
+
+    def test_noFailoverAfterSubmit(self):
+        """ Tests that a message that may have been submitted is not sent again through another modem """
+        for error in (TimeoutException(), CmsError('AT+CMGS', 500)):
+            error.smsSubmitted = True
+            broken = FakePoolModem('broken', error=error)
+            other = FakePoolModem('other', delay=0.01)
+            pool = ModemPool([broken, other], failureBackoff=0.1)
+            self.assertRaises(type(error), pool.sendSms, '+27820000001', 'Test')
+            self.assertEqual(other.sent, [])
+            self.assertGreater(pool.load(broken)['errorRate'], 0)
+            self.assertEqual(pool.load(broken)['pending'], 0)
+        # Errors not raised by GsmModem.sendSms() itself are assumed to have happened after submitting
+        broken = FakePoolModem('broken', error=TimeoutException())
+        other = FakePoolModem('other', delay=0.01)
+        pool = ModemPool([broken, other])
+        self.assertRaises(TimeoutException, pool.sendSms, '+27820000001', 'Test')
+        self.assertEqual(other.sent, [])
+        # Delivery report timeouts would cause the message to be sent again
+        self.assertRaises(ValueError, pool.sendSms, '+27820000001', 'Test', waitForDeliveryReport=True)
+        self.assertEqual(broken.sent + other.sent, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
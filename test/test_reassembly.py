@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+""" Test suite for gsmmodem.reassembly """
+
+from __future__ import print_function
+
+import sys, time, unittest
+from datetime import datetime
+
+from . import compat # For Python 2.6 compatibility
+
+import gsmmodem.modem, gsmmodem.pdu
+from gsmmodem.modem import ReceivedSms, ConcatenatedSms, Sms
+from gsmmodem.pdu import Concatenation
+from gsmmodem.reassembly import SmsReassembler, concatenationInfo
+from gsmmodem.util import SimpleOffsetTzInfo
+
+class FakeModem(object):
+    """ Placeholder for the modem referenced by received messages """
+
+def createPart(number, text, reference, parts, partNumber):
+    concat = Concatenation()
+    concat.reference, concat.parts, concat.number = reference, parts, partNumber
+    time = datetime(2013, 3, 8, 15, 2, partNumber, tzinfo=SimpleOffsetTzInfo(2))
+    return ReceivedSms(FakeModem(), Sms.STATUS_RECEIVED_UNREAD, number, time, text, None, [concat])
+
+
+class TestSmsReassembler(unittest.TestCase):
+    """ Tests reassembling concatenated SMS messages """
+
+    def test_reassemble(self):
+        """ Tests combining parts received out of order, interleaved with other messages """
+        delivered = []
+        reassembler = SmsReassembler(delivered.append)
+        single = ReceivedSms(FakeModem(), Sms.STATUS_RECEIVED_UNREAD, '+27820000001', None, 'Single')
+        reassembler.add(createPart('+27820000001', 'World', 1, 2, 2))
+        reassembler.add(createPart('+27820000002', 'Other sender ', 1, 2, 1))
+        reassembler.add(single)
+        self.assertEqual(delivered, [single])
+        self.assertEqual(len(reassembler), 2)
+        reassembler.add(createPart('+27820000001', 'Hello ', 1, 2, 1))
+        self.assertEqual(len(delivered), 2)
+        sms = delivered[1]
+        self.assertIsInstance(sms, ConcatenatedSms)
+        self.assertTrue(sms.complete)
+        self.assertEqual(sms.text, 'Hello World')
+        self.assertEqual(sms.number, '+27820000001')
+        self.assertEqual(sms.time, datetime(2013, 3, 8, 15, 2, 1, tzinfo=SimpleOffsetTzInfo(2)))
+        self.assertEqual([part.text for part in sms.parts], ['Hello ', 'World'])
+        self.assertEqual(len(reassembler), 1)
+        reassembler.close()
+
+    def test_duplicates(self):
+        """ Tests discarding duplicate parts, before and after their message is complete """
+        delivered = []
+        reassembler = SmsReassembler(delivered.append)
+        reassembler.add(createPart('+27820000001', 'Hello ', 5, 2, 1))
+        reassembler.add(createPart('+27820000001', 'Hello ', 5, 2, 1))
+        reassembler.add(createPart('+27820000001', 'World', 5, 2, 2))
+        reassembler.add(createPart('+27820000001', 'World', 5, 2, 2))
+        self.assertEqual([sms.text for sms in delivered], ['Hello World'])
+        self.assertEqual(reassembler.duplicates, 2)
+        self.assertEqual(len(reassembler), 0)
+        reassembler.close()
+
+    def test_reusedReference(self):
+        """ Tests that a new message reusing the reference of a recently completed message is not discarded """
+        delivered = []
+        reassembler = SmsReassembler(delivered.append, duplicateWindow=0.1)
+        reassembler.add(createPart('+27820000001', 'Hello ', 5, 2, 1))
+        reassembler.add(createPart('+27820000001', 'World', 5, 2, 2))
+        reassembler.add(createPart('+27820000001', 'Goodbye ', 5, 2, 1))
+        reassembler.add(createPart('+27820000001', 'World', 5, 2, 2))
+        self.assertEqual([sms.text for sms in delivered], ['Hello World', 'Goodbye World'])
+        self.assertEqual(reassembler.duplicates, 0)
+        # Retransmissions are only recognised within the duplicate window
+        time.sleep(0.15)
+        reassembler.add(createPart('+27820000001', 'Goodbye ', 5, 2, 1))
+        self.assertEqual(reassembler.duplicates, 0)
+        self.assertEqual(len(reassembler), 1)
+        reassembler.close()
+
+    def test_callbackError(self):
+        """ Tests that exceptions raised by the callback are passed on to the caller """
+        delivered = []
+        def callback(sms):
+            delivered.append(sms)
+            raise ValueError('callback failed')
+        reassembler = SmsReassembler(callback)
+        reassembler.add(createPart('+27820000001', 'Hello ', 5, 2, 1))
+        self.assertRaises(ValueError, reassembler.add, createPart('+27820000001', 'World', 5, 2, 2))
+        self.assertEqual([sms.text for sms in delivered], ['Hello World'])
+        reassembler.add(createPart('+27820000001', 'Part 1', 6, 2, 1))
+        self.assertRaises(ValueError, reassembler.flush)
+        self.assertEqual(len(delivered), 2)
+        reassembler.close()
+
+    def test_handles(self):
+        """ Tests that stored parts are only released once their message has been delivered """
+        delivered = []
+        def callback(sms):
+            if not delivered:
+                delivered.append(None)
+                raise ValueError('callback failed')
+            delivered.append(sms)
+        released = []
+        reassembler = SmsReassembler(callback, timeout=0.1, releaseCallback=released.extend)
+        hello, world = createPart('+27820000001', 'Hello ', 5, 2, 1), createPart('+27820000001', 'World', 5, 2, 2)
+        self.assertEqual(reassembler.add(hello, 1), [])
+        self.assertTrue(reassembler.holds(1))
+        # Reading the same stored part again does not release it
+        self.assertEqual(reassembler.add(hello, 1), [])
+        self.assertTrue(reassembler.holds(1))
+        # The message is not remembered as completed if the callback fails, so it can be added again
+        self.assertRaises(ValueError, reassembler.add, world, 2)
+        self.assertFalse(reassembler.holds(1))
+        self.assertEqual(reassembler.add(hello, 1), [])
+        self.assertEqual(reassembler.add(world, 2), [(hello, 1), (world, 2)])
+        self.assertEqual([sms.text for sms in delivered[1:]], ['Hello World'])
+        # Retransmitted parts (stored elsewhere) are released immediately
+        self.assertEqual(reassembler.add(hello, 3), [(hello, 3)])
+        # Non-concatenated messages
+        single = ReceivedSms(FakeModem(), Sms.STATUS_RECEIVED_UNREAD, '+27820000001', None, 'Single')
+        self.assertEqual(reassembler.add(single, 4), [(single, 4)])
+        # Parts of expired messages are passed to releaseCallback
+        part = createPart('+27820000001', 'Part 1', 6, 2, 1)
+        self.assertEqual(reassembler.add(part, 5), [])
+        time.sleep(0.3)
+        self.assertEqual(released, [(part, 5)])
+        self.assertFalse(reassembler.holds(5))
+        reassembler.close()
+
+    def test_binaryParts(self):
+        """ Tests combining the bytes payloads of 8-bit data messages """
+        delivered = []
+        reassembler = SmsReassembler(delivered.append)
+        reassembler.add(createPart('+27820000001', b'\x00\x01', 7, 2, 1))
+        reassembler.add(createPart('+27820000001', b'\xff', 7, 2, 2))
+        self.assertEqual(delivered[0].text, b'\x00\x01\xff')
+        reassembler.close()
+
+    def test_timeout(self):
+        """ Tests delivering incomplete messages when their remaining parts do not arrive in time """
+        delivered = []
+        reassembler = SmsReassembler(delivered.append, timeout=0.1)
+        reassembler.add(createPart('+27820000001', 'Part 1 ', 7, 3, 1))
+        reassembler.add(createPart('+27820000001', 'Part 3', 7, 3, 3))
+        time.sleep(0.3)
+        self.assertEqual(len(delivered), 1)
+        sms = delivered[0]
+        self.assertFalse(sms.complete)
+        self.assertEqual(sms.text, 'Part 1 Part 3')
+        self.assertEqual(sms.parts[1], None)
+        self.assertEqual(len(reassembler), 0)
+        # flush()
+        reassembler.add(createPart('+27820000001', 'Part 1', 8, 2, 1))
+        reassembler.flush()
+        self.assertEqual(len(delivered), 2)
+        reassembler.close()
+
+    def test_memoryLimit(self):
+        """ Tests evicting the oldest incomplete messages when too many parts are buffered """
+        delivered = []
+        reassembler = SmsReassembler(delivered.append, maxParts=3)
+        for reference in range(3):
+            reassembler.add(createPart('+27820000001', 'Message {0}'.format(reference), reference, 2, 1))
+        self.assertEqual(delivered, [])
+        reassembler.add(createPart('+27820000001', 'Message 3', 3, 2, 1))
+        self.assertEqual([sms.text for sms in delivered], ['Message 0'])
+        self.assertEqual(len(reassembler), 3)
+        reassembler.close()
+
+    def test_modemIntegration(self):
+        """ Tests the optional reassembly stage of GsmModem """
+        delivered = []
+        modem = gsmmodem.modem.GsmModem('-- PORT IGNORED DURING TESTS --', smsReceivedCallbackFunc=delivered.append, reassembleSms=True)
+        modem._dispatchReceivedSms(createPart('+27820000001', 'Hello ', 1, 2, 1))
+        self.assertEqual(delivered, [])
+        modem._dispatchReceivedSms(createPart('+27820000001', 'World', 1, 2, 2))
+        self.assertEqual([sms.text for sms in delivered], ['Hello World'])
+        self.assertEqual(concatenationInfo(delivered[0]), None)
+        modem.smsReassembler.close()
+        # Disabled by default
+        modem = gsmmodem.modem.GsmModem('-- PORT IGNORED DURING TESTS --', smsReceivedCallbackFunc=delivered.append)
+        self.assertEqual(modem.smsReassembler, None)
+
+    def test_decodedPdus(self):
+        """ Tests reassembling messages decoded from PDUs (with lazily decoded User Data Headers) """
+        delivered = []
+        reassembler = SmsReassembler(delivered.append)
+        for pdu in reversed(gsmmodem.pdu.encodeSmsSubmitPdu('+27820000001', 'a' * 150 + 'b' * 50, reference=7)):
+            smsDict = gsmmodem.pdu.decodeSmsPdu(str(pdu))
+            sms = ReceivedSms(FakeModem(), Sms.STATUS_RECEIVED_UNREAD, smsDict['number'], None, smsDict['text'], None, smsDict['udh'])
+            concat = concatenationInfo(sms)
+            self.assertEqual((concat.reference, concat.parts), (7, 2))
+            reassembler.add(sms)
+        self.assertEqual([sms.text for sms in delivered], ['a' * 150 + 'b' * 50])
+        reassembler.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
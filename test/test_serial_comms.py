@@ -10,7 +10,7 @@ from copy import copy
 from . import compat # For Python 2.6 compatibility
 
 import gsmmodem.serial_comms
-from gsmmodem.exceptions import TimeoutException
+from gsmmodem.exceptions import TimeoutException, InvalidStateException
 
 class MockSerialPackage(object):
     """ Fake serial package for the GsmModem/SerialComms classes to import during tests """
@@ -193,6 +193,15 @@ class TestWrite(unittest.TestCase):
             # Now write without expecting a response
             response = self.serialComms.write('test2\r', waitForResponse=False)
             self.assertEqual(response, None) 
+
+    def test_writeBytes(self):
+        """ Tests that pre-encoded data is written as it is """
+        written = []
+        self.serialComms.serial.writeCallbackFunc = written.append
+        self.serialComms.serial.responseSequence = ['OK\r\n']
+        self.serialComms.serial.flushResponseSequence = True
+        self.assertEqual(self.serialComms.write(b'0011000B91\x1a'), ['OK'])
+        self.assertEqual(written, [b'0011000B91\x1a'])
     
     def test_writeTimeout(self):
         """ Tests that the serial comms write timeout parameter """
@@ -220,6 +229,41 @@ class TestWrite(unittest.TestCase):
         else:
             self.fail('TimeoutException not thrown')
 
+    def test_writeIter(self):
+        """ Tests streaming the response to a written command, line by line """
+        responseSequence = ['first line\r\n', 0.3, 'second line\r\n', 'OK\r\n']
+        def writeCallbackFunc(data):
+            self.serialComms.serial.responseSequence = copy(responseSequence)
+        self.serialComms.serial.writeCallbackFunc = writeCallbackFunc
+        self.serialComms.serial.flushResponseSequence = True
+        startTime = time.time()
+        response = self.serialComms.writeIter('test\r')
+        self.assertEqual(next(response), 'first line')
+        self.assertLess(time.time() - startTime, 0.25, 'First response line not yielded before the response was complete')
+        self.assertEqual(list(response), ['second line', 'OK'])
+        # Stop iterating early: the rest of the response must not be mistaken for the next command's response
+        response = self.serialComms.writeIter('test\r')
+        self.assertEqual(next(response), 'first line')
+        response.close()
+        self.assertEqual(self.serialComms.write('test\r'), ['first line', 'second line', 'OK'])
+        # Timeout
+        responseSequence = []
+        self.assertRaises(TimeoutException, list, self.serialComms.writeIter('test\r', timeout=0.1))
+
+    def test_writeIter_reentrant(self):
+        """ Tests that writing from within a writeIter() loop is refused instead of corrupting both responses """
+        def writeCallbackFunc(data):
+            self.serialComms.serial.responseSequence = ['first line\r\n', 'second line\r\n', 'OK\r\n']
+        self.serialComms.serial.writeCallbackFunc = writeCallbackFunc
+        self.serialComms.serial.flushResponseSequence = True
+        response = self.serialComms.writeIter('test\r')
+        self.assertEqual(next(response), 'first line')
+        self.assertRaises(InvalidStateException, self.serialComms.write, 'test2\r')
+        self.assertRaises(InvalidStateException, next, self.serialComms.writeIter('test2\r'))
+        self.assertEqual(list(response), ['second line', 'OK'])
+        # Writing is possible again once the iteration is complete
+        self.assertEqual(self.serialComms.write('test\r'), ['first line', 'second line', 'OK'])
+
 
 if __name__ == "__main__":
     logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+""" Test suite for gsmmodem.tracking """
+
+from __future__ import print_function
+
+import sys, time, unittest, os, shutil, tempfile, threading
+from datetime import datetime
+
+from . import compat # For Python 2.6 compatibility
+
+from gsmmodem.modem import SentSms, StatusReport
+from gsmmodem.tracking import SentSmsIndex, ShelveSentSmsStore, asCompleted
+from gsmmodem.exceptions import TimeoutException
+from gsmmodem.util import SimpleOffsetTzInfo
+
+class FakeModem(object):
+    """ Placeholder for the modem referenced by status reports """
+
+def createReport(reference, number, timeSent=None, deliveryStatus=StatusReport.DELIVERED):
+    timeSent = timeSent or datetime.now(SimpleOffsetTzInfo(0))
+    return StatusReport(FakeModem(), 0, reference, number, timeSent, timeSent, deliveryStatus)
+
+
+class TestSentSmsIndex(unittest.TestCase):
+    """ Tests the sent SMS correlation index """
+
+    def test_lookup(self):
+        """ Tests matching status reports by modem, reference and destination number """
+        index = SentSmsIndex()
+        sms1 = SentSms('+27820000001', 'One', 10)
+        sms2 = SentSms('+27820000002', 'Two', 10)
+        sms3 = SentSms('+27820000001', 'Three', 10)
+        index.add(sms1, 'modem1')
+        index.add(sms2, 'modem1')
+        index.add(sms3, 'modem2')
+        self.assertIs(index.lookup(10, '+27820000001', modemId='modem1'), sms1)
+        self.assertIs(index.lookup(10, '0820000002', modemId='modem1'), sms2) # national number format
+        self.assertIs(index.lookup(10, '+27820000001', modemId='modem2'), sms3)
+        self.assertIs(index.lookup(10, None, modemId='modem1'), sms2) # newest message
+        self.assertEqual(index.lookup(10, '+27820000003', modemId='modem1'), None)
+        self.assertEqual(index.lookup(11, '+27820000001', modemId='modem1'), None)
+        # Backwards-compatible access by reference
+        self.assertTrue(10 in index)
+        self.assertFalse(11 in index)
+        self.assertIs(index[10], sms3)
+        self.assertRaises(KeyError, index.__getitem__, 11)
+        self.assertEqual(len(index), 3)
+
+    def test_lookup_referenceWrapped(self):
+        """ Tests choosing between messages to the same destination with the same (wrapped around) reference """
+        index = SentSmsIndex(timeWindow=600)
+        now = time.time()
+        old = SentSms('+27820000001', 'Old', 5)
+        new = SentSms('+27820000001', 'New', 5)
+        index.add(old, timeSubmitted=now - 3600)
+        index.add(new, timeSubmitted=now)
+        reportTime = datetime.fromtimestamp(now - 3590, SimpleOffsetTzInfo(0))
+        self.assertIs(index.lookup(5, '+27820000001', reportTime), old)
+        reportTime = datetime.fromtimestamp(now + 10, SimpleOffsetTzInfo(0))
+        self.assertIs(index.lookup(5, '+27820000001', reportTime), new)
+        # Messages still waiting for reports are preferred
+        new._addReport(createReport(5, '+27820000001'))
+        self.assertIs(index.lookup(5, '+27820000001', reportTime), old)
+        # Naive report times are assumed to be in UTC (as in gsmmodem.inbox)
+        index = SentSmsIndex(timeWindow=600)
+        old = SentSms('+27820000001', 'Old', 5)
+        new = SentSms('+27820000001', 'New', 5)
+        index.add(old, timeSubmitted=now - 3600)
+        index.add(new, timeSubmitted=now)
+        self.assertIs(index.lookup(5, '+27820000001', datetime.utcfromtimestamp(now - 3590)), old)
+        self.assertIs(index.lookup(5, '+27820000001', datetime.utcfromtimestamp(now + 10)), new)
+
+    def test_multipart(self):
+        """ Tests that all part references map to the same message, which is finalized once all parts are reported """
+        index = SentSmsIndex()
+        sms = SentSms('+27820000001', 'Long message', 20, references=[20, 21, 22])
+        index.add(sms)
+        for reference in (20, 21, 22):
+            self.assertIs(index.lookup(reference, '+27820000001'), sms)
+        sms._addReport(createReport(20, '+27820000001'))
+        sms._addReport(createReport(22, '+27820000001'))
+        self.assertEqual(sms.status, SentSms.ENROUTE)
+        lastReport = createReport(21, '+27820000001')
+        sms._addReport(lastReport)
+        self.assertEqual(sms.status, SentSms.DELIVERED)
+        self.assertIs(sms.report, lastReport)
+        # A failed part causes the whole message to fail
+        sms = SentSms('+27820000001', 'Long message', 30, references=[30, 31])
+        failedReport = createReport(30, '+27820000001', deliveryStatus=StatusReport.FAILED)
+        sms._addReport(failedReport)
+        sms._addReport(createReport(31, '+27820000001'))
+        self.assertEqual(sms.status, SentSms.FAILED)
+        self.assertIs(sms.report, failedReport)
+
+    def test_eviction(self):
+        """ Tests size- and age-based eviction """
+        index = SentSmsIndex(maxSize=3)
+        messages = [SentSms('+2782000000{0}'.format(i), 'Test', i) for i in range(5)]
+        for sms in messages:
+            index.add(sms)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(list(index), messages[2:])
+        self.assertEqual(index.lookup(0), None)
+        self.assertIs(index.lookup(4), messages[4])
+        index.remove(messages[4])
+        self.assertEqual(index.lookup(4), None)
+        self.assertEqual(len(index), 2)
+        index.clear()
+        self.assertEqual(len(index), 0)
+        # Age-based eviction
+        index = SentSmsIndex(maxAge=0.1)
+        index.add(SentSms('+27820000001', 'Old', 1))
+        time.sleep(0.15)
+        index.add(SentSms('+27820000002', 'New', 2))
+        self.assertEqual(index.lookup(1), None)
+        self.assertEqual(len(index), 1)
+
+    def test_persistence(self):
+        """ Tests restoring messages that are still en route from a persistent store """
+        tempDir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempDir, 'sentsms')
+            index = SentSmsIndex(store=ShelveSentSmsStore(filename))
+            pending = SentSms('+27820000001', 'Pending', 1, references=[1, 2])
+            delivered = SentSms('+27820000002', 'Delivered', 3)
+            index.add(pending, 'modem1')
+            index.add(delivered, 'modem1')
+            delivered._addReport(createReport(3, '+27820000002'))
+            index.update(delivered)
+            index.store.close()
+
+            index = SentSmsIndex(store=ShelveSentSmsStore(filename))
+            self.assertEqual(len(index), 1)
+            restored = index.lookup(2, '+27820000001', modemId='modem1')
+            self.assertIsInstance(restored, SentSms)
+            self.assertEqual(restored.text, 'Pending')
+            self.assertEqual(restored.references, [1, 2])
+            self.assertEqual(restored.reference, pending.reference)
+            self.assertEqual(index.lookup(3, '+27820000002', modemId='modem1'), None)
+            # New messages should not overwrite restored ones
+            index.add(SentSms('+27820000003', 'New', 4), 'modem1')
+            self.assertEqual(len(index.store.load()), 2)
+            index.store.close()
+        finally:
+            shutil.rmtree(tempDir)
+
+
+class TestDeliveryWaits(unittest.TestCase):
+    """ Tests waiting for the status reports of sent SMS messages """
+
+    def test_wait(self):
+        """ Tests waiting for a single message's status report """
+        sms = SentSms('+27820000001', 'Test', 1)
+        self.assertFalse(sms.done)
+        self.assertFalse(sms.wait(0.01))
+        threading.Timer(0.05, sms._addReport, [createReport(1, '+27820000001')]).start()
+        self.assertTrue(sms.wait(5))
+        self.assertTrue(sms.done)
+        self.assertEqual(sms.status, SentSms.DELIVERED)
+
+    def test_doneCallback(self):
+        """ Tests done callbacks, including callbacks added after the report was received """
+        sms = SentSms('+27820000001', 'Test', 1, references=[1, 2])
+        called = []
+        sms.addDoneCallback(called.append)
+        sms._addReport(createReport(1, '+27820000001'))
+        self.assertEqual(called, [])
+        sms._addReport(createReport(2, '+27820000001'))
+        self.assertEqual(called, [sms])
+        sms.addDoneCallback(called.append)
+        self.assertEqual(called, [sms, sms])
+
+    def test_asCompleted(self):
+        """ Tests waiting for many messages at once; messages are yielded in the order their reports arrive """
+        messages = [SentSms('+2782000000{0}'.format(i), 'Test', i) for i in range(3)]
+        def deliver():
+            for sms in reversed(messages):
+                time.sleep(0.02)
+                sms._addReport(createReport(sms.reference, sms.number))
+        threading.Thread(target=deliver).start()
+        self.assertEqual(list(asCompleted(messages, timeout=5)), list(reversed(messages)))
+        # Timeout
+        messages = [SentSms('+27820000001', 'Test', 1), SentSms('+27820000002', 'Test', 2)]
+        messages[1]._addReport(createReport(2, '+27820000002'))
+        completed = asCompleted(messages, timeout=0.05)
+        self.assertIs(next(completed), messages[1])
+        self.assertRaises(TimeoutException, next, completed)
+
+
+if __name__ == "__main__":
+    unittest.main()
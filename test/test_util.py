@@ -5,11 +5,12 @@
 from __future__ import print_function
 
 import sys, time, unittest, logging, re
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from . import compat # For Python 2.6 compatibility
 
-from gsmmodem.util import allLinesMatchingPattern, lineMatching, lineStartingWith, lineMatchingPattern, SimpleOffsetTzInfo
+from gsmmodem.util import allLinesMatchingPattern, lineMatching, lineStartingWith, lineMatchingPattern, SimpleOffsetTzInfo, \
+    fixedOffsetTimezone, parseTextModeTimeStr
 
 class TestUtil(unittest.TestCase):
     """ Tests misc utilities from gsmmodem.util """
@@ -74,6 +75,26 @@ class TestUtil(unittest.TestCase):
             self.assertEqual(tz.dst(None), timedelta(0))
             self.assertIsInstance(tz.__repr__(), str)
 
+    def test_fixedOffsetTimezone(self):
+        """ Tests that fixed-offset tzinfo instances are shared """
+        for minutes in (0, 120, -240, 345):
+            tz = fixedOffsetTimezone(minutes)
+            self.assertEqual(tz.utcoffset(None), timedelta(minutes=minutes))
+            self.assertIs(fixedOffsetTimezone(minutes), tz)
+
+    def test_parseTextModeTimeStr(self):
+        """ Tests parsing SMS text mode time strings """
+        tests = (('13/03/08,15:02:16+08', datetime(2013, 3, 8, 15, 2, 16), timedelta(hours=2)),
+                 ('99/12/31,23:59:59-20', datetime(1999, 12, 31, 23, 59, 59), timedelta(hours=-5)),
+                 ('14/01/02,03:04:05+22', datetime(2014, 1, 2, 3, 4, 5), timedelta(hours=5, minutes=30)), # quarter-hour offset
+                 ('14/01/02,03:04:05-03', datetime(2014, 1, 2, 3, 4, 5), timedelta(minutes=-45)),
+                 ('14/1/2,3:04:05+00', datetime(2014, 1, 2, 3, 4, 5), timedelta(0))) # single-digit fields
+        for timeStr, expected, offset in tests:
+            result = parseTextModeTimeStr(timeStr)
+            self.assertEqual(result.replace(tzinfo=None), expected)
+            self.assertEqual(result.utcoffset(), offset)
+        self.assertRaises(ValueError, parseTextModeTimeStr, '13/13/08,15:02:16+08')
+
 
 if __name__ == "__main__":
     logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)